@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+from db import list_alerts, list_alerts_after, get_alerts
+from agents.prompt_builder import build_chat_context, CHAT_CONTEXT_MAX_TOKENS
+
+ALERT_INDEX_PATH = os.getenv("ALERT_INDEX_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs", "alert_index.jsonl"))
+ALERT_INDEX_SYNC_INTERVAL = float(os.getenv("ALERT_INDEX_SYNC_INTERVAL", 30.0))  # seconds between catch-up reads of new alert rows
+ALERT_INDEX_PAGE_SIZE = int(os.getenv("ALERT_INDEX_PAGE_SIZE", 500))  # alert rows per catch-up read
+ALERT_INDEX_COLUMNS = "id,event,risk_report,action_plan"
+CHAT_RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", 8))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and are as at be by for from has have in is it its of on or the to was were what which with why how".split())
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+def alert_text(alert):
+    """Searchable text of an alert: its event plus the reports and plans stored with it."""
+    parts = [str(v) for v in (alert.get("event") or {}).values() if v]
+    for report in alert.get("risk_report") or []:
+        if isinstance(report, dict):
+            parts += [str(report.get(k, "")) for k in ("product_id", "impact_level", "summary")]
+    for plan in alert.get("action_plan") or []:
+        if isinstance(plan, dict):
+            parts += [str(plan.get(k, "")) for k in ("product_id", "priority", "responsible_party", "summary")]
+            parts += [str(a) for a in plan.get("recommended_actions") or []]
+    return " ".join(parts)
+
+class AlertIndex:
+    """
+    BM25 index over alerts, kept in memory and persisted as an append-only JSONL file
+    of per-alert term counts. Full alert rows stay in the database; search returns ids.
+
+    start() loads the file and catches up with the alerts table on a background
+    thread, so requests only ever search what is already in memory.
+    """
+    def __init__(self, path=ALERT_INDEX_PATH, sync_interval=ALERT_INDEX_SYNC_INTERVAL, page_size=ALERT_INDEX_PAGE_SIZE):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        self.max_id = 0
+        self._lock = threading.RLock()
+        self._docs = {}  # alert id -> document length
+        self._postings = defaultdict(dict)  # term -> {alert id: term frequency}
+        self._total_len = 0
+        self._lines = 0  # entries in the file, including superseded ones
+        self._loaded = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._insert(entry["id"], entry["tf"])
+                    except (ValueError, KeyError):
+                        if line.strip():
+                            logging.warning(f"Skipping malformed alert index line: {line[:200]!r}")
+            logging.info(f"Alert index loaded: {len(self)} alerts from {self.path}")
+            self.compact()
+
+    def _insert(self, alert_id, tf):
+        if alert_id in self._docs:
+            self._remove(alert_id)
+        self._docs[alert_id] = sum(tf.values())
+        self._total_len += self._docs[alert_id]
+        for term, count in tf.items():
+            self._postings[term][alert_id] = count
+        if isinstance(alert_id, int):
+            self.max_id = max(self.max_id, alert_id)
+
+    def _remove(self, alert_id):
+        self._total_len -= self._docs.pop(alert_id)
+        for term in list(self._postings):
+            if self._postings[term].pop(alert_id, None) is not None and not self._postings[term]:
+                del self._postings[term]
+
+    def add(self, alerts, persist=True):
+        """Index alert rows (as returned by insert_alert) and append them to the on-disk index."""
+        self.load()
+        lines = []
+        with self._lock:
+            for alert in alerts or []:
+                if alert.get("id") is None:
+                    continue
+                tf = dict(Counter(tokenize(alert_text(alert))))
+                self._insert(alert["id"], tf)
+                lines.append(json.dumps({"id": alert["id"], "tf": tf}))
+            if persist and lines and self.path:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                self._lines += len(lines)
+        return len(lines)
+
+    def compact(self):
+        """Rewrite the file with one line per indexed alert once re-indexed alerts have left duplicates."""
+        with self._lock:
+            if not self.path or self._lines <= len(self._docs):
+                return False
+            tfs = defaultdict(dict)
+            for term, postings in self._postings.items():
+                for alert_id, count in postings.items():
+                    tfs[alert_id][term] = count
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for alert_id in self._docs:
+                    f.write(json.dumps({"id": alert_id, "tf": tfs[alert_id]}) + "\n")
+            os.replace(tmp_path, self.path)
+            logging.info(f"Alert index compacted from {self._lines} to {len(self._docs)} entries")
+            self._lines = len(self._docs)
+            return True
+
+    def sync(self):
+        """Index alerts written since the last sync (e.g. by another process), a page at a time."""
+        self.load()
+        added = 0
+        while True:
+            page = list_alerts_after(self.max_id, columns=ALERT_INDEX_COLUMNS, limit=self.page_size)
+            added += self.add(page)
+            if len(page) < self.page_size:
+                break
+        if added:
+            logging.info(f"Alert index caught up with {added} new alerts")
+        self.compact()
+        return added
+
+    def start(self):
+        """Load and catch up on a daemon thread, then keep syncing every sync_interval seconds."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="alert-index", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logging.warning(f"Alert index sync failed: {e}")
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def search(self, query, k=CHAT_RETRIEVAL_TOP_K):
+        """Top-k (alert id, score) by BM25 over the alerts indexed so far; ties go to the newer alert."""
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+            avg_len = self._total_len / n or 1.0
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for alert_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[alert_id] / avg_len)
+                    scores[alert_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (item[1], str(item[0])), reverse=True)
+        return ranked[:k]
+
+alert_index = AlertIndex()
+
+def index_alert(rows):
+    """Add freshly inserted alert rows to the retrieval index; never fails the caller."""
+    try:
+        alert_index.add(rows)
+    except Exception as e:
+        logging.warning(f"Failed to index alerts: {e}")
+    return rows
+
+def retrieve_chat_context(query, max_tokens=CHAT_CONTEXT_MAX_TOKENS, k=CHAT_RETRIEVAL_TOP_K):
+    """Prompt context built from the alerts most relevant to query, falling back to the latest ones."""
+    try:
+        hits = alert_index.search(query, k)
+    except Exception as e:
+        logging.warning(f"Alert retrieval failed, using latest alerts: {e}")
+        hits = []
+    if not hits:
+        return build_chat_context(list_alerts(limit=k), max_tokens)
+    rows = {a["id"]: a for a in get_alerts([alert_id for alert_id, _ in hits])}
+    alerts = [rows[alert_id] for alert_id, _ in hits if alert_id in rows]
+    return build_chat_context(alerts, max_tokens, heading="Supply chain alerts most relevant to the question")
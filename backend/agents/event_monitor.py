@@ -2,18 +2,13 @@ import datetime
 from utils.data_loader import get_api_keys
 import httpx
 import logging
-import tweepy
 import time
 import random
 import os
 import json
-from supabase import create_client
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 API_KEYS = get_api_keys()
 REQUIRED_KEYS = ["NEWSAPI_KEY", "WEATHERSTACK_KEY", "TWITTER_API_KEY", "TWITTER_API_SECRET"]
@@ -30,8 +25,6 @@ DISRUPTION_KEYWORDS = [
     "strike", "port closure", "disaster", "protest", "shutdown", "instability", "earthquake", "flood", "hurricane"
 ]
 
-logging.basicConfig(level=logging.INFO)
-
 async def fetch_news_events(location="India"):
     api_key = API_KEYS.get("NEWSAPI_KEY")
     if not api_key:
@@ -110,6 +103,7 @@ def fetch_twitter_events(query="port OR strike OR closure OR disaster", location
         logging.warning("Missing TWITTER_API_KEY or TWITTER_API_SECRET.")
         return []
     try:
+        import tweepy
         auth = tweepy.AppAuthHandler(api_key, api_secret)
         api = tweepy.API(auth)
         tweets = api.search_tweets(q=query, lang="en", count=count, tweet_mode="extended")
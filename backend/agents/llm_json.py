@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import logging
+from collections import Counter
+
+# How many times items missing from (or invalid in) an LLM response are re-requested
+LLM_JSON_RETRIES = int(os.getenv("LLM_JSON_RETRIES", 1))
+
+_decoder = json.JSONDecoder()
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+def _span_end(text, start):
+    """Index just past the bracket matching text[start], honouring strings; None if unterminated."""
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
+
+def _decode_at(text, start):
+    """Decode the JSON value starting at text[start]; retry its span without trailing commas."""
+    try:
+        return _decoder.raw_decode(text, start)
+    except ValueError:
+        end = _span_end(text, start)
+        if end is None:
+            raise
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text[start:end])), end
+
+def extract_items(text):
+    """
+    Pull a list of JSON objects out of LLM output that may be fenced, surrounded by prose,
+    truncated or carry trailing commas.
+
+    An array of objects that decodes as a whole wins. Otherwise each top-level object in
+    the text is decoded on its own, so the valid ones survive a broken or truncated array.
+    Returns (items, skipped) where skipped counts objects that could not be decoded.
+    """
+    text = text or ""
+    first_object = text.find("{")
+    # Positions are scanned in place with raw_decode; nothing is sliced unless repair is needed
+    for m in re.finditer(r"\[", text):
+        if 0 <= first_object < m.start():
+            break  # brackets after the first object belong to it, not to an outer array
+        try:
+            value, _ = _decode_at(text, m.start())
+        except ValueError:
+            break  # fall through to per-object salvage
+        items = [v for v in value if isinstance(v, dict)]
+        if items:
+            return items, len(value) - len(items)
+    items, skipped, pos = [], 0, 0
+    while True:
+        start = text.find("{", pos)
+        if start < 0:
+            return items, skipped
+        try:
+            value, pos = _decode_at(text, start)
+            items.append(value)
+        except ValueError:
+            skipped += 1
+            end = _span_end(text, start)
+            if end is None:
+                return items, skipped  # truncated tail
+            pos = end
+
+def validate_items(items, schema):
+    """Split items into (valid, invalid); valid items keep their extra keys and get coerced fields."""
+    valid, invalid = [], []
+    for item in items:
+        try:
+            model = schema(**item)
+        except Exception as e:
+            invalid.append((item, str(e)))
+            continue
+        dump = getattr(model, "model_dump", None) or model.dict  # pydantic v2, else v1
+        item = {**item, **dump(exclude_unset=True)}
+        item["product_id"] = str(item["product_id"])
+        valid.append(item)
+    return valid, invalid
+
+def parse_llm_items(text, schema):
+    items, skipped = extract_items(text)
+    valid, invalid = validate_items(items, schema)
+    if skipped or invalid:
+        logging.warning(f"LLM output: kept {len(valid)} {schema.__name__} items, "
+                        f"dropped {len(invalid)} invalid and {skipped} undecodable")
+    return valid
+
+def request_items(run, inputs, schema, key, retries=LLM_JSON_RETRIES, echo=None):
+    """
+    Call run(inputs) -> iterable of raw LLM outputs, keep the items that validate against
+    schema, and re-run only for inputs no valid item answers (see match_to_inputs for key
+    and echo), up to `retries` more times. Returns (items, unanswered_inputs).
+    """
+    results, pending = [], list(inputs)
+    for attempt in range(retries + 1):
+        got = [item for raw in run(pending) for item in parse_llm_items(raw, schema)]
+        results.extend(got)
+        answered = set(_match(got, pending, key, echo))
+        missing = [entry for i, entry in enumerate(pending) if i not in answered]
+        if not missing:
+            return results, []
+        if attempt < retries:
+            logging.info(f"Re-requesting {len(missing)} of {len(pending)} items missing from LLM output")
+        pending = missing
+    return results, pending
+
+def _match(items, inputs, key, echo):
+    """Index into inputs of the input each item answers, or None."""
+    matched, used = [None] * len(items), set()
+    if echo:
+        field, value = echo
+        exact = {}
+        for i, entry in enumerate(inputs):
+            exact.setdefault((str(key(entry)), str(value(entry))), []).append(i)
+        for n, item in enumerate(items):
+            queue = exact.get((str(item.get("product_id")), str(item.get(field))))
+            if queue:
+                matched[n] = queue.pop(0)
+                used.add(matched[n])
+    queues = {}
+    for i, entry in enumerate(inputs):
+        if i not in used:
+            queues.setdefault(str(key(entry)), []).append(i)
+    for n, item in enumerate(items):
+        if matched[n] is None:
+            queue = queues.get(str(item.get("product_id")))
+            matched[n] = queue.pop(0) if queue else None
+    return matched
+
+def match_to_inputs(items, inputs, key, echo=None):
+    """
+    Pair each item with the input it answers. With echo=(field, value), an item whose
+    field equals value(input) (e.g. a disruption_key the prompt asked the model to copy)
+    is matched to that input first; other items take the first unmatched input whose
+    key(input) equals their product_id. Yields (item, input or None).
+    """
+    for item, i in zip(items, _match(items, inputs, key, echo)):
+        yield item, (inputs[i] if i is not None else None)
@@ -0,0 +1,103 @@
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+# Comma-separated models callers may pick with ?model=; only GROQ_MODEL when unset. Clients and
+# chains are cached per model, so this list is also what bounds those caches.
+LLM_MODELS = [m.strip() for m in os.getenv("LLM_MODELS", "").split(",") if m.strip()] or [GROQ_MODEL]
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_WARM_ON_STARTUP = os.getenv("LLM_WARM_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+_lock = threading.RLock()
+_templates = {}  # prompt name -> (template, input_variables)
+_prompts = {}
+_llms = {}
+_chains = {}
+_http_clients = None
+
+def register_prompt(name, template, input_variables):
+    """Register a prompt template by name; it is compiled on first use and then reused."""
+    with _lock:
+        _templates[name] = (template, list(input_variables))
+        _prompts.pop(name, None)
+        for key in [k for k in _chains if k[0] == name]:
+            del _chains[key]
+
+def resolve_model(model_name=None):
+    model_name = model_name or GROQ_MODEL
+    if model_name not in LLM_MODELS:
+        raise ValueError(f"Model {model_name!r} is not enabled for this deployment (LLM_MODELS).")
+    return model_name
+
+def _get_http_clients():
+    # One keep-alive pool per process shared by every model, so TLS sessions to the provider are reused
+    global _http_clients
+    if _http_clients is None:
+        import httpx
+        limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+        _http_clients = (httpx.Client(limits=limits, timeout=LLM_TIMEOUT),
+                         httpx.AsyncClient(limits=limits, timeout=LLM_TIMEOUT))
+    return _http_clients
+
+def get_prompt(name):
+    with _lock:
+        if name not in _prompts:
+            from langchain.prompts import PromptTemplate
+            template, input_variables = _templates[name]
+            _prompts[name] = PromptTemplate(input_variables=input_variables, template=template)
+        return _prompts[name]
+
+def _make_llm(model_name):
+    from langchain_groq import ChatGroq
+    http_client, http_async_client = _get_http_clients()
+    return ChatGroq(
+        groq_api_key=GROQ_API_KEY,
+        model_name=model_name,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+def get_llm(model_name=None):
+    """Process-wide ChatGroq client for a model, created once and reused across requests."""
+    model_name = resolve_model(model_name)
+    with _lock:
+        if model_name not in _llms:
+            _llms[model_name] = _make_llm(model_name)
+            logging.info(f"LLM client created for model {model_name}")
+        return _llms[model_name]
+
+def get_chain(prompt_name, model_name=None):
+    """Compiled LLMChain for (prompt, model), built on first use."""
+    model_name = resolve_model(model_name)
+    key = (prompt_name, model_name)
+    with _lock:
+        if key not in _chains:
+            from langchain.chains import LLMChain
+            _chains[key] = LLMChain(llm=get_llm(model_name), prompt=get_prompt(prompt_name))
+        return _chains[key]
+
+def warm_llm_registry(models=None):
+    """Pre-build clients and chains for the configured models so the first request pays no setup cost."""
+    for model_name in models or LLM_MODELS:
+        try:
+            for prompt_name in list(_templates):
+                get_chain(prompt_name, model_name)
+        except Exception as e:
+            logging.warning(f"LLM registry warm-up failed for {model_name}: {e}")
+
+async def astream(prompt_name, model_name=None, **inputs):
+    """Yield completion text for a registered prompt as the model produces it."""
+    prompt = get_prompt(prompt_name).format(**inputs)
+    async for chunk in get_llm(model_name).astream(prompt):
+        text = getattr(chunk, "content", chunk)
+        if text:
+            yield text
@@ -0,0 +1,83 @@
+import asyncio
+from db import insert_alert
+from jobs import job_handler
+from tracing import EventLogger
+from agents.risk_analyzer import analyze_risk, disruption_key
+from agents.response_planner import generate_action_plan
+from agents.alert_index import index_alert
+from agents.risk_state import track_disruptions
+from agents.event_monitor import fetch_air_events, fetch_sea_events, fetch_road_events
+
+log_agent = EventLogger("supplywhiz.agents")
+
+def build_event_alerts(events, risk_report, action_plan):
+    """
+    One alert per event carrying only the risk reports and action plans attributed to it
+    (by disruption_key), instead of the whole batch on every alert.
+    """
+    reports_by_key, plans_by_key, keys_by_product = {}, {}, {}
+    for report in risk_report or []:
+        key = report.get("disruption_key")
+        reports_by_key.setdefault(key, []).append(report)
+        keys_by_product.setdefault(str(report.get("product_id")), []).append(key)
+    for plan in action_plan or []:
+        if not isinstance(plan, dict):
+            continue
+        # Plans the model returned without a key follow their product's reports
+        keys = [plan["disruption_key"]] if plan.get("disruption_key") else keys_by_product.get(str(plan.get("product_id")), [])
+        for key in dict.fromkeys(keys):
+            plans_by_key.setdefault(key, []).append(plan)
+    alerts = []
+    for event in events:
+        key = disruption_key(event)
+        alerts.append({"event": event, "risk_report": reports_by_key.get(key, []), "action_plan": plans_by_key.get(key, [])})
+    return alerts
+
+async def fetch_live_events():
+    air_events, sea_events, road_events = await asyncio.gather(fetch_air_events(), fetch_sea_events(), fetch_road_events())
+    return (air_events or []) + (sea_events or []) + (road_events or [])
+
+def process_disruptions(disruptions):
+    """
+    Analyse disruptions, plan responses and store one alert per disruption.
+    Returns (risk_report, action_plan, alerts). A RuntimeError from risk analysis
+    (LLM required but unavailable) propagates; a failed action plan becomes [].
+    """
+    risk_report = analyze_risk(disruptions)
+    log_agent.debug("risk_report_generated", risk_report=risk_report)
+    track_disruptions(disruptions, risk_report)
+    try:
+        action_plan = generate_action_plan(risk_report)
+        log_agent.debug("action_plan_generated", action_plan=action_plan)
+    except Exception as e:
+        log_agent.error("action_plan_generation_failed", error=str(e))
+        action_plan = []
+    alerts = []
+    for alert in build_event_alerts(disruptions, risk_report, action_plan):
+        index_alert(insert_alert(alert))
+        alerts.append(alert)
+    return risk_report, action_plan, alerts
+
+# --- Worker job handlers (PROCESS_MODE=api queues these; worker.py runs them) ---
+@job_handler("simulate_disruptions")
+def simulate_disruptions_job(payload):
+    _, _, alerts = process_disruptions(payload["disruptions"])
+    return {"alerts": alerts}
+
+@job_handler("batch_simulate_disruptions")
+def batch_simulate_disruptions_job(payload):
+    risk_report, action_plan, _ = process_disruptions(payload["disruptions"])
+    return {"risk_report": risk_report, "action_plan": action_plan}
+
+@job_handler("process_all_disruptions")
+def process_all_disruptions_job(payload):
+    try:
+        live_events = asyncio.run(fetch_live_events())
+    except Exception as e:
+        log_agent.error("real_agent_fetch_failed", error=str(e))
+        live_events = []
+    disruptions = live_events + payload.get("disruptions", [])
+    if not disruptions:
+        return {"alerts": []}
+    _, _, alerts = process_disruptions(disruptions)
+    return {"alerts": alerts}
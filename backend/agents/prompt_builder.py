@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+import logging
+import functools
+
+# Token budgets are estimates: tiktoken when installed, otherwise ~4 characters per token
+RISK_PROMPT_MAX_TOKENS = int(os.getenv("RISK_PROMPT_MAX_TOKENS", 6000))
+CHAT_CONTEXT_MAX_TOKENS = int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", 3000))
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+
+# Only the fields the prompts actually reason about; anything else in a row is dropped
+SHIPMENT_FIELDS = ("product_id", "name", "product_name", "criticality_score", "status", "current_location",
+                   "route", "legs", "eta", "mode", "quantity", "value")
+LEG_FIELDS = ("origin", "destination", "current_location", "mode", "status")
+VENDOR_FIELDS = ("vendor_id", "name", "vendor_name", "location", "country", "reliability_score", "lead_time_days")
+DISRUPTION_FIELDS = ("event_type", "location", "severity", "mode", "timestamp")
+RISK_REPORT_FIELDS = ("product_id", "risk_score", "impact_level", "delay_estimate", "cost_impact", "summary")
+ACTION_PLAN_FIELDS = ("product_id", "priority", "recommended_actions", "responsible_party")
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(PROMPT_TOKENIZER)
+    except Exception as e:
+        logging.info(f"tiktoken unavailable ({e}); estimating prompt tokens from character counts")
+        return None
+
+def estimate_tokens(text):
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def compact_json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def project(record, fields):
+    """Subset of record restricted to fields, skipping empty values."""
+    if not isinstance(record, dict):
+        return {}
+    return {f: record[f] for f in fields if record.get(f) not in (None, "", [], {})}
+
+def project_shipment(shipment):
+    out = project(shipment, SHIPMENT_FIELDS)
+    if isinstance(out.get("legs"), list):
+        out["legs"] = [project(leg, LEG_FIELDS) for leg in out["legs"]]
+    return out
+
+class _RiskChunk:
+    """Pairs encoded against shared lookup tables, with a running token estimate."""
+    def __init__(self):
+        self.tables = {"shipments": {}, "vendors": {}, "disruptions": {}}
+        self.pairs = []
+        self.tokens = estimate_tokens(compact_json({**self.tables, "pairs": []}))
+        self._keys = {}
+        self._added = []
+        self._last_cost = 0
+
+    def _ref(self, table, record, key_field, prefix, key=None):
+        # Identical rows share one key, so a shipment hit by five disruptions is sent once
+        encoded = compact_json(record)
+        if (table, encoded) in self._keys:
+            return self._keys[(table, encoded)], 0
+        rows = self.tables[table]
+        key = key if key is not None else record.get(key_field) if key_field else None
+        key = str(key) if key is not None else None
+        if key is None or key in rows:
+            # Fallback keys come from the row's own digest plus its index, and skip any key already
+            # taken, so a generated key never lands on a natural one like product_id "s1"
+            base = f"{prefix}{hashlib.sha1((key or encoded).encode()).hexdigest()[:6]}"
+            index = len(rows)
+            while f"{base}{index}" in rows:
+                index += 1
+            key = f"{base}{index}"
+        rows[key] = record
+        self._keys[(table, encoded)] = key
+        self._added.append((table, encoded, key))
+        return key, estimate_tokens(encoded) + estimate_tokens(key) + 2
+
+    def add(self, pair):
+        self._added, cost = [], 0
+        s, c = self._ref("shipments", project_shipment(pair.get("shipment")), "product_id", "s")
+        cost += c
+        # Disruptions are keyed by the pair's disruption_key when given, so the model can echo it back
+        d, c = self._ref("disruptions", project(pair.get("disruption"), DISRUPTION_FIELDS), None, "d",
+                         key=pair.get("disruption_key"))
+        cost += c
+        entry = {"shipment": s, "disruption": d}
+        vendor = project(pair.get("vendor"), VENDOR_FIELDS)
+        if vendor:
+            entry["vendor"], c = self._ref("vendors", vendor, "vendor_id", "v")
+            cost += c
+        self.pairs.append(entry)
+        self._last_cost = cost + estimate_tokens(compact_json(entry)) + 1
+        self.tokens += self._last_cost
+
+    def undo(self):
+        """Remove the pair added last, along with any rows only it introduced."""
+        self.pairs.pop()
+        for table, encoded, key in self._added:
+            del self.tables[table][key]
+            del self._keys[(table, encoded)]
+        self.tokens -= self._last_cost
+        self._added = []
+
+    def encode(self):
+        return compact_json({**self.tables, "pairs": self.pairs})
+
+def build_risk_inputs(llm_input, max_tokens=RISK_PROMPT_MAX_TOKENS):
+    """
+    Encode shipment/vendor/disruption pairs for the risk prompt.
+
+    Rows are projected to the fields the prompt uses and stored once in lookup tables
+    that pairs reference by key. Pairs are split into as many chunks as needed to keep
+    each encoded input within max_tokens; a single oversized pair still gets its own chunk.
+    """
+    chunks, current = [], _RiskChunk()
+    for pair in llm_input:
+        current.add(pair)
+        if current.tokens > max_tokens and len(current.pairs) > 1:
+            current.undo()
+            chunks.append(current.encode())
+            current = _RiskChunk()
+            current.add(pair)
+    if current.pairs:
+        chunks.append(current.encode())
+    return chunks
+
+def compact_alert(alert):
+    out = {"event": project(alert.get("event"), DISRUPTION_FIELDS)}
+    if alert.get("created_at"):
+        out["created_at"] = alert["created_at"]
+    reports = [project(r, RISK_REPORT_FIELDS) for r in alert.get("risk_report") or [] if isinstance(r, dict)]
+    plans = [project(p, ACTION_PLAN_FIELDS) for p in alert.get("action_plan") or [] if isinstance(p, dict)]
+    if reports:
+        out["risk_report"] = reports
+    if plans:
+        out["action_plan"] = plans
+    return out
+
+def build_chat_context(alerts, max_tokens=CHAT_CONTEXT_MAX_TOKENS, heading="Recent supply chain alerts"):
+    """Compact alerts, one JSON object per line, in the given order until the token budget is used."""
+    lines, used = [], 0
+    for alert in alerts:
+        line = compact_json(compact_alert(alert))
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    return f"{heading} (one JSON object per line):\n" + "\n".join(lines)
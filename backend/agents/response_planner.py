@@ -1,20 +1,17 @@
 import os
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from dotenv import load_dotenv
 import logging
-import functools
-import datetime
 import json
+from tracing import EventLogger, traced
+from agents.llm_registry import get_chain, register_prompt
+from agents.llm_json import match_to_inputs, request_items
+from models import ActionPlanItem
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-llm_prompt = PromptTemplate(
-    input_variables=["risk_report"],
-    template="""
+ACTION_PLAN_TEMPLATE = """
 You are an expert AI assistant in supply chain risk mitigation. You will evaluate the following list of supply chain risk items. Each item includes:
 - product_id: Unique identifier of the product
 - risk_score: Integer from 0 to 100 indicating severity
@@ -23,12 +20,14 @@ You are an expert AI assistant in supply chain risk mitigation. You will evaluat
 - cost_impact: Estimated cost impact in USD
 - escalation: Boolean or escalation detail
 - summary: Short description of the issue
+- disruption_key: Identifier of the disruption event the item belongs to (may be absent)
 
 {risk_report}
 
 Your task is to return a JSON array where each object represents a structured action plan per risk item, using the following fields:
 
 - "product_id": Copy directly from input.
+- "disruption_key": Copy directly from input when present.
 - "recommended_actions": A list of **clear, practical mitigation steps**. If rerouting is proposed, specify exact ports, cities, or logistic paths (e.g., "Reroute via Chennai Port instead of Bangalore Port").
 - "responsible_party": Assign to the most appropriate actor (e.g., "logistics team", "vendor", "regional supply manager").
 - "priority": Determine as "High", "Medium", or "Low" based on both `risk_score` and `impact_level`.
@@ -44,78 +43,50 @@ Your task is to return a JSON array where each object represents a structured ac
 
 Return only the JSON array.
 """
-)
+
+register_prompt("action_plan", ACTION_PLAN_TEMPLATE, ["risk_report"])
 
 
 if not GROQ_API_KEY:
     logging.warning("GROQ_API_KEY not set. LLM-based action planning will use fallback.")
 
-def detailed_log(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        logging.info(f"[ENTER] {func.__name__} args={args} kwargs={kwargs}")
-        print(f"[ENTER] {func.__name__} args={args} kwargs={kwargs}")
-        try:
-            result = func(*args, **kwargs)
-            logging.info(f"[EXIT] {func.__name__} returned {result}")
-            print(f"[EXIT] {func.__name__} returned {result}")
-            return result
-        except Exception as e:
-            logging.error(f"[ERROR] {func.__name__} exception: {e}", exc_info=True)
-            print(f"[ERROR] {func.__name__} exception: {e}")
-            raise
-    return wrapper
-
-def log_agent(event, **kwargs):
-    ts = datetime.datetime.now().isoformat()
-    print(f"[AGENT] {ts} | {event} | " + " | ".join(f"{k}={v}" for k, v in kwargs.items()))
+log_agent = EventLogger("supplywhiz.agents")
 
-@detailed_log
+@traced
 def generate_action_plan(risk_report):
-    log_agent("generate_action_plan_called", risk_report=risk_report)
+    log_agent.debug("generate_action_plan_called", risk_report=risk_report)
     if not risk_report:
         return []
     if not GROQ_API_KEY:
         logging.error("GROQ_API_KEY not set. LLM-based action planning is required.")
         raise RuntimeError("GROQ_API_KEY not set. LLM-based action planning is required.")
-    log_agent("llm_input_for_action_plan", risk_report=risk_report)
+    log_agent("llm_input_for_action_plan", items=len(risk_report))
+    log_agent.debug("llm_input_for_action_plan", risk_report=risk_report)
     try:
-        llm = ChatGroq(groq_api_key=GROQ_API_KEY, model_name="llama-3.3-70b-versatile")
-        chain = LLMChain(llm=llm, prompt=llm_prompt)
-        # Use strict JSON for LLM input
-        result = chain.run(risk_report=json.dumps(risk_report))
-        log_agent("llm_raw_output_for_action_plan", result=result)
-        raw_result = result.strip()
-        try:
-            plans = json.loads(raw_result)
-            if not isinstance(plans, list):
-                if isinstance(plans, dict):
-                    plans = [plans]
-                else:
-                    logging.error(f"LLM returned invalid format: {type(plans)}. Output: {raw_result}")
-                    raise RuntimeError(f"LLM returned invalid format: {type(plans)}. Output: {raw_result}")
-        except Exception as e:
-            logging.error(f"LLM did not return valid JSON: {e}. Output: {raw_result}")
-            import re
-            fixed = re.sub(r',\s*([}}\]])', r'\1', raw_result)
-            try:
-                plans = json.loads(fixed)
-                if not isinstance(plans, list):
-                    if isinstance(plans, dict):
-                        plans = [plans]
-                    else:
-                        logging.error(f"LLM returned invalid format after fix: {type(plans)}. Output: {fixed}")
-                        raise RuntimeError(f"LLM returned invalid format after fix: {type(plans)}. Output: {fixed}")
-            except Exception as e2:
-                logging.error(f"LLM JSON fix attempt failed: {e2}. Output: {fixed}")
-                raise RuntimeError(f"LLM JSON fix attempt failed: {e2}. Output: {fixed}")
-        for i, plan in enumerate(plans):
-            if 'risk_score' not in plan and i < len(risk_report):
-                plan['risk_score'] = risk_report[i].get('risk_score', 0)
-            if 'summary' not in plan and i < len(risk_report):
-                plan['summary'] = risk_report[i].get('summary', '')
-        log_agent("final_action_plans", plans=plans)
+        chain = get_chain("action_plan")
+
+        def run(reports):
+            result = chain.run(risk_report=json.dumps(reports))
+            log_agent.debug("llm_raw_output_for_action_plan", result=result)
+            return [result]
+
+        # Valid plans are kept; only risk items left without a plan are sent again
+        plans, unanswered = request_items(run, risk_report, ActionPlanItem, key=lambda r: r.get("product_id"))
+        if not plans:
+            raise RuntimeError("LLM output contained no valid action plans")
+        if unanswered:
+            log_agent.error("llm_action_plans_missing", count=len(unanswered),
+                            product_ids=[r.get("product_id") for r in unanswered])
+        for plan, source in match_to_inputs(plans, risk_report, key=lambda r: r.get("product_id")):
+            source = source or {}
+            if not plan.get('disruption_key') and source.get('disruption_key'):
+                plan['disruption_key'] = source['disruption_key']
+            if plan.get('risk_score') is None:
+                plan['risk_score'] = source.get('risk_score', 0)
+            if not plan.get('summary'):
+                plan['summary'] = source.get('summary', '')
+        log_agent("final_action_plans", count=len(plans))
         return plans
     except Exception as e:
-        log_agent("llm_action_plan_failed", error=str(e))
-        raise RuntimeError(f"LLM action plan failed. Error: {e}")
\ No newline at end of file
+        log_agent.error("llm_action_plan_failed", error=str(e))
+        raise RuntimeError(f"LLM action plan failed. Error: {e}")
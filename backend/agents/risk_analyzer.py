@@ -1,16 +1,20 @@
-import pandas as pd
-import json
 import os
 import logging
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from dotenv import load_dotenv
-import functools
-import datetime
-from utils.data_loader import load_inventory, load_vendors
+from utils.data_loader import load_vendors
+from agents.shipment_index import shipment_index
+from tracing import EventLogger, traced
+from agents.llm_registry import get_chain, register_prompt
+from agents.prompt_builder import build_risk_inputs, estimate_tokens
+from agents.llm_json import match_to_inputs, request_items
+from models import RiskReportItem
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Shipments whose route passes within this distance of a disruption are treated as affected
+PROXIMITY_RADIUS_KM = float(os.getenv("PROXIMITY_RADIUS_KM", 50))
+# "tiered" (rules for every pair, LLM only for risky/uncertain ones), "llm" (every pair) or "rules" (no LLM)
+RISK_SCORING_MODE = os.getenv("RISK_SCORING_MODE", "tiered").lower()
+RISK_LLM_THRESHOLD = int(os.getenv("RISK_LLM_THRESHOLD", 70))
 
 # To use Google Sheets for inventory or Airtable for vendors, import and use the load_inventory/load_vendors functions from utils.data_loader.py
 # Example (uncomment and configure as needed):
@@ -35,6 +39,35 @@ def calculate_risk_score(severity, criticality):
     base = {"High": 80, "Medium": 50, "Low": 20}.get(severity, 30)
     return min(100, int(base + 0.2 * criticality))
 
+# Rule-engine tables shared by the row-wise fallback, the vectorised engine (agents/risk_engine.py)
+# and the tiered mode's uncertainty check
+SEVERITY_WEIGHTS = {"Low": 30, "Medium": 60, "High": 90}
+
+IMPACT_THRESHOLDS = [
+    (80, "Critical"),
+    (60, "High"),
+    (40, "Medium"),
+    (0,  "Low"),
+]
+
+DELAY_MAP = {
+    "Strike": {"High": "7-10 days", "Medium": "3-5 days", "Low": "1-2 days"},
+    "Weather": {"High": "5-7 days", "Medium": "2-4 days", "Low": "1 day"},
+    "Port Congestion": {"High": "10-14 days", "Medium": "5-7 days", "Low": "2-3 days"},
+    "Political Unrest": {"High": "14+ days", "Medium": "7-10 days", "Low": "3-5 days"}
+}
+
+DEFAULT_CRITICALITY = 50
+
+def criticality_of(shipment):
+    """criticality_score as a float; missing, null or non-numeric values count as the default."""
+    value = shipment.get("criticality_score")
+    try:
+        value = float(value if value is not None else DEFAULT_CRITICALITY)
+    except (TypeError, ValueError):
+        return float(DEFAULT_CRITICALITY)
+    return value if value == value and abs(value) != float("inf") else float(DEFAULT_CRITICALITY)
+
 def generate_fallback_risk_reports(llm_input):
     """
     Generate risk reports using a rule-based approach when LLM is unavailable.
@@ -46,26 +79,14 @@ def generate_fallback_risk_reports(llm_input):
     Returns:
         list: List of structured risk report dictionaries.
     """
-    
+
     def calculate_risk_score(severity_level, criticality_score):
-        severity_weights = {"Low": 30, "Medium": 60, "High": 90}
-        severity_score = severity_weights.get(severity_level, 50)
+        severity_score = SEVERITY_WEIGHTS.get(severity_level, 50)
         return min(100, round(0.6 * severity_score + 0.4 * criticality_score))
 
-    impact_thresholds = [
-        (80, "Critical"),
-        (60, "High"),
-        (40, "Medium"),
-        (0,  "Low"),
-    ]
-
-    delay_map = {
-        "Strike": {"High": "7-10 days", "Medium": "3-5 days", "Low": "1-2 days"},
-        "Weather": {"High": "5-7 days", "Medium": "2-4 days", "Low": "1 day"},
-        "Port Congestion": {"High": "10-14 days", "Medium": "5-7 days", "Low": "2-3 days"},
-        "Political Unrest": {"High": "14+ days", "Medium": "7-10 days", "Low": "3-5 days"}
-    }
-    
+    impact_thresholds = IMPACT_THRESHOLDS
+    delay_map = DELAY_MAP
+
     risk_reports = []
 
     for item in llm_input:
@@ -73,7 +94,7 @@ def generate_fallback_risk_reports(llm_input):
         disruption = item.get("disruption", {})
         
         product_id = shipment.get("product_id", "unknown")
-        criticality = shipment.get("criticality_score", 50)
+        criticality = criticality_of(shipment)
         severity = disruption.get("severity", "Medium")
         event_type = disruption.get("event_type", "Unknown")
         
@@ -109,106 +130,145 @@ def generate_fallback_risk_reports(llm_input):
     return risk_reports
 
 
-def detailed_log(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        logging.info(f"[ENTER] {func.__name__} args={args} kwargs={kwargs}")
-        print(f"[ENTER] {func.__name__} args={args} kwargs={kwargs}")
-        try:
-            result = func(*args, **kwargs)
-            logging.info(f"[EXIT] {func.__name__} returned {result}")
-            print(f"[EXIT] {func.__name__} returned {result}")
-            return result
-        except Exception as e:
-            logging.error(f"[ERROR] {func.__name__} exception: {e}", exc_info=True)
-            print(f"[ERROR] {func.__name__} exception: {e}")
-            raise
-    return wrapper
-
-def log_agent(event, **kwargs):
-    ts = datetime.datetime.now().isoformat()
-    print(f"[AGENT] {ts} | {event} | " + " | ".join(f"{k}={v}" for k, v in kwargs.items()))
-
-@detailed_log
+log_agent = EventLogger("supplywhiz.agents")
+
+@traced
 def analyze_risk(disruptions):
-    log_agent("analyze_risk_called", disruptions=disruptions)
+    log_agent.debug("analyze_risk_called", disruptions=disruptions)
     if not isinstance(disruptions, list):
         disruptions = [disruptions]
     
     try:
-        inventory = load_inventory()
         vendors = load_vendors()
+        # Candidates come from the cached shipment index (rebuilt on TTL, updated on shipment writes)
+        # instead of loading the inventory and rebuilding its route and name indexes per call
+        candidates = [(disruption, shipment_index.candidates(disruption, PROXIMITY_RADIUS_KM)) for disruption in disruptions]
     except Exception as e:
         logging.error(f"Error loading data from Supabase: {e}")
         return []
 
     llm_input = []
-    for disruption in disruptions:
-        event_loc = disruption.get('location', '').lower()
-        for item in inventory:
-            if _location_matches(event_loc, item):
-                vendor_info = _get_vendor_info(item.get('vendor_id'), vendors)
-                llm_input.append({
-                    "shipment": item,
-                    "vendor": vendor_info,
-                    "disruption": disruption
-                })
+    for disruption, shipments in candidates:
+        for item in shipments:
+            vendor_info = _get_vendor_info(item.get('vendor_id'), vendors)
+            llm_input.append({
+                "shipment": item,
+                "vendor": vendor_info,
+                "disruption": disruption
+            })
+
+    if not llm_input:
+        return []
+
+    reports = score_risk_pairs(llm_input)
+    # Each report names the disruption it belongs to, so callers can store it with that event only
+    for report, pair in match_to_inputs(reports, llm_input, key=_pair_product, echo=_PAIR_ECHO):
+        if pair is not None:
+            report["disruption_key"] = disruption_key(pair["disruption"])
+    return reports
 
+def score_risk_pairs(llm_input):
+    """Risk reports for shipment/disruption pairs, scored as RISK_SCORING_MODE says (rules, llm or tiered)."""
     if not llm_input:
         return []
+    if RISK_SCORING_MODE == "rules":
+        return rule_risk_reports(llm_input)
+    if RISK_SCORING_MODE == "llm":
+        if not GROQ_API_KEY:
+            raise RuntimeError("GROQ_API_KEY not set. LLM-based risk analysis is required.")
+        return _tag(_llm_risk_reports(llm_input), "llm")
+    return _tiered_risk_reports(llm_input)
+
+def rule_risk_reports(llm_input):
+    """Risk reports from the vectorised rule engine only; no LLM or network call."""
+    from agents.risk_engine import score_pairs
+    return _tag(score_pairs(llm_input), "rules")
+
+def disruption_key(disruption):
+    """Stable identity of a disruption event: type, location and timestamp."""
+    return "|".join(str(disruption.get(k) or "").strip().lower() for k in ("event_type", "location", "timestamp"))
 
-    if not GROQ_API_KEY:
-        raise RuntimeError("GROQ_API_KEY not set. LLM-based risk analysis is required.")
+def _pair_product(pair):
+    return pair["shipment"].get("product_id")
 
-    # Log the LLM input
-    log_agent("llm_input_for_risk_analysis", llm_input=llm_input)
-    print("[DEBUG] LLM INPUT:", json.dumps(llm_input, indent=2))
+# LLM reports copy the disruption_key of their pair, so a product hit by several disruptions
+# is matched to the right one even when retries return the reports out of order
+_PAIR_ECHO = ("disruption_key", lambda pair: disruption_key(pair["disruption"]))
+
+def _tag(reports, source):
+    for report in reports:
+        if isinstance(report, dict):
+            report.setdefault("source", source)
+    return reports
+
+def _is_uncertain(pair):
+    """True when the rule engine had to fall back to defaults for this pair."""
+    shipment = pair.get("shipment") or {}
+    disruption = pair.get("disruption") or {}
+    severity = disruption.get("severity")
+    return (
+        severity not in SEVERITY_WEIGHTS
+        or not isinstance(shipment.get("criticality_score"), (int, float))
+        or severity not in DELAY_MAP.get(disruption.get("event_type"), {})
+    )
+
+def _tiered_risk_reports(llm_input):
+    """
+    Score every pair with the rule engine, then send only high-risk or uncertain pairs
+    to the LLM. LLM reports replace the rule reports for those pairs; if the LLM is not
+    configured or fails, the rule reports stand.
+    """
+    reports = rule_risk_reports(llm_input)
+    escalate = [i for i, (pair, report) in enumerate(zip(llm_input, reports))
+                if report["risk_score"] >= RISK_LLM_THRESHOLD or _is_uncertain(pair)]
+    log_agent("tiered_risk_scoring", pairs=len(llm_input), escalated=len(escalate), llm_enabled=bool(GROQ_API_KEY))
+    if not escalate or not GROQ_API_KEY:
+        return reports
+    try:
+        llm_reports = _llm_risk_reports([llm_input[i] for i in escalate])
+    except RuntimeError:
+        return reports
+    # The LLM returns one report per pair, matched back by the disruption_key it echoes
+    escalated = [llm_input[i] for i in escalate]
+    position = {id(pair): i for i, pair in zip(escalate, escalated)}
+    llm_reports = [r for r in llm_reports if isinstance(r, dict)]
+    for report, pair in match_to_inputs(llm_reports, escalated, key=_pair_product, echo=_PAIR_ECHO):
+        if pair is not None:
+            reports[position[id(pair)]] = _tag([report], "llm")[0]
+    return reports
+
+def _llm_risk_reports(llm_input):
+    log_agent("llm_input_for_risk_analysis", pairs=len(llm_input))
+    log_agent.debug("llm_input_for_risk_analysis", llm_input=llm_input)
 
     try:
-        llm = ChatGroq(groq_api_key=GROQ_API_KEY, model_name="llama-3.3-70b-versatile")
-        chain = LLMChain(llm=llm, prompt=_get_risk_analysis_prompt())
-        # Use strict JSON for LLM input
-        result = chain.run(llm_input=json.dumps(llm_input))
-        log_agent("llm_raw_output_for_risk_analysis", result=result)
-        risk_reports = json.loads(result)
-        if not isinstance(risk_reports, list):
-            raise ValueError("LLM output is not a list")
+        chain = get_chain("risk_analysis")
+
+        def run(pairs):
+            keyed = [{**pair, "disruption_key": disruption_key(pair["disruption"])} for pair in pairs]
+            for chunk in build_risk_inputs(keyed):
+                log_agent.debug("llm_risk_chunk", pairs=len(pairs), est_tokens=estimate_tokens(chunk))
+                result = chain.run(llm_input=chunk)
+                log_agent.debug("llm_raw_output_for_risk_analysis", result=result)
+                yield result
+
+        # Valid reports are kept; only pairs left without one are sent again
+        risk_reports, unanswered = request_items(run, llm_input, RiskReportItem, key=_pair_product, echo=_PAIR_ECHO)
+        if not risk_reports:
+            raise ValueError("LLM output contained no valid risk reports")
+        if unanswered:
+            log_agent.error("llm_risk_reports_missing", count=len(unanswered),
+                            product_ids=[p["shipment"].get("product_id") for p in unanswered])
         for report in risk_reports:
-            if not isinstance(report, dict):
-                continue
             report['risk_score'] = min(100, max(0, int(report.get('risk_score', 50))))
-            if 'summary' not in report:
+            if not report.get('summary'):
                 report['summary'] = f"Risk analysis for product {report.get('product_id', 'unknown')}"
-        log_agent("final_risk_reports", risk_reports=risk_reports)
+        log_agent("final_risk_reports", count=len(risk_reports))
         return risk_reports
     except Exception as e:
-        log_agent("llm_risk_analysis_failed", error=str(e))
+        log_agent.error("llm_risk_analysis_failed", error=str(e))
         raise RuntimeError(f"LLM risk analysis failed: {e}")
 
-def _location_matches(event_loc, item):
-    """Check if disruption location matches any shipment location."""
-    # Check route
-    if 'route' in item and isinstance(item['route'], list):
-        if any(event_loc in loc.lower() or loc.lower() in event_loc for loc in item['route']):
-            return True
-    
-    # Check current location
-    if 'current_location' in item and item['current_location']:
-        cloc = item['current_location'].lower()
-        if event_loc in cloc or cloc in event_loc:
-            return True
-    
-    # Check legs
-    if 'legs' in item and isinstance(item['legs'], list):
-        for leg in item['legs']:
-            for key in ['origin', 'destination', 'current_location']:
-                val = leg.get(key)
-                if val is not None:
-                    lloc = str(val).lower()
-                if lloc and (event_loc in lloc or lloc in event_loc):
-                    return True
-    return False
-
 def _get_vendor_info(vendor_id, vendors):
     """Get vendor information from vendors DataFrame."""
     if vendor_id is None:
@@ -216,35 +276,35 @@ def _get_vendor_info(vendor_id, vendors):
     vendor_rows = vendors[vendors['vendor_id'] == vendor_id]
     return vendor_rows.iloc[0].to_dict() if not vendor_rows.empty else {}
 
-def _get_risk_analysis_prompt():
-    """Return the enhanced prompt template for structured supply chain risk analysis."""
-    return PromptTemplate(
-        input_variables=["llm_input"],
-        template="""
+RISK_ANALYSIS_TEMPLATE = """
 You are an AI supply chain risk analyst. Analyze the following data, which may include information about shipments, disruptions, vendors, or logistics incidents:
 
 Input Data:
 {llm_input}
 
-For each item in the input, generate a corresponding JSON object with the following fields:
+The input is compact JSON. "shipments", "vendors" and "disruptions" are lookup tables keyed by id; each entry in "pairs" references one shipment, one disruption and optionally one vendor by those keys.
+
+For each entry in "pairs", generate a corresponding JSON object with the following fields:
 
-- \"product_id\": Unique product identifier from the item.
-- \"risk_score\": Integer between 0 and 100, based on severity of the disruption and criticality of the shipment.
-- \"impact_level\": One of [\"Low\", \"Medium\", \"High\", \"Critical\"], derived from the risk_score using consistent thresholds.
-- \"delay_estimate\": Estimated shipping delay in days (integer or range).
-- \"cost_impact\": Estimated cost impact in USD.
-- \"escalation\": Escalation action required, or \"None\" if not needed. Be specific if escalation is necessary (e.g., \"Notify VP of Global Ops\").
-- \"summary\": A concise 1–2 sentence explanation summarizing the risk and suggested action focus.
+- "product_id": Unique product identifier of the referenced shipment.
+- "disruption_key": The key of the referenced disruption, copied exactly as it appears in the pair.
+- "risk_score": Integer between 0 and 100, based on severity of the disruption and criticality of the shipment.
+- "impact_level": One of ["Low", "Medium", "High", "Critical"], derived from the risk_score using consistent thresholds.
+- "delay_estimate": Estimated shipping delay in days (integer or range).
+- "cost_impact": Estimated cost impact in USD.
+- "escalation": Escalation action required, or "None" if not needed. Be specific if escalation is necessary (e.g., "Notify VP of Global Ops").
+- "summary": A concise 1–2 sentence explanation summarizing the risk and suggested action focus.
 
 Instructions:
 - Derive values logically from the input context.
 - Use consistent logic to map `risk_score` to `impact_level` (e.g., 0–25=Low, 26–50=Medium, 51–75=High, 76–100=Critical).
 - Focus on realism and actionable insights.
-- **You must always return at least one risk report per input item.**
+- **You must always return at least one risk report per pair.**
 - If you cannot assess risk, explain why in the summary field.
 
 Output Requirements:
 - Output a **JSON array** of the generated objects, one per item.
 - Do **not** include any additional explanation, markdown, or code block—only valid raw JSON.
 """
-    )
+
+register_prompt("risk_analysis", RISK_ANALYSIS_TEMPLATE, ["llm_input"])
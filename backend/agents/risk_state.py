@@ -0,0 +1,154 @@
+import logging
+from db import get_client
+from utils.route_geometry import RouteIndex, location_matches
+from agents.risk_analyzer import (PROXIMITY_RADIUS_KM, _PAIR_ECHO, _pair_product, disruption_key, rule_risk_reports,
+                                  score_risk_pairs)
+from agents.llm_json import match_to_inputs
+from agents.shipment_index import shipment_index
+
+# Changes to these fields can move a shipment into or out of a disruption's reach
+LOCATION_FIELDS = ("current_location", "route", "legs")
+
+class RiskState:
+    """
+    Active disruptions and the shipments each one affects, kept current incrementally.
+
+    State lives in the database, one risk_disruptions row per disruption and one
+    risk_exposures row per affected shipment (see schema.sql), so API processes and
+    workers only write the rows they change. add_disruptions() stores the reports
+    analyze_risk produced (or scores with `scorer`). A shipment whose location or route
+    changes is re-scored against the active disruptions only, with `rescorer`: the rule
+    engine by default, because shipment writes (every GPS tick included) run on the
+    request path and must not wait on an LLM. Candidate shipments come from the shared
+    shipment index.
+    """
+    def __init__(self, index=shipment_index, radius_km=PROXIMITY_RADIUS_KM, scorer=score_risk_pairs,
+                 rescorer=rule_risk_reports):
+        self.index = index
+        self.radius_km = radius_km
+        self.scorer = scorer
+        self.rescorer = rescorer
+
+    @staticmethod
+    def _disruptions():
+        return get_client().table("risk_disruptions")
+
+    @staticmethod
+    def _exposures():
+        return get_client().table("risk_exposures")
+
+    def _replace_exposures(self, key, reports):
+        self._exposures().delete().eq("disruption_key", key).execute()
+        rows = [{"disruption_key": key, "product_id": str(r["product_id"]), "report": r} for r in reports]
+        if rows:
+            self._exposures().insert(rows).execute()
+
+    def add_disruptions(self, disruptions, reports=None):
+        """
+        Activate disruptions with the shipments they affect. `reports` are analyze_risk's
+        reports for these disruptions (matched by disruption_key); without them the
+        reachable shipments are scored here. Returns {key: [product_id, ...]}.
+        """
+        by_key = {}
+        for report in reports or []:
+            if isinstance(report, dict) and report.get("product_id") is not None:
+                by_key.setdefault(report.get("disruption_key"), []).append(report)
+        changed = {}
+        for disruption in disruptions:
+            key = disruption_key(disruption)
+            if reports is None:
+                pairs = [{"shipment": s, "disruption": disruption} for s in self.index.candidates(disruption, self.radius_km)]
+                own = [r for r in self.scorer(pairs) if isinstance(r, dict) and r.get("product_id") is not None]
+            else:
+                own = by_key.get(key, [])
+            first = {}
+            for report in own:  # one report per shipment, the first one given
+                first.setdefault(str(report["product_id"]), report)
+            own = list(first.values())
+            self._disruptions().upsert({"key": key, "disruption": disruption}, on_conflict="key").execute()
+            self._replace_exposures(key, own)
+            changed[key] = [str(r["product_id"]) for r in own]
+        return changed
+
+    def resolve(self, key):
+        """Deactivate a disruption; returns False if it was not active."""
+        self._exposures().delete().eq("disruption_key", key).execute()
+        return bool(self._disruptions().delete().eq("key", key).execute().data)
+
+    def update_shipment(self, shipment):
+        """
+        Apply a shipment change (a full row or a partial update with product_id) and
+        re-score it against the active disruptions. Returns the keys whose affected set
+        or report for this shipment changed.
+        """
+        merged = self.index.update(shipment)
+        if merged is None:
+            return []
+        product_id = str(merged["product_id"])
+        active = self._disruptions().select("key,disruption").execute().data or []
+        probe = RouteIndex.from_shipments([merged])
+        reached = [(row["key"], row["disruption"]) for row in active
+                   if location_matches(row["disruption"].get("location"), merged)
+                   or probe.query_disruption(row["disruption"], self.radius_km)]
+        pairs = [{"shipment": merged, "disruption": d} for _, d in reached]
+        reports = self.rescorer(pairs) if pairs else []
+        # LLM scorers answer in any order and may skip pairs: match on the disruption_key they echo
+        now = {}
+        for report, pair in match_to_inputs([r for r in reports if isinstance(r, dict)], pairs,
+                                            key=_pair_product, echo=_PAIR_ECHO):
+            if pair is not None:
+                now.setdefault(disruption_key(pair["disruption"]), {**report, "disruption_key": disruption_key(pair["disruption"])})
+        # A reached disruption the scorer left unanswered keeps whatever report it had
+        unscored = {key for key, _ in reached} - set(now)
+        before = {row["disruption_key"]: row["report"] for row in
+                  self._exposures().select("disruption_key,report").eq("product_id", product_id).execute().data or []}
+        changed = []
+        for key in (row["key"] for row in active):
+            if key in unscored:
+                continue
+            if key in now:
+                if now[key] != before.get(key):
+                    self._exposures().upsert({"disruption_key": key, "product_id": product_id, "report": now[key]},
+                                             on_conflict="disruption_key,product_id").execute()
+                    changed.append(key)
+            elif key in before:
+                self._exposures().delete().eq("disruption_key", key).eq("product_id", product_id).execute()
+                changed.append(key)
+        return changed
+
+    def snapshot(self):
+        affected = {}
+        for row in self._exposures().select("disruption_key,report").execute().data or []:
+            affected.setdefault(row["disruption_key"], []).append(row["report"])
+        return [
+            {"key": row["key"], "disruption": row["disruption"],
+             "affected": sorted(affected.get(row["key"], []), key=lambda r: -(r.get("risk_score") or 0))}
+            for row in self._disruptions().select("key,disruption").execute().data or []
+        ]
+
+risk_state = RiskState()
+
+def track_disruptions(disruptions, reports=None):
+    """Add analysed disruptions (and analyze_risk's reports for them) to the shared risk state without failing the caller."""
+    try:
+        return risk_state.add_disruptions(disruptions, reports)
+    except Exception as e:
+        logging.error(f"Failed to update risk state for new disruptions: {e}")
+        return {}
+
+def on_shipment_changed(shipment):
+    """
+    Record a shipment write in the shared shipment index and, if its location or route
+    moved, re-score it against the active disruptions. Call after every shipment write.
+    """
+    if not any(field in shipment for field in LOCATION_FIELDS):
+        try:
+            shipment_index.update(shipment)
+        except Exception as e:
+            logging.error(f"Failed to update shipment index for {shipment.get('product_id')}: {e}")
+        return []
+    try:
+        return risk_state.update_shipment(shipment)
+    except Exception as e:
+        logging.error(f"Failed to re-score shipment {shipment.get('product_id')}: {e}")
+        return []
@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+from utils.data_loader import load_inventory
+from utils.route_geometry import LocationNameIndex, RouteIndex
+
+# Rebuilt from the database at least this often, which picks up shipment writes made by other processes
+SHIPMENT_INDEX_TTL_SECONDS = float(os.getenv("SHIPMENT_INDEX_TTL_SECONDS", 300))
+
+class ShipmentIndex:
+    """
+    Shipments with their location-name and route indexes, shared by the risk analyzer
+    and the risk state so neither loads the inventory per request.
+
+    Shipment writes made through this process are applied in place with update(); a full
+    rebuild happens on first use, after invalidate(), and once the index is older than
+    `ttl` seconds. A failed rebuild keeps the previous index.
+    """
+    def __init__(self, loader=load_inventory, ttl=SHIPMENT_INDEX_TTL_SECONDS):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._shipments = {}
+        self._position = {}  # product_id -> inventory order, so candidates come back in a stable order
+        self._routes = RouteIndex()
+        self._names = LocationNameIndex()
+
+    def _ensure(self):
+        if self._built_at is not None and time.monotonic() - self._built_at < self.ttl:
+            return
+        shipments, routes, names = {}, RouteIndex(), LocationNameIndex()
+        for shipment in self.loader() or []:
+            if shipment.get("product_id") is None:
+                continue
+            shipments[shipment["product_id"]] = shipment
+            routes.add_shipment(shipment)
+            names.add_shipment(shipment)
+        self._shipments, self._routes, self._names = shipments, routes, names
+        self._position = {pid: i for i, pid in enumerate(shipments)}
+        self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def get(self, product_id):
+        with self._lock:
+            self._ensure()
+            return self._shipments.get(product_id)
+
+    def candidates(self, disruption, radius_km):
+        """Shipments whose location names or route reach the disruption, in inventory order."""
+        with self._lock:
+            self._ensure()
+            matched = self._names.query(disruption.get("location")) | set(self._routes.query_disruption(disruption, radius_km))
+            return [self._shipments[pid] for pid in sorted((p for p in matched if p in self._position), key=self._position.get)]
+
+    def update(self, shipment):
+        """Apply a shipment write (a full row or a partial update with product_id); returns the merged row."""
+        product_id = shipment.get("product_id")
+        if product_id is None:
+            return None
+        with self._lock:
+            self._ensure()
+            merged = {**self._shipments.get(product_id, {}), **shipment}
+            self._position.setdefault(product_id, len(self._position))
+            self._shipments[product_id] = merged
+            self._routes.add_shipment(merged)
+            self._names.add_shipment(merged)
+            return merged
+
+shipment_index = ShipmentIndex()
@@ -1,9 +1,7 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from scheduler import start_scheduler
+from scheduler import start_scheduler, stop_scheduler
 from auth import auth_router
 from routes.shipment import shipment_router
 from routes.disruption import disruption_router
@@ -13,16 +11,47 @@ from logging_config import setup_logging
 from middleware import add_middlewares
 from fastapi.openapi.utils import get_openapi
 import logging
-from slowapi.extension import Limiter as SlowAPILimiter
+import threading
 from fastapi import Depends
 from routes.integrations import integrations_router
 from routes.analytics import analytics_router
+from db import init_db, close_db
+from audit import audit_sink
+from passwords import password_hasher
+from jobs import PROCESS_MODE
+from utils.notifications import notification_dispatcher
+from agents.llm_registry import LLM_WARM_ON_STARTUP, warm_llm_registry
+from agents.alert_index import alert_index
 
-limiter = Limiter(key_func=get_remote_address, default_limits=["10/minute", "100/hour"])
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Clients and background workers start here rather than at import, so importing
+    # the app stays cheap and each worker only pays for them once it actually serves.
+    init_db()
+    print("[APP] Database client initialised.")
+    scheduler = None
+    if PROCESS_MODE == "api":
+        print("[APP] PROCESS_MODE=api: agent work and the scheduler run in worker.py.")
+    else:
+        scheduler = start_scheduler()
+        print("[APP] Scheduler started.")
+    # Chat retrieval index: loaded and kept in sync with the alerts table off the request path
+    alert_index.start()
+    if LLM_WARM_ON_STARTUP:
+        # Build LLM clients and chains off the event loop; requests arriving first simply build them on demand
+        threading.Thread(target=warm_llm_registry, name="llm-warmup", daemon=True).start()
+    try:
+        yield
+    finally:
+        stop_scheduler(scheduler)
+        alert_index.stop()
+        audit_sink.stop()
+        password_hasher.shutdown()
+        notification_dispatcher.stop()
+        close_db()
+
+app = FastAPI(lifespan=lifespan)
 print("[APP] FastAPI app instance created.")
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8501", "http://127.0.0.1:8501", "http://localhost:3000", "http://127.0.0.1:3000"],
@@ -51,9 +80,6 @@ print("[APP] Integrations router included.")
 app.include_router(analytics_router)
 print("[APP] Analytics router included.")
 
-start_scheduler()
-print("[APP] Scheduler started.")
-
 def custom_openapi():
     print("[APP] Generating custom OpenAPI schema.")
     if app.openapi_schema:
@@ -77,11 +103,4 @@ def custom_openapi():
                 op["security"] = [{"BearerAuth": []}]
     app.openapi_schema = openapi_schema
     return app.openapi_schema
-app.openapi = custom_openapi 
-
-# Example: Add per-endpoint rate limiting
-@health_router.get("/limited_healthz")
-@limiter.limit("5/minute")
-async def limited_healthz(request):
-    print("[API] /limited_healthz endpoint called (rate limited)")
-    return {"status": "ok (rate limited)"} 
\ No newline at end of file
+app.openapi = custom_openapi
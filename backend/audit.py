@@ -1,25 +1,207 @@
 import os
+import json
+import queue
+import atexit
 import logging
 import datetime
-from supabase import create_client
+import threading
+import time
+import httpx
 from dotenv import load_dotenv
+from db import insert_audit_entries
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
-def log_audit(action, actor, target=None, details=None, log_dir=None):
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 50))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 2.0))  # seconds
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", 10000))
+AUDIT_REPLAY_INTERVAL = float(os.getenv("AUDIT_REPLAY_INTERVAL", 30.0))  # seconds between idle spool replays
+AUDIT_SPOOL_PATH = os.getenv("AUDIT_SPOOL_PATH", os.path.join(os.path.dirname(__file__), "logs", "audit_spool.jsonl"))
+AUDIT_DEAD_LETTER_PATH = os.getenv("AUDIT_DEAD_LETTER_PATH",
+                                   os.path.join(os.path.dirname(__file__), "logs", "audit_dead_letter.jsonl"))
+
+# SQLSTATE classes worth retrying: connection (08), serialization/deadlock (40),
+# insufficient resources (53), operator intervention such as a restart (57)
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+logger = logging.getLogger(__name__)
+
+def is_transient(error):
+    """True for failures a later retry can fix (network, timeouts, server overload); False for bad data or schema."""
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    code = str(getattr(error, "code", None) or "")
+    # PostgREST reports a non-JSON gateway response by its HTTP status
+    return code.startswith(TRANSIENT_SQLSTATE_CLASSES) or code in ("408", "429") or (len(code) == 3 and code.startswith("5"))
+
+def key_groups(entries):
+    """Split entries into runs with identical keys, so a bulk insert never NULLs a column another entry set."""
+    groups = {}
+    for entry in entries:
+        groups.setdefault(frozenset(entry), []).append(entry)
+    return list(groups.values())
+
+class AuditSink:
+    """
+    Asynchronous audit writer.
+
+    enqueue() returns immediately; a daemon thread drains the queue and inserts
+    entries in batches. Batches that fail transiently (database unreachable) and
+    entries arriving while the queue is full are appended to a local JSONL spool,
+    which is replayed once writes succeed again. Entries the database rejects
+    outright are written to a dead-letter file instead, so they are never retried.
+    """
+    def __init__(self, writer=insert_audit_entries, spool_path=AUDIT_SPOOL_PATH, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, max_queue=AUDIT_QUEUE_MAX, replay_interval=AUDIT_REPLAY_INTERVAL,
+                 dead_letter_path=AUDIT_DEAD_LETTER_PATH):
+        self.writer = writer
+        self.spool_path = spool_path
+        self.dead_letter_path = dead_letter_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_interval = replay_interval
+        self._next_replay = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher after draining whatever is queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, entry):
+        self.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._spool([entry])
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch and not self._write(batch):
+                continue
+            # Replay after a successful write, or periodically while idle
+            if batch or time.monotonic() >= self._next_replay:
+                self._next_replay = time.monotonic() + self.replay_interval
+                self._replay_spool()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        undelivered, error = self._deliver(batch)
+        if undelivered:
+            logger.error(f"Failed to write {len(undelivered)} audit entries, spooling locally: {error}")
+            self._spool(undelivered)
+            return False
+        return True
+
+    def _deliver(self, entries):
+        """Insert entries; returns (entries left unwritten by a transient failure, that error)."""
+        chunks = [group[i:i + self.batch_size] for group in key_groups(entries)
+                  for i in range(0, len(group), self.batch_size)]
+        for n, chunk in enumerate(chunks):
+            try:
+                self.writer(chunk)
+                continue
+            except Exception as e:
+                if is_transient(e):
+                    return [entry for rest in chunks[n:] for entry in rest], e
+                if len(chunk) == 1:
+                    self._dead_letter(chunk, e)
+                    continue
+            # Rejected outright: retry one by one so a single bad entry does not take its batch down
+            for i, entry in enumerate(chunk):
+                try:
+                    self.writer([entry])
+                except Exception as e:
+                    if is_transient(e):
+                        return chunk[i:] + [entry for rest in chunks[n + 1:] for entry in rest], e
+                    self._dead_letter([entry], e)
+        return [], None
+
+    def _dead_letter(self, entries, error):
+        logger.error(f"Audit entry rejected by the database, moved to {self.dead_letter_path}: {error}")
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.dead_letter_path), exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps({"entry": entry, "error": str(error)}, default=str) + "\n")
+
+    def _spool(self, entries):
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, default=str) + "\n")
+
+    def _replay_spool(self):
+        # The .replay file is only removed once its entries are written or back in the spool,
+        # so a crash mid-replay loses nothing (entries may be written twice instead). One left
+        # by an interrupted replay, e.g. before a restart, is replayed before the spool moves again.
+        replay_path = self.spool_path + ".replay"
+        with self._spool_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, replay_path)
+        entries = []
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    if line.strip():
+                        logger.warning(f"Skipping malformed audit spool line: {line[:200]!r}")
+        undelivered, error = self._deliver(entries)
+        if undelivered:
+            logger.warning(f"Audit spool replay deferred, {len(undelivered)} entries remain: {error}")
+            self._spool(undelivered)
+        elif entries:
+            logger.info(f"Replayed {len(entries)} spooled audit entries")
+        os.remove(replay_path)
+
+audit_sink = AuditSink()
+atexit.register(audit_sink.stop)
+
+def log_audit(action, actor, target=None, details=None, log_dir=None, **fields):
+    """Queue an audit_log entry; extra keyword fields (severity, status, ...) are stored as columns."""
     entry = {
         "action": action,
         "actor": actor,
         "target": target,
         "details": details,
-        "timestamp": datetime.datetime.utcnow().isoformat()
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        **fields
     }
     try:
-        supabase.table("audit_log").insert(entry).execute()
+        audit_sink.enqueue(entry)
         return True
     except Exception as e:
         logging.error(f"Failed to log audit entry: {e}")
-        return False
\ No newline at end of file
+        return False
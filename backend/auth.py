@@ -1,41 +1,152 @@
 from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from db import pwd_context, JWT_SECRET, get_user_by_email, create_user
+from db import JWT_SECRET, get_user_by_email, create_user, update_user
+from passwords import password_hasher, HashingPoolBusy
 from models import UserRegisterRequest, UserRegisterResponse, UserLoginRequest, UserLoginResponse
 import jwt
+import os
+import time
+import functools
+import threading
+from collections import OrderedDict
+from typing import Optional
 from datetime import datetime, timedelta
 import warnings
 from pydantic import BaseModel, EmailStr, constr
 import secrets
+import logging
 from audit import log_audit
 
 auth_router = APIRouter()
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
+
+# Authentication is off by default for local development; every request then acts as DEV_USER
+AUTH_ENABLED = os.getenv("AUTH_ENABLED", "false").lower() in ("1", "true", "yes")
+JWT_ALGORITHMS = [a.strip() for a in os.getenv("JWT_ALGORITHMS", "HS256").split(",") if a.strip()]
+JWT_PUBLIC_KEY_PATH = os.getenv("JWT_PUBLIC_KEY_PATH")  # PEM key for RS*/ES* tokens; JWT_SECRET otherwise
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 4096))
+
+# Higher roles satisfy lower requirements; superusers satisfy all
+ROLE_LEVELS = {"viewer": 0, "operator": 1, "admin": 2}
+
+DEV_USER = {
+    "email": "dev@local.test",
+    "id": 1,
+    "role": "admin",
+    "is_superuser": True,
+    "is_active": True,
+    "is_verified": True
+}
+
+@functools.lru_cache(maxsize=1)
+def _verification_key():
+    if JWT_PUBLIC_KEY_PATH:
+        with open(JWT_PUBLIC_KEY_PATH) as f:
+            return f.read()
+    return JWT_SECRET
+
+class TokenCache:
+    """Bounded LRU of verified tokens -> (user claims, expiry timestamp)."""
+    def __init__(self, max_size=AUTH_TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[0]
+
+    def put(self, token, user, exp):
+        with self._lock:
+            self._entries[token] = (user, exp)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
+def _unauthorized(detail):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+def verify_token(token):
+    """Decode and validate a bearer token locally; verified claims are cached until the token expires."""
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    try:
+        claims = jwt.decode(token, _verification_key(), algorithms=JWT_ALGORITHMS, options={"require": ["exp", "sub"]})
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Token expired")
+    except jwt.PyJWTError:
+        raise _unauthorized("Invalid token")
+    if not claims.get("is_active", True):
+        raise _unauthorized("Inactive user")
+    user = {
+        "email": claims["sub"],
+        "id": claims.get("id"),
+        "role": claims.get("role", "viewer"),
+        "is_superuser": bool(claims.get("is_superuser", False)),
+        "is_active": bool(claims.get("is_active", True)),
+        "is_verified": bool(claims.get("is_verified", False)),
+    }
+    token_cache.put(token, user, claims["exp"])
+    return user
 
-# TEMPORARY: Disable authentication for all endpoints during development
-# Restore real auth before production!
 def get_current_user_role(required_role=None):
-    def dependency(request=None):
-        # Return a dummy user with admin role for all requests
-        return {
-            "email": "dev@local.test",
-            "id": 1,
-            "role": "admin",
-            "is_superuser": True,
-            "is_active": True,
-            "is_verified": True
-        }
+    """
+    Dependency factory: verifies the bearer token and enforces `required_role`.
+
+    The set of roles that satisfy the requirement is computed once per route, so each
+    request costs a cache lookup (or one local signature check) and a set membership test.
+    """
+    if required_role is None:
+        allowed = None
+    else:
+        level = ROLE_LEVELS.get(required_role, max(ROLE_LEVELS.values()) + 1)
+        allowed = frozenset(role for role, role_level in ROLE_LEVELS.items() if role_level >= level) | {required_role}
+
+    def dependency(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+        if not AUTH_ENABLED:
+            return DEV_USER
+        if credentials is None or credentials.scheme.lower() != "bearer":
+            raise _unauthorized("Not authenticated")
+        user = verify_token(credentials.credentials)
+        if allowed is not None and not user["is_superuser"] and user["role"] not in allowed:
+            raise HTTPException(status_code=403, detail=f"Requires {required_role} role")
+        return user
     return dependency
 
 class PasswordChangeRequest(BaseModel):
     old_password: constr(min_length=6)
     new_password: constr(min_length=6)
 
+def _hashing_busy():
+    # Shed load instead of queueing logins behind a backlog of bcrypt work
+    return HTTPException(status_code=503, detail="Authentication is busy, please retry shortly", headers={"Retry-After": "1"})
+
+async def hash_password(password):
+    """bcrypt-hash a password on the hashing pool; 503 when the pool is saturated."""
+    try:
+        return await password_hasher.hash(password)
+    except HashingPoolBusy:
+        raise _hashing_busy()
+
 @auth_router.post("/auth/register", response_model=UserRegisterResponse)
 async def register_user(user: UserRegisterRequest):
     email = user.email.lower()
     password = user.password
-    hashed_password = pwd_context.hash(password)
+    hashed_password = await hash_password(password)
     user_dict = {"email": email, "hashed_password": hashed_password, "role": user.role, "is_active": True, "is_superuser": False, "is_verified": False}
     create_user(user_dict)
     return {"message": "User registered"}
@@ -45,8 +156,18 @@ async def login_user(user: UserLoginRequest):
     email = user.email.lower()
     password = user.password
     db_user = get_user_by_email(email)
-    if not db_user or not pwd_context.verify(password, db_user["hashed_password"]):
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(password, db_user and db_user.get("hashed_password"))
+    except HashingPoolBusy:
+        raise _hashing_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Stored hash predates the current BCRYPT_ROUNDS; upgrade it while we have the plaintext
+        try:
+            update_user(db_user["id"], {"hashed_password": new_hash})
+        except Exception as e:
+            logging.warning(f"Could not upgrade password hash for user {db_user['id']}: {e}")
     # Set token expiry: admin/superuser = 10 years, others = 1 hour
     if db_user["role"] == "admin" or db_user["is_superuser"]:
         exp = datetime.utcnow() + timedelta(days=3650)  # 10 years
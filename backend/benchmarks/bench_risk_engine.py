@@ -0,0 +1,50 @@
+"""
+Row-wise vs vectorised rule-based risk scoring.
+
+    cd backend && python benchmarks/bench_risk_engine.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.risk_analyzer import generate_fallback_risk_reports, DELAY_MAP
+from agents.risk_engine import score_pairs, score_batch, columns_from_pairs
+
+def make_pairs(n, seed=0):
+    rng = random.Random(seed)
+    event_types = list(DELAY_MAP) + ["Cyberattack"]
+    severities = ["Low", "Medium", "High"]
+    return [
+        {"shipment": {"product_id": f"P{i}", "criticality_score": rng.randint(0, 100)},
+         "disruption": {"event_type": rng.choice(event_types), "severity": rng.choice(severities)}}
+        for i in range(n)
+    ]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--no-check", action="store_true", help="skip the row-by-row parity check")
+    args = parser.parse_args()
+
+    print(f"{'pairs':>10} {'row-wise s':>11} {'score_pairs s':>14} {'score_batch s':>14} {'speedup':>8} {'batch x':>8}")
+    for n in args.sizes:
+        pairs = make_pairs(n)
+        loop_s, expected = timed(generate_fallback_risk_reports, pairs)
+        pairs_s, reports = timed(score_pairs, pairs)
+        cols = columns_from_pairs(pairs)
+        batch_s, _ = timed(score_batch, cols["criticality"], cols["severity"], cols["event_type"])
+        if not args.no_check:
+            assert reports == expected, "vectorised reports differ from the row-wise engine"
+        print(f"{n:>10} {loop_s:>11.3f} {pairs_s:>14.3f} {batch_s:>14.3f} {loop_s / pairs_s:>7.1f}x {loop_s / batch_s:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
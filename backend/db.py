@@ -1,37 +1,156 @@
 import os
+import threading
 from dotenv import load_dotenv
-from supabase import create_client, Client
 from passlib.context import CryptContext
 
 load_dotenv()
+load_dotenv(dotenv_path=os.path.join("backend", ".env"))
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 JWT_SECRET = os.getenv("JWT_SECRET", "SECRET")
+# "supabase" (default) or "memory" for the in-process fake used in tests and local load runs
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS makes existing hashes "outdated"; they are re-hashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+# Column of the user table holding an account's phone number, if the deployment keeps one (SMS alerts)
+USER_PHONE_COLUMN = os.getenv("USER_PHONE_COLUMN")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# --- Client lifecycle ---
+# One client per process: it owns the HTTP connection pool that every query shares.
+_client = None
+_client_lock = threading.Lock()
 
-# Example CRUD helpers
+def _create_client():
+    if DB_BACKEND == "memory":
+        from fake_db import InMemoryClient
+        return InMemoryClient()
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+def init_db(client=None):
+    """Create the shared client (called on app startup), or install a given one such as InMemoryClient."""
+    global _client
+    with _client_lock:
+        if client is not None:
+            _client = client
+        elif _client is None:
+            _client = _create_client()
+        return _client
+
+def get_client():
+    """Shared client; created on first use when running outside the app (scripts, scheduler jobs)."""
+    return _client if _client is not None else init_db()
+
+def close_db():
+    global _client
+    with _client_lock:
+        _client = None
+
+# --- Users ---
+
+# Columns safe to return from listing endpoints; hashed_password never leaves the data layer
+USER_PUBLIC_COLUMNS = "id,email,role,is_active,is_superuser,is_verified"
 
 def get_all_users():
-    return supabase.table("user").select("*").execute().data
+    return get_client().table("user").select("*").execute().data
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
-def get_user_by_email(email):
-    return supabase.table("user").select("*").eq("email", email).single().execute().data
+def list_users_page(page=1, page_size=20, search=None, columns=USER_PUBLIC_COLUMNS) -> tuple[list, int]:
+    """One page of users ordered by id, optionally filtered by email substring, plus the total match count."""
+    query = get_client().table("user").select(columns, count="exact")
+    if search:
+        query = query.ilike("email", f"%{_escape_like(search)}%")
+    start = (page - 1) * page_size
+    resp = query.order("id").range(start, start + page_size - 1).execute()
+    return resp.data or [], resp.count or 0
+
+def get_user_by_email(email) -> dict | None:
+    rows = get_client().table("user").select("*").eq("email", email).limit(1).execute().data
+    return rows[0] if rows else None
 
 def create_user(user_dict):
-    return supabase.table("user").insert(user_dict).execute().data
+    return get_client().table("user").insert(user_dict).execute().data
+
+def update_user(user_id, fields) -> list:
+    return get_client().table("user").update(fields).eq("id", user_id).execute().data
+
+def delete_user(user_id) -> list:
+    return get_client().table("user").delete().eq("id", user_id).execute().data
+
+def get_user_contacts(user_ids) -> dict:
+    """
+    {user id: {"email": ..., "phone": ...}} for the given accounts, in one query; ids that
+    are not integers are skipped. phone is None unless USER_PHONE_COLUMN is set.
+    """
+    ids = [int(i) for i in user_ids if str(i).isdigit()]
+    if not ids:
+        return {}
+    columns = "id,email" + (f",{USER_PHONE_COLUMN}" if USER_PHONE_COLUMN else "")
+    rows = get_client().table("user").select(columns).in_("id", ids).execute().data or []
+    return {str(r["id"]): {"email": r.get("email"), "phone": r.get(USER_PHONE_COLUMN) if USER_PHONE_COLUMN else None}
+            for r in rows}
+
+def list_user_settings() -> list:
+    return get_client().table("user_settings").select("user_id,settings").execute().data or []
 
-def get_all_shipments():
-    return supabase.table("shipment").select("*").execute().data
+# --- Shipments & vendors ---
+
+def get_all_shipments(columns="*") -> list:
+    return get_client().table("shipment").select(columns).execute().data or []
+
+def get_shipment(product_id) -> dict | None:
+    rows = get_client().table("shipment").select("*").eq("product_id", product_id).limit(1).execute().data
+    return rows[0] if rows else None
 
 def create_shipment(shipment_dict):
-    return supabase.table("shipment").insert(shipment_dict).execute().data
+    return get_client().table("shipment").insert(shipment_dict).execute().data
+
+def update_shipment(product_id, fields) -> list:
+    return get_client().table("shipment").update(fields).eq("product_id", product_id).execute().data
 
-def get_all_vendors():
-    return supabase.table("vendor").select("*").execute().data
+def get_all_vendors() -> list:
+    return get_client().table("vendor").select("*").execute().data or []
 
 def create_vendor(vendor_dict):
-    return supabase.table("vendor").insert(vendor_dict).execute().data
\ No newline at end of file
+    return get_client().table("vendor").insert(vendor_dict).execute().data
+
+# --- Alerts & audit ---
+
+def list_alerts(limit=None, columns="*") -> list:
+    q = get_client().table("alerts").select(columns).order("id", desc=True)
+    if limit:
+        q = q.limit(limit)
+    return q.execute().data or []
+
+def list_alerts_after(alert_id, columns="*", limit=None) -> list:
+    q = get_client().table("alerts").select(columns).gt("id", alert_id).order("id")
+    if limit:
+        q = q.limit(limit)
+    return q.execute().data or []
+
+def get_alerts(ids, columns="*") -> list:
+    if not ids:
+        return []
+    return get_client().table("alerts").select(columns).in_("id", list(ids)).execute().data or []
+
+def insert_alert(alert) -> list:
+    return get_client().table("alerts").insert(alert).execute().data
+
+def update_alert(alert_id, fields) -> list:
+    return get_client().table("alerts").update(fields).eq("id", alert_id).execute().data or []
+
+def alert_exists_for_event(event) -> bool:
+    rows = (get_client().table("alerts").select("id")
+            .eq("event->>event_type", event.get("event_type"))
+            .eq("event->>location", event.get("location"))
+            .eq("event->>timestamp", event.get("timestamp"))
+            .limit(1).execute().data)
+    return bool(rows)
+
+def insert_audit_entries(entries) -> list:
+    return get_client().table("audit_log").insert(entries).execute().data
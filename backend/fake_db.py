@@ -0,0 +1,204 @@
+import copy
+import re
+import threading
+from types import SimpleNamespace
+
+class FakeAPIError(Exception):
+    """Raised where PostgREST would return an error (e.g. single() not matching exactly one row)."""
+
+def _get_path(row, column):
+    # Supports JSON path filters such as "event->>location" used against jsonb columns
+    if "->>" in column or "->" in column:
+        value = row
+        for part in column.replace("->>", "->").split("->"):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    return row.get(column)
+
+def _like(value, pattern, case_insensitive):
+    if value is None:
+        return False
+    # LIKE semantics: % and _ are wildcards, a backslash makes the next character literal
+    regex, chars = [], iter(pattern)
+    for ch in chars:
+        if ch == "\\":
+            regex.append(re.escape(next(chars, "\\")))
+        elif ch == "%":
+            regex.append(".*")
+        elif ch == "_":
+            regex.append(".")
+        else:
+            regex.append(re.escape(ch))
+    flags = re.DOTALL | (re.IGNORECASE if case_insensitive else 0)
+    return re.fullmatch("".join(regex), str(value), flags) is not None
+
+class InMemoryQuery:
+    """Chainable subset of the supabase-py / postgrest query builder."""
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload = None
+        self._on_conflict = None
+        self._count = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._single = False
+
+    # --- operations ---
+    def select(self, columns="*", count=None):
+        self._op, self._columns, self._count = "select", columns, count
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, fields):
+        self._op, self._payload = "update", fields
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # --- filters and modifiers ---
+    def _filter(self, column, predicate):
+        self._filters.append(lambda row: predicate(_get_path(row, column)))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value or (v is not None and str(v) == str(value)))
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        values = list(values)
+        return self._filter(column, lambda v: v in values)
+
+    def like(self, column, pattern):
+        return self._filter(column, lambda v: _like(v, pattern, False))
+
+    def ilike(self, column, pattern):
+        return self._filter(column, lambda v: _like(v, pattern, True))
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        return self.limit(1)
+
+    def execute(self):
+        with self._client._lock:
+            return self._execute(self._client._tables.setdefault(self._table, []))
+
+    def _matches(self, row):
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row):
+        if self._columns.strip() == "*":
+            return copy.deepcopy(row)
+        return {c.strip(): copy.deepcopy(row.get(c.strip())) for c in self._columns.split(",")}
+
+    def _execute(self, rows):
+        if self._op == "insert":
+            data = [self._client._insert(self._table, rows, r) for r in self._as_list(self._payload)]
+            return SimpleNamespace(data=copy.deepcopy(data), count=None)
+        if self._op == "upsert":
+            keys = [k.strip() for k in (self._on_conflict or self._client.primary_keys.get(self._table, "id")).split(",")]
+            data = []
+            for r in self._as_list(self._payload):
+                existing = next((row for row in rows if all(k in r and row.get(k) == r[k] for k in keys)), None)
+                if existing is not None:
+                    existing.update(copy.deepcopy(r))
+                    data.append(existing)
+                else:
+                    data.append(self._client._insert(self._table, rows, r))
+            return SimpleNamespace(data=copy.deepcopy(data), count=None)
+        matched = [row for row in rows if self._matches(row)]
+        if self._op == "update":
+            for row in matched:
+                row.update(copy.deepcopy(self._payload))
+            return SimpleNamespace(data=copy.deepcopy(matched), count=None)
+        if self._op == "delete":
+            self._client._tables[self._table] = [row for row in rows if not self._matches(row)]
+            return SimpleNamespace(data=copy.deepcopy(matched), count=None)
+        total = len(matched)
+        for column, desc in reversed(self._order):
+            matched.sort(key=lambda row: (_get_path(row, column) is None, _get_path(row, column)), reverse=desc)
+        end = None if self._limit is None else self._offset + self._limit
+        data = [self._project(row) for row in matched[self._offset:end]]
+        if self._single:
+            if len(data) != 1:
+                raise FakeAPIError(f"single() expected 1 row from {self._table}, got {len(data)}")
+            data = data[0]
+        return SimpleNamespace(data=data, count=total if self._count else None)
+
+    @staticmethod
+    def _as_list(payload):
+        return payload if isinstance(payload, list) else [payload]
+
+class InMemoryClient:
+    """
+    Thread-safe in-memory stand-in for the Supabase client.
+
+    Implements the query-builder calls this codebase uses so the data-access layer
+    and routes can run in tests or local load runs without a database.
+    """
+    def __init__(self, tables=None, primary_keys=None):
+        self._lock = threading.RLock()
+        self._tables = {name: copy.deepcopy(rows) for name, rows in (tables or {}).items()}
+        self._next_id = {}
+        # Conflict targets for upsert() without on_conflict, as declared in schema.sql
+        self.primary_keys = {"user_settings": "user_id", "risk_disruptions": "key",
+                             "risk_exposures": "disruption_key,product_id", **(primary_keys or {})}
+
+    def table(self, name):
+        return InMemoryQuery(self, name)
+
+    def rows(self, name):
+        """Direct snapshot of a table, for test assertions."""
+        with self._lock:
+            return copy.deepcopy(self._tables.get(name, []))
+
+    def _insert(self, table, rows, row):
+        row = copy.deepcopy(row)
+        if "id" not in row:
+            next_id = self._next_id.get(table) or (max((r.get("id") or 0 for r in rows if isinstance(r.get("id"), int)), default=0) + 1)
+            row["id"] = next_id
+            self._next_id[table] = next_id + 1
+        rows.append(row)
+        return row
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+# "single": API, scheduler and agent work share one process (development default).
+# "api": endpoints enqueue agent work and the scheduler is left to workers; "worker": see worker.py
+PROCESS_MODE = os.getenv("PROCESS_MODE", "single").lower()
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(os.path.dirname(__file__), "logs", "jobs.sqlite3"))
+# A running job's worker touches heartbeat_at every JOB_HEARTBEAT_SECONDS; no heartbeat for
+# JOB_TIMEOUT_SECONDS means the worker is presumed dead, however long the job itself runs
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 2))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 86400))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", 60))  # cap on ?wait= for queued endpoints
+JOB_WAIT_POLL_SECONDS = 0.25
+
+logger = logging.getLogger(__name__)
+
+# kind -> callable(payload) returning a JSON-serialisable result
+JOB_HANDLERS = {}
+
+def job_handler(kind):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    actor TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_id ON jobs (status, id);
+"""
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite file shared by the API and worker processes.
+
+    Each call opens its own short-lived connection, so the queue is safe across
+    processes; claim() takes the oldest queued job under an IMMEDIATE transaction so
+    two workers never get the same one. The worker running a job sends heartbeat()s; a
+    job whose heartbeat is older than JOB_TIMEOUT_SECONDS is re-queued (up to
+    JOB_MAX_ATTEMPTS) on the assumption its worker died.
+    """
+    def __init__(self, path=JOB_QUEUE_PATH, timeout=JOB_TIMEOUT_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if "heartbeat_at" not in {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")  # queue files from before heartbeats
+            self._ready = True
+        return conn
+
+    @contextmanager
+    def _session(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind, payload, actor=None):
+        with self._session() as conn:
+            cur = conn.execute("INSERT INTO jobs (kind, payload, actor, created_at) VALUES (?, ?, ?, ?)",
+                               (kind, json.dumps(payload, default=str), actor, time.time()))
+            return cur.lastrowid
+
+    def claim(self, worker):
+        """Oldest queued job as a dict (status now 'running'), or None."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute("UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, "
+                         "attempts = attempts + 1 WHERE id = ?", (worker, now, now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id, worker):
+        """Mark `worker` as still running the job; False if the job is no longer its to run."""
+        with self._session() as conn:
+            return conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                                (time.time(), job_id, worker)).rowcount == 1
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "done", result=json.dumps(result, default=str))
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", error=str(error))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._session() as conn:
+            conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (status, result, error, time.time(), job_id))
+
+    def get(self, job_id):
+        with self._session() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def requeue_stale(self):
+        """Re-queue jobs whose worker stopped sending heartbeats; fail those out of attempts. Returns how many were re-queued."""
+        cutoff = time.time() - self.timeout
+        stale = "status = 'running' AND COALESCE(heartbeat_at, started_at) < ?"
+        with self._session() as conn:
+            conn.execute(f"UPDATE jobs SET status = 'failed', error = 'worker timed out', finished_at = ? "
+                         f"WHERE {stale} AND attempts >= ?", (time.time(), cutoff, self.max_attempts))
+            return conn.execute(f"UPDATE jobs SET status = 'queued', worker = NULL WHERE {stale}", (cutoff,)).rowcount
+
+    def prune(self, older_than=JOB_RETENTION_SECONDS):
+        with self._session() as conn:
+            return conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                                (time.time() - older_than,)).rowcount
+
+    def counts(self):
+        with self._session() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+            oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, **{r["status"]: r["n"] for r in rows}}
+        counts["oldest_queued_age_s"] = round(time.time() - oldest, 1) if oldest else 0.0
+        return counts
+
+def run_job(job):
+    """Execute a claimed job with its registered handler; returns (ok, result or error)."""
+    handler = JOB_HANDLERS.get(job["kind"])
+    if handler is None:
+        return False, f"No handler for job kind {job['kind']!r}"
+    try:
+        return True, handler(job["payload"])
+    except Exception as e:
+        logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        return False, e
+
+job_queue = JobQueue()
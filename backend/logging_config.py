@@ -1,27 +1,83 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 import sys
 import json
 
-def setup_logging():
-    log_dir = os.path.join(os.path.dirname(__file__), 'logs')
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_TO_STDOUT = os.getenv("LOG_TO_STDOUT", "true").lower() in ("1", "true", "yes")
+
+# Attributes every LogRecord has; anything else was passed via extra= and is emitted as a field
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_queue_handler = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra= fields (e.g. event, http) are included as-is."""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'funcName': record.funcName,
+            'lineno': record.lineno,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records as they are. The stock prepare() formats the message and traceback on
+    the calling thread and drops exc_info; here the listener thread does all formatting.
+    """
+    def prepare(self, record):
+        return record
+
+def setup_logging(log_dir=None):
+    """
+    Route all logging through a QueueHandler so request/agent threads only enqueue
+    records; a QueueListener thread does the formatting and the rotating-file and
+    stdout I/O. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    log_dir = log_dir or os.path.join(os.path.dirname(__file__), 'logs')
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, 'supplywhiz.log')
+    formatter = JsonFormatter()
     handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=5)
-    formatter = logging.Formatter(json.dumps({
-        'time': '%(asctime)s',
-        'level': '%(levelname)s',
-        'module': '%(module)s',
-        'funcName': '%(funcName)s',
-        'lineno': '%(lineno)d',
-        'message': '%(message)s'
-    }))
     handler.setFormatter(formatter)
+    handlers = [handler]
+    if LOG_TO_STDOUT:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    _queue_handler = DeferredQueueHandler(log_queue)
     root = logging.getLogger()
-    root.setLevel(logging.INFO)
-    root.addHandler(handler)
-    # Also log to stdout
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setFormatter(formatter)
-    root.addHandler(stream_handler) 
\ No newline at end of file
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_queue_handler)
+
+def shutdown_logging():
+    """Detach the queue handler and stop the listener once it has written every queued record."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()  # drains the queue before returning
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _queue_handler = None
@@ -1,47 +1,112 @@
-from fastapi import Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 import logging
-import traceback
+import os
+import random
 import time
+import uuid
+
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", 0.1))
+REQUEST_LOG_BODY_MAX_BYTES = int(os.getenv("REQUEST_LOG_BODY_MAX_BYTES", 1024))
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", 1000))
+REQUEST_LOG_REDACT_HEADERS = os.getenv(
+    "REQUEST_LOG_REDACT_HEADERS", "authorization,cookie,set-cookie,proxy-authorization,x-api-key"
+)
+# Only textual payloads are worth capturing; uploads and binary bodies are never teed
+_LOGGABLE_BODY_TYPES = ("application/json", "application/x-www-form-urlencoded", "text/")
+
+logger = logging.getLogger("supplywhiz.requests")
+
+class RequestLoggingMiddleware:
+    """
+    Pure ASGI request logger.
+
+    Every request is timed, but headers and a size-capped body prefix are only
+    captured for a random sample (plus all 5xx and slow requests). The body is
+    teed from the receive stream as the app reads it, so large uploads are never
+    buffered on the logger's behalf. Unhandled exceptions become a 500 response.
+    """
+    def __init__(self, app, sample_rate=REQUEST_LOG_SAMPLE_RATE, body_max_bytes=REQUEST_LOG_BODY_MAX_BYTES,
+                 slow_ms=REQUEST_LOG_SLOW_MS, redact_headers=REQUEST_LOG_REDACT_HEADERS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.body_max_bytes = body_max_bytes
+        self.slow_ms = slow_ms
+        if isinstance(redact_headers, str):
+            redact_headers = redact_headers.split(",")
+        self.redact_headers = {h.strip().lower() for h in redact_headers if h.strip()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        headers = scope.get("headers") or []
+        body = bytearray()
+        response = {"status": None}
+
+        if sampled and self.body_max_bytes > 0 and self._body_loggable(headers):
+            async def receive_wrapper():
+                message = await receive()
+                if message["type"] == "http.request" and len(body) < self.body_max_bytes:
+                    body.extend(message.get("body", b"")[: self.body_max_bytes - len(body)])
+                return message
+        else:
+            receive_wrapper = receive
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        logger = logging.getLogger()
-        logger.info(f"Request: {request.method} {request.url}")
-        print(f"Request: {request.method} {request.url}")
         try:
-            response = await call_next(request)
-            logger.info(f"Response: {response.status_code} {request.method} {request.url}")
-            print(f"Response: {response.status_code} {request.method} {request.url}")
-            return response
-        except Exception as exc:
-            logger.error(f"Exception: {exc}\n{traceback.format_exc()}")
-            print(f"Exception: {exc}\n{traceback.format_exc()}")
-            return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
-
-# Add detailed request/response logging middleware
-class DetailedRequestResponseLogger(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        idem = f"{time.time()}-{request.method}-{request.url}"
-        logging.info(f"[REQUEST] {idem} path={request.url.path} query={request.url.query} headers={dict(request.headers)}")
-        print(f"[REQUEST] {idem} path={request.url.path} query={request.url.query} headers={dict(request.headers)}")
-        body = await request.body()
-        logging.info(f"[REQUEST BODY] {idem} body={body.decode(errors='replace')}")
-        print(f"[REQUEST BODY] {idem} body={body.decode(errors='replace')}")
-        response = await call_next(request)
-        logging.info(f"[RESPONSE] {idem} status={response.status_code}")
-        print(f"[RESPONSE] {idem} status={response.status_code}")
-        return response
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            logger.exception("Unhandled exception: %s %s", scope.get("method"), scope.get("path"))
+            if response["status"] is not None:
+                raise
+            await JSONResponse(status_code=500, content={"detail": "Internal Server Error"})(scope, receive, send_wrapper)
+        finally:
+            self._log(scope, headers, body, response["status"], (time.perf_counter() - start) * 1000, sampled)
+
+    def _body_loggable(self, headers):
+        for name, value in headers:
+            if name == b"content-type":
+                return value.decode("latin-1").lower().startswith(_LOGGABLE_BODY_TYPES)
+        return False
+
+    def _log(self, scope, headers, body, status, duration_ms, sampled):
+        status = status or 500
+        slow = duration_ms >= self.slow_ms
+        if not (sampled or slow or status >= 500):
+            return
+        fields = {
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "status": status,
+            "duration_ms": round(duration_ms, 1),
+            "client": (scope.get("client") or (None,))[0],
+            "sampled": sampled,
+        }
+        if sampled:
+            fields["request_id"] = uuid.uuid4().hex[:12]
+            fields["headers"] = {
+                name.decode("latin-1"): "[REDACTED]" if name.decode("latin-1").lower() in self.redact_headers else value.decode("latin-1")
+                for name, value in headers
+            }
+            if body:
+                fields["body"] = body.decode(errors="replace")
+        level = logging.ERROR if status >= 500 else logging.WARNING if slow else logging.INFO
+        logger.log(level, "%s %s %s %.1fms", fields["method"], fields["path"], status, duration_ms, extra={"http": fields})
 
 def add_middlewares(app):
-    app.add_middleware(LoggingMiddleware)
-    app.add_middleware(DetailedRequestResponseLogger)
+    app.add_middleware(RequestLoggingMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-    ) 
\ No newline at end of file
+    )
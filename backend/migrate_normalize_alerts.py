@@ -0,0 +1,86 @@
+"""
+Normalise alert rows so each alert carries only the risk reports and action plans of
+its own event.
+
+Older rows stored the whole batch (every report and plan for every disruption analysed
+together) on each alert. Reports that already carry a disruption_key are kept when it
+matches the alert's event. Legacy reports without one are attributed by checking whether
+the event's location reaches the product's shipment (name or route match, as in
+analyze_risk). Action plans follow the reports kept; an alert without reports keeps
+its plans. Duplicate (disruption, product) reports and plans are stored once. Rows where
+no report can be attributed are left untouched and listed.
+
+    cd backend && python migrate_normalize_alerts.py           # dry run
+    cd backend && python migrate_normalize_alerts.py --apply   # write changes
+"""
+import argparse
+import json
+from db import init_db, list_alerts, update_alert, get_all_shipments
+from utils.route_geometry import LocationNameIndex, RouteIndex
+from agents.risk_analyzer import PROXIMITY_RADIUS_KM, disruption_key
+
+def normalize_alert(alert, name_index, route_index):
+    """Return the alert's normalised (risk_report, action_plan), or None if nothing can be attributed."""
+    event = alert.get("event") or {}
+    key = disruption_key(event)
+    reports = [r for r in alert.get("risk_report") or [] if isinstance(r, dict)]
+    if any(r.get("disruption_key") for r in reports):
+        own = [r for r in reports if r.get("disruption_key") == key]
+    else:
+        reachable = {str(pid) for pid in name_index.query(event.get("location"))}
+        reachable |= {str(pid) for pid in route_index.query_disruption(event, PROXIMITY_RADIUS_KM)}
+        own = [r for r in reports if str(r.get("product_id")) in reachable]
+    if reports and not own:
+        return None
+    kept, seen = [], set()
+    for report in own:
+        product_id = str(report.get("product_id"))
+        if product_id not in seen:
+            seen.add(product_id)
+            kept.append({**report, "disruption_key": key})
+    plans, seen_plans = [], set()
+    for plan in alert.get("action_plan") or []:
+        if not isinstance(plan, dict):
+            continue
+        product_id = str(plan.get("product_id"))
+        # Without reports there is nothing to match plans against, so they are all kept
+        attributed = product_id in seen or not reports
+        if attributed and product_id not in seen_plans and plan.get("disruption_key") in (None, key):
+            seen_plans.add(product_id)
+            plans.append({**plan, "disruption_key": key})
+    return kept, plans
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep only each alert's own risk reports and action plans.")
+    parser.add_argument("--apply", action="store_true", help="write changes (default is a dry run)")
+    args = parser.parse_args()
+
+    init_db()
+    shipments = get_all_shipments()
+    name_index = LocationNameIndex.from_shipments(shipments)
+    route_index = RouteIndex.from_shipments(shipments)
+
+    changed = unresolved = 0
+    bytes_before = bytes_after = 0
+    for alert in list_alerts(columns="id,event,risk_report,action_plan"):
+        if alert.get("id") is None:
+            continue
+        before = {"risk_report": alert.get("risk_report") or [], "action_plan": alert.get("action_plan") or []}
+        result = normalize_alert(alert, name_index, route_index)
+        if result is None:
+            unresolved += 1
+            print(f"Unresolved: alert {alert.get('id')} ({disruption_key(alert.get('event') or {})})")
+            continue
+        after = {"risk_report": result[0], "action_plan": result[1]}
+        bytes_before += len(json.dumps(before, default=str))
+        bytes_after += len(json.dumps(after, default=str))
+        if after != before:
+            changed += 1
+            if args.apply:
+                update_alert(alert["id"], after)
+    mode = "Updated" if args.apply else "Would update"
+    print(f"{mode} {changed} alerts; {unresolved} left untouched. "
+          f"Report/plan payload: {bytes_before} -> {bytes_after} bytes.")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 
 class UserRegisterRequest(BaseModel):
     email: EmailStr
@@ -62,4 +62,24 @@ class GenAIPlanRequest(BaseModel):
     risk_report: List[Dict[str, Any]]
 
 class GenAIPlanResponse(BaseModel):
-    action_plan: List[Dict[str, Any]]
\ No newline at end of file
+    action_plan: List[Dict[str, Any]]
+
+# Item schemas for LLM output; extra keys are tolerated and kept by agents/llm_json.py
+class RiskReportItem(BaseModel):
+    product_id: Union[str, int]
+    disruption_key: Optional[str] = None
+    risk_score: float
+    impact_level: Optional[str] = None
+    delay_estimate: Optional[Union[str, int, float]] = None
+    cost_impact: Optional[Union[float, str]] = None
+    escalation: Optional[Any] = None
+    summary: Optional[str] = None
+
+class ActionPlanItem(BaseModel):
+    product_id: Union[str, int]
+    recommended_actions: List[str]
+    responsible_party: Optional[str] = None
+    priority: Optional[str] = None
+    escalation: Optional[Any] = None
+    summary: Optional[str] = None
+    risk_score: Optional[float] = None
@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db import pwd_context
+
+# bcrypt releases the GIL, so a small thread pool hashes in parallel without blocking the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hash/verify calls allowed to wait or run at once; beyond this callers get HashingPoolBusy
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+logger = logging.getLogger(__name__)
+
+class HashingPoolBusy(RuntimeError):
+    """Raised when the hashing queue is full; callers should answer 503 and let the client retry."""
+
+class PasswordHasher:
+    """
+    Runs bcrypt hash/verify on a dedicated, size-limited thread pool.
+
+    The pool has `workers` threads and admits at most `max_pending` calls (running plus
+    queued); queue depth, wait and run times are tracked for the admin metrics endpoint.
+    """
+    def __init__(self, context=pwd_context, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._stats = {"completed": 0, "rejected": 0, "rehashed": 0, "max_pending_seen": 0,
+                       "wait_seconds_total": 0.0, "run_seconds_total": 0.0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise HashingPoolBusy(f"Password hashing queue is full ({self.max_pending} pending)")
+            self._pending += 1
+            self._stats["max_pending_seen"] = max(self._stats["max_pending_seen"], self._pending)
+
+    def _timed(self, submitted, fn, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._stats["wait_seconds_total"] += started - submitted
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats["run_seconds_total"] += time.perf_counter() - started
+
+    async def _run(self, fn, *args):
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), self._timed, time.perf_counter(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._stats["completed"] += 1
+
+    async def hash(self, password):
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, hashed):
+        if not hashed:
+            return False
+        return await self._run(self.context.verify, password, hashed)
+
+    async def verify_and_update(self, password, hashed):
+        """(valid, new_hash): new_hash is set when the stored hash uses outdated settings and should be replaced."""
+        if not hashed:
+            return False, None
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if new_hash:
+            with self._lock:
+                self._stats["rehashed"] += 1
+        return valid, new_hash
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            done = stats["completed"] or 1
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                **stats,
+                "avg_wait_ms": round(1000 * stats["wait_seconds_total"] / done, 2),
+                "avg_run_ms": round(1000 * stats["run_seconds_total"] / done, 2),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+from typing import Optional
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials
+import auth
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Per-route limits as "name=N/unit,..."; routes opt in with Depends(rate_limit("name"))
+RATE_LIMITS = os.getenv(
+    "RATE_LIMITS",
+    "chat=20/minute,explain_risk=30/minute,genai_plan=10/minute,simulate_disruptions=5/minute,"
+    "process_all_disruptions=2/minute,limited_healthz=5/minute",
+)
+# Per-user or per-role overrides, JSON: {"ops@corp.com": {"chat": "100/minute"}, "role:admin": {"chat": "60/minute"}}
+RATE_LIMIT_OVERRIDES = os.getenv("RATE_LIMIT_OVERRIDES", "")
+# Share of a bucket a process takes from the shared store at once; later hits are served locally
+RATE_LIMIT_LEASE_FRACTION = float(os.getenv("RATE_LIMIT_LEASE_FRACTION", 0.1))
+RATE_LIMIT_MAX_LEASES = int(os.getenv("RATE_LIMIT_MAX_LEASES", 10000))  # expired leases are pruned past this many keys
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 10000))  # in-process buckets; refilled ones are pruned past this
+# After the shared store fails, hits go straight to per-process buckets for this long (doubling up to the max)
+RATE_LIMIT_STORE_BACKOFF = float(os.getenv("RATE_LIMIT_STORE_BACKOFF", 1.0))
+RATE_LIMIT_STORE_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_STORE_MAX_BACKOFF", 60.0))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.25))  # seconds; a hung Redis must not stall requests
+
+logger = logging.getLogger(__name__)
+
+Rate = namedtuple("Rate", "capacity per_seconds")
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_rate(spec):
+    """'10/minute' or '10 per minute' -> Rate(10, 60)."""
+    count, _, unit = spec.replace(" per ", "/").partition("/")
+    unit = unit.strip().lower().rstrip("s")
+    if unit not in _UNITS:
+        raise ValueError(f"Unknown rate limit unit in {spec!r}")
+    return Rate(int(count), _UNITS[unit])
+
+def parse_limits(spec):
+    limits = {}
+    for part in (spec or "").split(","):
+        if part.strip():
+            name, _, rate = part.partition("=")
+            limits[name.strip()] = parse_rate(rate)
+    return limits
+
+def parse_overrides(spec):
+    if not spec:
+        return {}
+    return {who: {name: parse_rate(rate) for name, rate in routes.items()} for who, routes in json.loads(spec).items()}
+
+class MemoryBucketStore:
+    """
+    Shared token buckets for a single process; stands in for Redis when REDIS_URL is unset.
+    A bucket that has refilled to capacity is the same as no bucket, so once there are
+    more than max_buckets keys those are dropped.
+    """
+    def __init__(self, max_buckets=RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}  # key -> (tokens, last refill time, time it is full again)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, want, rate, now=None):
+        """Take up to `want` tokens; returns (granted, seconds until one token is available)."""
+        now = time.time() if now is None else now
+        refill = rate.capacity / rate.per_seconds
+        with self._lock:
+            tokens, last, _ = self._buckets.get(key, (rate.capacity, now, now))
+            tokens = min(rate.capacity, tokens + (now - last) * refill)
+            granted = min(want, int(tokens))
+            if key not in self._buckets and len(self._buckets) >= self.max_buckets:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+            self._buckets[key] = (tokens - granted, now, now + (rate.capacity - tokens + granted) / refill)
+        return granted, 0.0 if granted else (1 - tokens) / refill
+
+# KEYS[1] bucket; ARGV: want, capacity, refill per second, now. Returns {granted, retry after in ms}
+_TAKE_SCRIPT = """
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local capacity, refill, now = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+local granted = math.min(tonumber(ARGV[1]), math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+if granted > 0 then return {granted, 0} end
+return {0, math.ceil((1 - tokens) / refill * 1000)}
+"""
+
+class RedisBucketStore:
+    """Token buckets in Redis, updated atomically by a Lua script, so all workers and replicas share them."""
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=REDIS_SOCKET_TIMEOUT,
+                                            socket_connect_timeout=REDIS_SOCKET_TIMEOUT)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, want, rate, now=None):
+        now = time.time() if now is None else now
+        granted, retry_ms = self._take(keys=[self.prefix + key], args=[want, rate.capacity, rate.capacity / rate.per_seconds, now])
+        return int(granted), int(retry_ms) / 1000
+
+class RateLimiter:
+    """
+    Token buckets with a local fast path.
+
+    Each process leases a slice of a bucket (RATE_LIMIT_LEASE_FRACTION of its capacity)
+    from the shared store and spends it locally, so most hits never leave the process and
+    the cluster as a whole never grants more than the shared bucket holds. A lease lapses
+    after the time the bucket needs to refill it, so idle processes do not hoard tokens.
+    If the shared store fails, limits fall back to per-process buckets and the store is
+    only tried again after a back-off that doubles while it keeps failing.
+    """
+    def __init__(self, store=None, lease_fraction=RATE_LIMIT_LEASE_FRACTION, max_leases=RATE_LIMIT_MAX_LEASES,
+                 backoff=RATE_LIMIT_STORE_BACKOFF, max_backoff=RATE_LIMIT_STORE_MAX_BACKOFF):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.lease_fraction = lease_fraction
+        self.max_leases = max_leases
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._fallback = None
+        self._next_backoff = backoff
+        self._store_retry_at = None  # while set, the store is skipped until this time
+        self._leases = {}  # key -> [tokens left, expires at]
+        self._lock = threading.Lock()
+        self._stats = {"allowed": 0, "rejected": 0, "store_calls": 0, "store_errors": 0}
+
+    def _lease_size(self, rate):
+        return max(1, int(rate.capacity * self.lease_fraction))
+
+    def _take(self, key, want, rate, now):
+        with self._lock:
+            skip_store = self._store_retry_at is not None and now < self._store_retry_at
+        if not skip_store:
+            try:
+                result = self.store.take(key, want, rate, now)
+                with self._lock:
+                    self._store_retry_at, self._next_backoff = None, self.backoff
+                return result
+            except Exception as e:
+                with self._lock:
+                    self._stats["store_errors"] += 1
+                    if self._fallback is None:
+                        logger.warning(f"Rate limit store unavailable, limiting per process: {e}")
+                        self._fallback = MemoryBucketStore()
+                    self._store_retry_at = now + self._next_backoff
+                    self._next_backoff = min(self.max_backoff, self._next_backoff * 2)
+        return self._fallback.take(key, want, rate, now)
+
+    def _spend(self, key, now):
+        lease = self._leases.get(key)
+        if lease is None or lease[0] <= 0 or lease[1] <= now:
+            return False
+        lease[0] -= 1
+        self._stats["allowed"] += 1
+        return True
+
+    def hit(self, key, rate, now=None):
+        """Spend one token; returns (allowed, retry after seconds)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._spend(key, now):
+                return True, 0.0
+            self._stats["store_calls"] += 1
+        # The shared store is called without holding the lock, so a slow store only delays this key's callers
+        size = self._lease_size(rate)
+        granted, retry_after = self._take(key, size, rate, now)
+        with self._lock:
+            if not granted:
+                if self._spend(key, now):  # another thread renewed the lease meanwhile
+                    return True, 0.0
+                self._stats["rejected"] += 1
+                return False, retry_after
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] > 0 and lease[1] > now:
+                lease[0] += granted
+            else:
+                if len(self._leases) >= self.max_leases:
+                    self._leases = {k: v for k, v in self._leases.items() if v[0] > 0 and v[1] > now}
+                self._leases[key] = [granted, now + size * rate.per_seconds / rate.capacity]
+            self._spend(key, now)
+            return True, 0.0
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, "leases": len(self._leases), "store": type(self.store).__name__}
+
+def _default_store():
+    if REDIS_URL:
+        try:
+            return RedisBucketStore(REDIS_URL)
+        except Exception as e:
+            logger.warning(f"Redis rate limit store unavailable ({e}); using in-process buckets")
+    return MemoryBucketStore()
+
+route_limits = parse_limits(RATE_LIMITS)
+limit_overrides = parse_overrides(RATE_LIMIT_OVERRIDES)
+limiter = RateLimiter(_default_store())
+
+def _caller(request, credentials):
+    """The authenticated user if the token verifies, otherwise None (callers are then keyed by IP)."""
+    if not auth.AUTH_ENABLED or credentials is None:
+        return None
+    try:
+        return auth.verify_token(credentials.credentials)
+    except HTTPException:
+        return None
+
+def limit_for(name, user):
+    if user:
+        for who in (user.get("email"), f"role:{user.get('role')}"):
+            rate = limit_overrides.get(who, {}).get(name)
+            if rate:
+                return rate
+    return route_limits.get(name)
+
+def rate_limit(name):
+    """
+    Dependency factory: limits calls to the routes sharing `name` per user (per client IP
+    for unauthenticated calls). Answers 429 with Retry-After once the bucket is empty.
+    """
+    def dependency(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(auth.security)):
+        if not RATE_LIMIT_ENABLED:
+            return
+        user = _caller(request, credentials)
+        rate = limit_for(name, user)
+        if rate is None:
+            return
+        if user:
+            identity = f"user:{user.get('id') or user.get('email')}"
+        else:
+            identity = f"ip:{request.client.host if request.client else 'unknown'}"
+        allowed, retry_after = limiter.hit(f"{name}:{identity}", rate)
+        if not allowed:
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded: {rate.capacity} per {rate.per_seconds}s",
+                                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+    return dependency
@@ -1,30 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, Body, Query
 from audit import log_audit
-from db import get_all_users, create_user
+from db import get_client, list_users_page, create_user, update_user, delete_user
 import os
 import json
+import asyncio
 from typing import Optional
-from auth import get_current_user_role
-from supabase import create_client
+from auth import get_current_user_role, hash_password
+from passwords import password_hasher
+from ratelimit import limiter
+from utils.alert_rules import alert_router
+from utils.notifications import notification_dispatcher
+from scheduler import disruption_scheduler
+from jobs import PROCESS_MODE, job_queue
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 admin_router = APIRouter()
 
 @admin_router.get("/admin/users/")
 async def list_users(user=Depends(get_current_user_role("admin")), page: int = Query(1, ge=1), page_size: int = Query(20, ge=1, le=100), search: str = Query(None)):
     print("[API] /admin/users/ called")
-    users = get_all_users()
-    if search:
-        users = [u for u in users if search.lower() in u["email"].lower()]
-    total = len(users)
-    start = (page - 1) * page_size
-    end = start + page_size
-    return {"users": users[start:end], "total": total, "page": page, "page_size": page_size}
+    users, total = list_users_page(page, page_size, search)
+    return {"users": users, "total": total, "page": page, "page_size": page_size}
 
 # TODO: Refactor update_user and delete_user to use Supabase
 
@@ -37,23 +35,21 @@ async def create_user_endpoint(user_data: dict = Body(...), user=Depends(get_cur
         if field not in user_data:
             raise HTTPException(status_code=400, detail=f"Missing required field: {field}")
     # Hash password
-    from db import pwd_context
-    user_data["hashed_password"] = pwd_context.hash(user_data.pop("password"))
+    user_data["hashed_password"] = await hash_password(user_data.pop("password"))
     user_data["is_active"] = user_data.get("is_active", True)
     user_data["is_superuser"] = user_data.get("is_superuser", False)
     user_data["is_verified"] = user_data.get("is_verified", False)
     # Insert into Supabase
-    result = supabase.table("user").insert(user_data).execute().data
+    result = create_user(user_data)
     return {"user": result}
 
 @admin_router.put("/admin/users/{user_id}")
 async def update_user_endpoint(user_id: str, update_data: dict = Body(...), user=Depends(get_current_user_role("admin"))):
     """Update an existing user (admin only)."""
+    if "password" in update_data:
+        update_data["hashed_password"] = await hash_password(update_data.pop("password"))
     try:
-        if "password" in update_data:
-            from db import pwd_context
-            update_data["hashed_password"] = pwd_context.hash(update_data.pop("password"))
-        result = supabase.table("user").update(update_data).eq("id", user_id).execute().data
+        result = update_user(user_id, update_data)
         if not result:
             raise HTTPException(status_code=404, detail="User not found or update failed")
         return {"user": result}
@@ -65,12 +61,37 @@ async def update_user_endpoint(user_id: str, update_data: dict = Body(...), user
 @admin_router.delete("/admin/users/{user_id}")
 async def delete_user_endpoint(user_id: str, user=Depends(get_current_user_role("admin"))):
     """Delete a user (admin only)."""
-    result = supabase.table("user").delete().eq("id", user_id).execute().data
+    result = delete_user(user_id)
     if not result:
         raise HTTPException(status_code=404, detail="User not found or delete failed")
     return {"deleted": True, "user_id": user_id}
 
 @admin_router.get("/admin/audit_log/")
 async def get_audit_log(user=Depends(get_current_user_role("admin"))):
-    logs = supabase.table("audit_log").select("*").order("timestamp", desc=True).limit(100).execute().data or []
-    return {"logs": logs} 
\ No newline at end of file
+    logs = get_client().table("audit_log").select("*").order("timestamp", desc=True).limit(100).execute().data or []
+    return {"logs": logs}
+
+@admin_router.get("/admin/metrics/password_hashing")
+async def password_hashing_metrics(user=Depends(get_current_user_role("admin"))):
+    """Queue depth and timings of the bcrypt hashing pool."""
+    return password_hasher.metrics()
+
+@admin_router.get("/admin/metrics/rate_limits")
+async def rate_limit_metrics(user=Depends(get_current_user_role("admin"))):
+    """Hits allowed and rejected, and how often the shared bucket store was consulted."""
+    return limiter.metrics()
+
+@admin_router.get("/admin/metrics/notifications")
+async def notification_metrics(user=Depends(get_current_user_role("admin"))):
+    """Alert fan-out and notification delivery counters."""
+    return {"routing": alert_router.metrics(), "delivery": notification_dispatcher.metrics()}
+
+@admin_router.get("/admin/metrics/scheduler")
+async def scheduler_metrics(user=Depends(get_current_user_role("admin"))):
+    """Leadership, interval, run durations and backlog of the disruption check in this process."""
+    return disruption_scheduler.metrics()
+
+@admin_router.get("/admin/metrics/jobs")
+async def job_metrics(user=Depends(get_current_user_role("admin"))):
+    """Agent job queue depth by status (PROCESS_MODE=api with worker.py)."""
+    return {"process_mode": PROCESS_MODE, **await asyncio.to_thread(job_queue.counts)}
@@ -1,15 +1,15 @@
-from fastapi import APIRouter, Body, WebSocket, WebSocketDisconnect, Query
-from supabase import create_client
+from fastapi import APIRouter, Body, Depends, WebSocket, WebSocketDisconnect, Query, HTTPException
 import os
 import asyncio
 import random
 from datetime import datetime
 from dotenv import load_dotenv
+from db import get_client
+from auth import get_current_user_role
+from utils.alert_rules import alert_router
+from utils.timeseries import downsample, parse_columns
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 analytics_router = APIRouter()
 
@@ -19,7 +19,7 @@ user_settings_store = {}
 @analytics_router.get("/analytics/risk_categories/")
 async def get_risk_categories():
     try:
-        resp = supabase.table("risk_categories").select("*").execute()
+        resp = get_client().table("risk_categories").select("*").execute()
         return {"categories": resp.data or []}
     except Exception as e:
         import logging
@@ -29,7 +29,7 @@ async def get_risk_categories():
 @analytics_router.get("/analytics/shipment_volume/")
 async def get_shipment_volume():
     try:
-        resp = supabase.table("shipment_volume").select("*").execute()
+        resp = get_client().table("shipment_volume").select("*").execute()
         return {"volume": resp.data or []}
     except Exception as e:
         import logging
@@ -38,28 +38,93 @@ async def get_shipment_volume():
 
 @analytics_router.get("/analytics/on_time_delivery/")
 async def get_on_time_delivery():
-    resp = supabase.table("analytics_metrics").select("on_time_delivery").order("timestamp", desc=True).limit(1).execute()
+    resp = get_client().table("analytics_metrics").select("on_time_delivery").order("timestamp", desc=True).limit(1).execute()
     if resp.data and len(resp.data) > 0:
         return {"on_time_delivery": resp.data[0].get("on_time_delivery", 0)}
     return {"on_time_delivery": 0}
 
 # --- Performance Metrics (extend as needed) ---
+# Bucketed series read their whole range in pages of this size; keep it at or below the
+# PostgREST max-rows setting (1000 by default), which caps every single select
+ANALYTICS_PAGE_SIZE = int(os.getenv("ANALYTICS_PAGE_SIZE", 1000))
+
+def _columns(spec, default=()):
+    try:
+        return parse_columns(spec) or list(default)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _time_range(table, columns, start, end, paged=False, **filters):
+    """
+    Rows of `table` with only `columns`, within [start, end] and matching filters: newest
+    first from a single request, or with paged=True every row of the range, oldest first,
+    read ANALYTICS_PAGE_SIZE rows at a time.
+    """
+    def query():
+        q = get_client().table(table).select(",".join(columns) if columns else "*")
+        if start:
+            q = q.gte("timestamp", start)
+        if end:
+            q = q.lte("timestamp", end)
+        for column, value in filters.items():
+            if value:
+                q = q.eq(column, value)
+        return q
+    try:
+        if not paged:
+            return query().order("timestamp", desc=True).execute().data or []
+        # Oldest first, so rows inserted while paging land after the pages already read; id breaks
+        # timestamp ties so offset pages neither repeat nor skip rows sharing a timestamp
+        rows = []
+        while True:
+            page = (query().order("timestamp").order("id")
+                    .range(len(rows), len(rows) + ANALYTICS_PAGE_SIZE - 1).execute().data or [])
+            rows.extend(page)
+            if len(page) < ANALYTICS_PAGE_SIZE:
+                return rows
+    except Exception as e:
+        # PostgREST answers a select of a missing column with Postgres error 42703
+        if getattr(e, "code", None) == "42703":
+            raise HTTPException(status_code=400, detail=f"Unknown column requested from {table}: {getattr(e, 'message', e)}")
+        raise
+
+async def _bucketed(table, columns, fields, bucket, agg, start, end, group_by=None, **filters):
+    """Read the whole range and aggregate it, off the event loop; returns (bucket, points)."""
+    def run():
+        rows = _time_range(table, columns, start, end, paged=True, **filters)
+        return downsample(rows, fields, bucket=bucket, agg=agg, group_by=group_by, start=start, end=end)
+    try:
+        downsample([], fields, bucket=bucket, agg=agg)  # reject a bad bucket or agg before reading anything
+        return await asyncio.to_thread(run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# With ?bucket= (minute/hour/day/week/auto) the series below are aggregated server-side with
+# ?agg= (avg/min/max/p95/sum/count), one point per bucket (and per type/port), newest first.
 @analytics_router.get("/analytics/performance_metrics/")
 async def get_performance_metrics(
     start: str = Query(None),
     end: str = Query(None),
-    metric: str = Query(None)
+    metric: str = Query(None),
+    fields: str = Query(None, description="comma-separated columns to return"),
+    bucket: str = Query(None),
+    agg: str = Query("avg")
 ):
-    q = supabase.table("analytics_metrics").select("*")
-    if start:
-        q = q.gte("timestamp", start)
-    if end:
-        q = q.lte("timestamp", end)
-    q = q.order("timestamp", desc=True)
-    resp = q.execute()
-    data = resp.data or []
-    if metric:
+    wanted = _columns(metric or fields)
+    columns = ["timestamp", *wanted] if wanted else None
+    if metric and not bucket:
+        # Raw series select every column, so an unknown metric yields an empty series as before
+        data = _time_range("analytics_metrics", None, start, end)
         return {"metric": metric, "series": [{"timestamp": d["timestamp"], "value": d.get(metric)} for d in data if metric in d]}
+    if bucket:
+        if not wanted:
+            raise HTTPException(status_code=400, detail="bucket requires metric or fields")
+        bucket, data = await _bucketed("analytics_metrics", columns, wanted, bucket, agg, start, end)
+        if metric:
+            return {"metric": metric, "bucket": bucket, "agg": agg,
+                    "series": [{"timestamp": d["timestamp"], "value": d[metric]} for d in data]}
+        return {"bucket": bucket, "agg": agg, "metrics": data}
+    data = _time_range("analytics_metrics", columns, start, end)
     if start or end:
         return {"metrics": data}
     # Default: return latest as top-level fields
@@ -70,7 +135,7 @@ async def get_performance_metrics(
 # --- Workflow Steps (detailed for frontend) ---
 @analytics_router.get("/workflow/steps/")
 async def get_workflow_steps(workflow_id: str = Query(None)):
-    q = supabase.table("workflow_steps").select("*").order("step_number")
+    q = get_client().table("workflow_steps").select("*").order("step_number")
     if workflow_id:
         q = q.eq("workflow_id", workflow_id)
     resp = q.execute()
@@ -79,7 +144,7 @@ async def get_workflow_steps(workflow_id: str = Query(None)):
 @analytics_router.get("/workflow/progress/")
 async def get_workflow_progress():
     try:
-        resp = supabase.table("workflow_steps").select("step_number").order("step_number", desc=True).limit(1).execute()
+        resp = get_client().table("workflow_steps").select("step_number").order("step_number", desc=True).limit(1).execute()
         total_steps = resp.data[0]["step_number"] if resp.data and len(resp.data) > 0 else 0
         # For demo, assume current step is 1
         return {"progress": {"step": 1, "total_steps": total_steps}}
@@ -92,7 +157,7 @@ async def get_workflow_progress():
 @analytics_router.get("/tool_calls/")
 async def get_tool_calls(page: int = 1, page_size: int = 20):
     start = (page - 1) * page_size
-    resp = supabase.table("tool_calls").select("*").range(start, start + page_size - 1).order("timestamp", desc=True).execute()
+    resp = get_client().table("tool_calls").select("*").range(start, start + page_size - 1).order("timestamp", desc=True).execute()
     tool_calls = resp.data or []
     total = resp.count if hasattr(resp, 'count') and resp.count is not None else len(tool_calls)
     return {"tool_calls": tool_calls, "total": total, "page": page, "page_size": page_size}
@@ -100,7 +165,7 @@ async def get_tool_calls(page: int = 1, page_size: int = 20):
 # --- Agent Network Visualization (with node metadata) ---
 @analytics_router.get("/agents/network/")
 async def get_agents_network():
-    resp = supabase.table("agents_network").select("*").execute()
+    resp = get_client().table("agents_network").select("*").execute()
     if resp.data and len(resp.data) > 0:
         nodes = [n for n in resp.data if n.get("type") == "node"]
         edges = [e for e in resp.data if n.get("type") == "edge"]
@@ -110,16 +175,18 @@ async def get_agents_network():
 # --- Global Port Status (with coordinates) ---
 @analytics_router.get("/ports/status/")
 async def get_ports_status(port_id: str = Query(None)):
-    q = supabase.table("port_status").select("*")
+    q = get_client().table("port_status").select("*")
     if port_id:
         q = q.eq("id", port_id)
     resp = q.execute()
     return {"ports": resp.data or []}
 
 # --- User Settings (GET/POST for preferences) ---
+# Settings belong to the caller's account (DEV_USER while AUTH_ENABLED is off); the alert
+# router delivers to that account's own email/phone, never to addresses given in the settings.
 @analytics_router.get("/user/settings/")
-async def get_user_settings(user_id: str = "demo"):  # In real use, get from auth
-    resp = supabase.table("user_settings").select("settings").eq("user_id", user_id).execute()
+async def get_user_settings(user=Depends(get_current_user_role())):
+    resp = get_client().table("user_settings").select("settings").eq("user_id", str(user["id"])).execute()
     if resp.data and len(resp.data) > 0 and resp.data[0].get("settings"):
         return {"settings": resp.data[0]["settings"]}
     # Default settings if not found
@@ -130,28 +197,32 @@ async def get_user_settings(user_id: str = "demo"):  # In real use, get from aut
     }}
 
 @analytics_router.post("/user/settings/")
-async def update_user_settings(settings: dict = Body(...), user_id: str = "demo"):  # In real use, get from auth
+async def update_user_settings(settings: dict = Body(...), user=Depends(get_current_user_role())):
+    # The Settings page posts {"settings": {...}}; store the settings themselves so GET round-trips
+    if set(settings) == {"settings"} and isinstance(settings["settings"], dict):
+        settings = settings["settings"]
     # Upsert user settings
-    supabase.table("user_settings").upsert({"user_id": user_id, "settings": settings}).execute()
+    get_client().table("user_settings").upsert({"user_id": str(user["id"]), "settings": settings}).execute()
+    alert_router.invalidate()  # notification preferences may have changed
     return {"settings": settings}
 
 # --- Simulation State (for AI demo context) ---
 @analytics_router.get("/simulation/state/")
 async def get_simulation_state():
-    resp = supabase.table("simulation_state").select("*").order("updated_at", desc=True).limit(1).execute()
+    resp = get_client().table("simulation_state").select("*").order("updated_at", desc=True).limit(1).execute()
     if resp.data and len(resp.data) > 0:
         return {"state": resp.data[0]}
     return {"state": {}}
 
 @analytics_router.get("/agents/list/")
 async def get_agents_list():
-    resp = supabase.table("agents").select("*").execute()
+    resp = get_client().table("agents").select("*").execute()
     return {"agents": resp.data or []}
 
 @analytics_router.post("/agents/update_status/")
 async def update_agent_status(agent_id: str = Body(...), new_status: str = Body(...)):
     # Update agent status in Supabase
-    resp = supabase.table("agents").update({"status": new_status}).eq("id", agent_id).execute()
+    resp = get_client().table("agents").update({"status": new_status}).eq("id", agent_id).execute()
     if not resp.data:
         return {"success": False, "error": "Agent not found or update failed."}
     return {"success": True, "agent_id": agent_id, "new_status": new_status}
@@ -162,7 +233,7 @@ async def websocket_agents(websocket: WebSocket):
     try:
         while True:
             # Fetch all agents from DB
-            agents = supabase.table("agents").select("*").execute().data or []
+            agents = get_client().table("agents").select("*").execute().data or []
             if agents:
                 # Simulate a random status update
                 agent = random.choice(agents)
@@ -174,34 +245,31 @@ async def websocket_agents(websocket: WebSocket):
 
 @analytics_router.get("/check_integrations")
 async def check_integrations():
-    resp = supabase.table("integrations").select("*").execute()
+    resp = get_client().table("integrations").select("*").execute()
     return {"integration_status": resp.data or []} 
 
 @analytics_router.get("/analytics/risk_trends/")
-async def get_risk_trends(start: str = Query(None), end: str = Query(None), risk_type: str = Query(None)):
-    q = supabase.table("risk_trends").select("*")
-    if start:
-        q = q.gte("timestamp", start)
-    if end:
-        q = q.lte("timestamp", end)
-    if risk_type:
-        q = q.eq("type", risk_type)
-    q = q.order("timestamp", desc=True)
-    resp = q.execute()
-    return {"riskData": resp.data or []}
+async def get_risk_trends(start: str = Query(None), end: str = Query(None), risk_type: str = Query(None),
+                          fields: str = Query(None), bucket: str = Query(None), agg: str = Query("avg")):
+    if bucket:
+        wanted = _columns(fields, ("incidents", "resolved"))
+        bucket, data = await _bucketed("risk_trends", ["timestamp", "type", *wanted], wanted, bucket, agg, start, end,
+                                       group_by="type", type=risk_type)
+        return {"bucket": bucket, "agg": agg, "riskData": data}
+    wanted = _columns(fields)
+    return {"riskData": _time_range("risk_trends", ["timestamp", *wanted] if wanted else None, start, end, type=risk_type)}
 
 @analytics_router.get("/analytics/port_performance/")
-async def get_port_performance(start: str = Query(None), end: str = Query(None), port_id: str = Query(None)):
-    q = supabase.table("port_performance").select("*")
-    if start:
-        q = q.gte("timestamp", start)
-    if end:
-        q = q.lte("timestamp", end)
-    if port_id:
-        q = q.eq("port_id", port_id)
-    q = q.order("timestamp", desc=True)
-    resp = q.execute()
-    return {"ports": resp.data or []} 
+async def get_port_performance(start: str = Query(None), end: str = Query(None), port_id: str = Query(None),
+                               fields: str = Query(None), bucket: str = Query(None), agg: str = Query("avg")):
+    if bucket:
+        wanted = _columns(fields, ("efficiency", "capacity"))
+        bucket, data = await _bucketed("port_performance", ["timestamp", "port_id", *wanted], wanted, bucket, agg, start, end,
+                                       group_by="port_id", port_id=port_id)
+        return {"bucket": bucket, "agg": agg, "ports": data}
+    wanted = _columns(fields)
+    return {"ports": _time_range("port_performance", ["timestamp", "port_id", *wanted] if wanted else None,
+                                 start, end, port_id=port_id)}
 
 @analytics_router.get("/analytics/kpis/")
 async def get_kpis():
@@ -211,18 +279,18 @@ async def get_kpis():
     kpis = {}
     # Cost savings (latest)
     cost_savings = 0
-    resp = supabase.table("analytics_metrics").select("cost_savings").order("timestamp", desc=True).limit(1).execute()
+    resp = get_client().table("analytics_metrics").select("cost_savings").order("timestamp", desc=True).limit(1).execute()
     if resp.data and len(resp.data) > 0:
         cost_savings = resp.data[0].get("cost_savings", 0)
     kpis["cost_savings"] = cost_savings
     # Active shipments
-    resp = supabase.table("shipment").select("*", count="exact").eq("status", "in-transit").execute()
+    resp = get_client().table("shipment").select("*", count="exact").eq("status", "in-transit").execute()
     kpis["active_shipments"] = resp.count if hasattr(resp, 'count') and resp.count is not None else len(resp.data or [])
     # Risk alerts (count)
-    resp = supabase.table("alerts").select("*", count="exact").execute()
+    resp = get_client().table("alerts").select("*", count="exact").execute()
     kpis["risk_alerts"] = resp.count if hasattr(resp, 'count') and resp.count is not None else len(resp.data or [])
     # On-time delivery (latest)
-    resp = supabase.table("analytics_metrics").select("on_time_delivery").order("timestamp", desc=True).limit(1).execute()
+    resp = get_client().table("analytics_metrics").select("on_time_delivery").order("timestamp", desc=True).limit(1).execute()
     if resp.data and len(resp.data) > 0:
         kpis["on_time_delivery"] = resp.data[0].get("on_time_delivery", 0)
     else:
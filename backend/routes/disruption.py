@@ -1,95 +1,90 @@
 import os
 import json
 import threading
+import time
 from fastapi import APIRouter, Request, Body, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from models import DisruptionEvent, AlertResponse, GenAIPlanRequest, GenAIPlanResponse
 from auth import get_current_user_role
-from agents.risk_analyzer import analyze_risk
+from ratelimit import rate_limit
+from audit import log_audit
+from db import list_alerts
+from jobs import PROCESS_MODE, JOB_MAX_WAIT_SECONDS, JOB_WAIT_POLL_SECONDS, job_queue
 from agents.response_planner import generate_action_plan
 from typing import Any, Dict, List
 import logging
-import datetime
-from supabase import create_client
 from dotenv import load_dotenv
-from agents.event_monitor import fetch_air_events, fetch_sea_events, fetch_road_events
+from agents.pipeline import fetch_live_events, process_disruptions
 import asyncio
+from tracing import EventLogger
+from agents.llm_registry import astream, get_chain, register_prompt, resolve_model
+from agents.alert_index import retrieve_chat_context
+from agents.risk_state import risk_state
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 disruption_router = APIRouter()
 
-def log_api(event, **kwargs):
-    ts = datetime.datetime.now().isoformat()
-    print(f"[API] {ts} | {event} | " + " | ".join(f"{k}={v}" for k, v in kwargs.items()))
+# Streamed answers are stored in the audit entry's details, cut to this many characters
+AUDIT_ANSWER_MAX_CHARS = int(os.getenv("AUDIT_ANSWER_MAX_CHARS", 2000))
 
-def log_agent(event, **kwargs):
-    ts = datetime.datetime.now().isoformat()
-    print(f"[AGENT] {ts} | {event} | " + " | ".join(f"{k}={v}" for k, v in kwargs.items()))
+log_api = EventLogger("supplywhiz.api")
 
-@disruption_router.post("/simulate_disruptions/", response_model=AlertResponse)
-async def simulate_disruptions(request: Request, disruptions: List[DisruptionEvent] = Body(...), user=Depends(get_current_user_role("admin"))):
-    log_api("simulate_disruptions_called", endpoint="/simulate_disruptions", disruptions=disruptions)
-    alerts = []
+register_prompt("chat", """{context}\nUser question: {query}\nAnswer in detail, using the data above.""", ["context", "query"])
+register_prompt("explain_risk", """Explain in detail, for a supply chain manager, why this risk report was generated:\n{risk}""", ["risk"])
+
+async def _offload(kind, payload, user, wait):
+    """
+    PROCESS_MODE=api: queue agent work for worker.py. Returns the job's result if it
+    finishes within `wait` seconds, otherwise a 202 with the job id to poll at /jobs/{id}.
+    """
+    # The queue is blocking sqlite3 (with a busy timeout); keep it off the event loop
+    job_id = await asyncio.to_thread(job_queue.enqueue, kind, payload, actor=(user or {}).get("email"))
+    log_api("job_enqueued", kind=kind, job_id=job_id)
+    deadline = time.monotonic() + min(wait, JOB_MAX_WAIT_SECONDS)
+    while True:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"Job {job_id} failed: {job['error']}")
+        if time.monotonic() >= deadline:
+            return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+        await asyncio.sleep(JOB_WAIT_POLL_SECONDS)
+
+@disruption_router.post("/simulate_disruptions/", response_model=AlertResponse, dependencies=[Depends(rate_limit("simulate_disruptions"))])
+async def simulate_disruptions(request: Request, disruptions: List[DisruptionEvent] = Body(...), wait: float = Query(0, ge=0),
+                               user=Depends(get_current_user_role("admin"))):
+    log_api("simulate_disruptions_called", endpoint="/simulate_disruptions", count=len(disruptions))
+    disruption_dicts = [event.dict() for event in disruptions]
+    if PROCESS_MODE == "api":
+        return await _offload("simulate_disruptions", {"disruptions": disruption_dicts}, user, wait)
     try:
-        disruption_dicts = [event.dict() for event in disruptions]
-        try:
-            log_api("calling_analyze_risk")
-            risk_report = analyze_risk(disruption_dicts)
-            log_api("risk_report_generated", risk_report=risk_report)
-        except RuntimeError as e:
-            log_api("llm_risk_analysis_failed", error=str(e))
-            logging.error(f"LLM risk analysis failed: {e}")
-            raise HTTPException(status_code=500, detail=f"LLM-based risk analysis is required: {e}")
-        try:
-            log_api("calling_generate_action_plan")
-            action_plan = generate_action_plan(risk_report)
-            log_api("action_plan_generated", action_plan=action_plan)
-        except Exception as e:
-            log_api("action_plan_generation_failed", error=str(e))
-            logging.error(f"Action plan generation failed: {e}")
-            action_plan = []
-        for event in disruptions:
-            event_payload = event.dict()
-            event_risks = risk_report
-            event_plans = action_plan
-            alert = {
-                "event": event_payload,
-                "risk_report": event_risks,
-                "action_plan": event_plans
-            }
-            log_api("appending_alert", alert=alert)
-            # Insert alert into Supabase
-            supabase.table("alerts").insert(alert).execute()
-            alerts.append(alert)
-        log_api("returning_alerts_response", alerts=alerts)
+        log_api("calling_analyze_risk")
+        _, _, alerts = process_disruptions(disruption_dicts)
+        log_api.debug("returning_alerts_response", alerts=alerts)
         return {"alerts": alerts}
-    except HTTPException:
-        raise
+    except RuntimeError as e:
+        log_api.error("llm_risk_analysis_failed", error=str(e))
+        raise HTTPException(status_code=500, detail=f"LLM-based risk analysis is required: {e}")
     except Exception as e:
-        log_api("simulation_failed", error=str(e))
+        log_api.error("simulation_failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"Simulation failed: {e}")
 
-@disruption_router.post("/genai_plan/", response_model=GenAIPlanResponse)
+@disruption_router.post("/genai_plan/", response_model=GenAIPlanResponse, dependencies=[Depends(rate_limit("genai_plan"))])
 async def genai_plan_endpoint(request: Request, risk_report: List[Dict[str, Any]] = Body(...), user=Depends(get_current_user_role())):
-    print("[API] /genai_plan/ called")
+    log_api("genai_plan_called", endpoint="/genai_plan/", items=len(risk_report))
     try:
-        print(f"[API] Received risk_report: {risk_report}")
-        print("[API] Calling generate_action_plan...")
         action_plan = generate_action_plan(risk_report)
-        print(f"[API] Action plan generated: {action_plan}")
+        log_api.debug("action_plan_generated", action_plan=action_plan)
     except Exception as e:
-        print(f"[API] Action plan generation failed: {e}")
-        logging.error(f"Action plan generation failed: {e}")
+        log_api.error("action_plan_generation_failed", error=str(e))
         action_plan = []
-    print("[API] Returning action_plan response.")
     return {"action_plan": action_plan}
 
 @disruption_router.get("/alerts/")
 async def get_alerts():
-    alerts = supabase.table("alerts").select("*").order("id", desc=True).execute().data or []
+    alerts = list_alerts()
     # Ensure all required fields are present
     def enrich(alert):
         return {
@@ -108,7 +103,7 @@ async def get_alerts():
         }
     return {"alerts": [enrich(a) for a in alerts]}
 
-@disruption_router.post("/chat/")
+@disruption_router.post("/chat/", dependencies=[Depends(rate_limit("chat"))])
 async def chat_endpoint(
     query: str = Body(..., embed=True),
     model: str = Query(None),
@@ -116,37 +111,29 @@ async def chat_endpoint(
 ):
     try:
         log_api("chat_called", endpoint="/chat/", query=query, user=user["email"])
-        # Use latest 10 alerts from Supabase as context
-        context = supabase.table("alerts").select("*").order("id", desc=True).limit(10).execute().data or []
-        prompt = f"You are a supply chain assistant. Here is recent alert data: {context}\nUser question: {query}\nAnswer in detail, using the data above."
-        from langchain_groq import ChatGroq
-        from langchain.prompts import PromptTemplate
-        from langchain.chains import LLMChain
-        import os
-        model_name = model or os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-        llm = ChatGroq(groq_api_key=os.getenv("GROQ_API_KEY"), model_name=model_name)
-        chain = LLMChain(llm=llm, prompt=PromptTemplate(input_variables=["context", "query"], template="""{context}\nUser question: {query}\nAnswer in detail, using the data above."""))
-        answer = chain.run(context=str(context), query=query)
-        log_api("chat_answer", answer=answer, user=user["email"])
+        # Alerts most relevant to the question, projected and capped by CHAT_CONTEXT_MAX_TOKENS
+        context = await asyncio.to_thread(retrieve_chat_context, query)
+        model_name = resolve_model(model)
+        chain = get_chain("chat", model_name)
+        answer = chain.run(context=context, query=query)
+        log_api.debug("chat_answer", answer=answer, user=user["email"])
         # Log to audit_log
-        supabase.table("audit_log").insert({
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "actor": user["email"],
-            "action": "llm_chat",
-            "target": "chat",
-            "details": f"Query: {query} | Model: {model_name}",
-            "severity": "low",
-            "status": "success",
-            "ipAddress": "N/A",
-            "userAgent": "N/A"
-        }).execute()
+        log_audit("llm_chat", user["email"], target="chat", details=f"Query: {query} | Model: {model_name}",
+                  severity="low", status="success", ipAddress="N/A", userAgent="N/A")
         return {"answer": answer}
     except Exception as e:
         import logging
         logging.error(f"/chat/ endpoint failed: {e}")
         return {"error": str(e)}, 500
 
-@disruption_router.get("/explain_risk/")
+def _latest_risk_report(product_id):
+    for alert in list_alerts():
+        for rr in alert.get("risk_report", []):
+            if rr.get("product_id") == product_id:
+                return rr
+    return None
+
+@disruption_router.get("/explain_risk/", dependencies=[Depends(rate_limit("explain_risk"))])
 async def explain_risk(
     product_id: str = Query(...),
     model: str = Query(None),
@@ -155,33 +142,17 @@ async def explain_risk(
     try:
         log_api("explain_risk_called", endpoint="/explain_risk/", product_id=product_id, user=user["email"])
         # Find the latest risk report for this product from Supabase alerts
-        alerts = supabase.table("alerts").select("*").order("id", desc=True).execute().data or []
-        for alert in alerts:
-            for rr in alert.get("risk_report", []):
-                if rr.get("product_id") == product_id:
-                    # Use LLM to explain
-                    from langchain_groq import ChatGroq
-                    from langchain.prompts import PromptTemplate
-                    from langchain.chains import LLMChain
-                    import os
-                    model_name = model or os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-                    llm = ChatGroq(groq_api_key=os.getenv("GROQ_API_KEY"), model_name=model_name)
-                    chain = LLMChain(llm=llm, prompt=PromptTemplate(input_variables=["risk"], template="""Explain in detail, for a supply chain manager, why this risk report was generated:\n{risk}"""))
-                    explanation = chain.run(risk=str(rr))
-                    log_api("explain_risk_explanation", explanation=explanation, risk_report=rr, user=user["email"])
-                    # Log to audit_log
-                    supabase.table("audit_log").insert({
-                        "timestamp": datetime.datetime.utcnow().isoformat(),
-                        "actor": user["email"],
-                        "action": "llm_explain_risk",
-                        "target": "explain_risk",
-                        "details": f"Product: {product_id} | Model: {model_name}",
-                        "severity": "low",
-                        "status": "success",
-                        "ipAddress": "N/A",
-                        "userAgent": "N/A"
-                    }).execute()
-                    return {"explanation": explanation, "risk_report": rr}
+        rr = _latest_risk_report(product_id)
+        if rr is not None:
+            # Use LLM to explain
+            model_name = resolve_model(model)
+            chain = get_chain("explain_risk", model_name)
+            explanation = chain.run(risk=str(rr))
+            log_api.debug("explain_risk_explanation", explanation=explanation, risk_report=rr, user=user["email"])
+            # Log to audit_log
+            log_audit("llm_explain_risk", user["email"], target="explain_risk", details=f"Product: {product_id} | Model: {model_name}",
+                      severity="low", status="success", ipAddress="N/A", userAgent="N/A")
+            return {"explanation": explanation, "risk_report": rr}
         log_api("explain_risk_not_found", product_id=product_id, user=user["email"])
         return {"explanation": "No risk report found for this product_id.", "risk_report": None}
     except Exception as e:
@@ -189,77 +160,145 @@ async def explain_risk(
         logging.error(f"/explain_risk/ endpoint failed: {e}")
         return {"error": str(e)}, 500
 
-@disruption_router.post("/batch_simulate_disruptions/")
-async def batch_simulate_disruptions(disruptions: List[DisruptionEvent] = Body(...)):
+def _clip(text, limit=AUDIT_ANSWER_MAX_CHARS):
+    return text if len(text) <= limit else text[:limit] + f"... [{len(text) - limit} more chars]"
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _stream_completion(prompt_name, model_name, inputs, on_complete, first=None):
+    """
+    Server-sent events for a streamed completion: an optional leading `meta` event, one
+    `token` event per chunk, then `done` (or `error`). on_complete(text) runs only once
+    the model has finished, so the audit entry records the full answer.
+    """
+    async def events():
+        if first is not None:
+            yield _sse("meta", first)
+        parts = []
+        try:
+            async for text in astream(prompt_name, model_name, **inputs):
+                parts.append(text)
+                yield _sse("token", text)
+        except Exception as e:
+            logging.error(f"Streaming {prompt_name} failed: {e}")
+            yield _sse("error", {"error": str(e)})
+            return
+        answer = "".join(parts)
+        on_complete(answer)
+        yield _sse("done", {"answer": answer})
+    # no-cache/no-transform and X-Accel-Buffering keep proxies from holding back tokens
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
+@disruption_router.post("/chat/stream/", dependencies=[Depends(rate_limit("chat"))])
+async def chat_stream_endpoint(
+    query: str = Body(..., embed=True),
+    model: str = Query(None),
+    user=Depends(get_current_user_role())
+):
+    log_api("chat_called", endpoint="/chat/stream/", query=query, user=user["email"])
+    try:
+        model_name = resolve_model(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    context = await asyncio.to_thread(retrieve_chat_context, query)
+
+    def on_complete(answer):
+        log_api.debug("chat_answer", answer=answer, user=user["email"])
+        log_audit("llm_chat", user["email"], target="chat",
+                  details=f"Query: {query} | Model: {model_name} | Streamed | Answer: {_clip(answer)}",
+                  severity="low", status="success", ipAddress="N/A", userAgent="N/A")
+    return _stream_completion("chat", model_name, {"context": context, "query": query}, on_complete)
+
+@disruption_router.get("/explain_risk/stream/", dependencies=[Depends(rate_limit("explain_risk"))])
+async def explain_risk_stream(
+    product_id: str = Query(...),
+    model: str = Query(None),
+    user=Depends(get_current_user_role())
+):
+    log_api("explain_risk_called", endpoint="/explain_risk/stream/", product_id=product_id, user=user["email"])
+    try:
+        model_name = resolve_model(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rr = _latest_risk_report(product_id)
+    if rr is None:
+        log_api("explain_risk_not_found", product_id=product_id, user=user["email"])
+        raise HTTPException(status_code=404, detail="No risk report found for this product_id.")
+
+    def on_complete(explanation):
+        log_api.debug("explain_risk_explanation", explanation=explanation, risk_report=rr, user=user["email"])
+        log_audit("llm_explain_risk", user["email"], target="explain_risk",
+                  details=f"Product: {product_id} | Model: {model_name} | Streamed | Answer: {_clip(explanation)}",
+                  severity="low", status="success", ipAddress="N/A", userAgent="N/A")
+    return _stream_completion("explain_risk", model_name, {"risk": str(rr)}, on_complete, first={"risk_report": rr})
+
+@disruption_router.post("/batch_simulate_disruptions/", dependencies=[Depends(rate_limit("simulate_disruptions"))])
+async def batch_simulate_disruptions(disruptions: List[DisruptionEvent] = Body(...), wait: float = Query(0, ge=0)):
     log_api("batch_simulate_disruptions_called", count=len(disruptions))
     disruption_dicts = [event.dict() for event in disruptions]
-    risk_report = analyze_risk(disruption_dicts)
-    action_plan = generate_action_plan(risk_report)
-    log_api("batch_simulate_disruptions_result", risk_report=risk_report, action_plan=action_plan)
-    # Insert a batch alert into Supabase for each disruption
-    for event, rr, ap in zip(disruptions, risk_report, action_plan):
-        alert = {
-            "event": event.dict(),
-            "risk_report": [rr],
-            "action_plan": [ap] if isinstance(ap, dict) else ap
-        }
-        supabase.table("alerts").insert(alert).execute()
+    if PROCESS_MODE == "api":
+        return await _offload("batch_simulate_disruptions", {"disruptions": disruption_dicts}, None, wait)
+    # Stores an alert for each disruption, with only its own reports and plans
+    risk_report, action_plan, _ = process_disruptions(disruption_dicts)
+    log_api.debug("batch_simulate_disruptions_result", risk_report=risk_report, action_plan=action_plan)
     return {"risk_report": risk_report, "action_plan": action_plan}
 
-@disruption_router.post("/process_all_disruptions/")
-async def process_all_disruptions(request: Request, simulated_disruptions: List[DisruptionEvent] = Body(default=[]), user=Depends(get_current_user_role("admin"))):
-    log_api("process_all_disruptions_called", endpoint="/process_all_disruptions", simulated_disruptions=simulated_disruptions)
-    alerts = []
+@disruption_router.post("/process_all_disruptions/", dependencies=[Depends(rate_limit("process_all_disruptions"))])
+async def process_all_disruptions(request: Request, simulated_disruptions: List[DisruptionEvent] = Body(default=[]),
+                                  wait: float = Query(0, ge=0), user=Depends(get_current_user_role("admin"))):
+    log_api("process_all_disruptions_called", endpoint="/process_all_disruptions", simulated=len(simulated_disruptions))
+    # Convert simulated disruptions to dicts
+    simulated_dicts = [event.dict() for event in simulated_disruptions]
+    if PROCESS_MODE == "api":
+        return await _offload("process_all_disruptions", {"disruptions": simulated_dicts}, user, wait)
     # Fetch real disruptions from agents
-    real_events = []
     try:
-        air_events, sea_events, road_events = await asyncio.gather(
-            fetch_air_events(), fetch_sea_events(), fetch_road_events()
-        )
-        real_events = (air_events or []) + (sea_events or []) + (road_events or [])
+        real_events = await fetch_live_events()
     except Exception as e:
-        log_api("real_agent_fetch_failed", error=str(e))
+        log_api.error("real_agent_fetch_failed", error=str(e))
         real_events = []
-    # Convert simulated disruptions to dicts
-    simulated_dicts = [event.dict() for event in simulated_disruptions]
     # Combine all disruptions
     all_disruptions = real_events + simulated_dicts
     if not all_disruptions:
         return {"alerts": []}
     try:
         log_api("calling_analyze_risk")
-        risk_report = analyze_risk(all_disruptions)
-        log_api("risk_report_generated", risk_report=risk_report)
+        _, _, alerts = process_disruptions(all_disruptions)
     except RuntimeError as e:
-        log_api("llm_risk_analysis_failed", error=str(e))
-        logging.error(f"LLM risk analysis failed: {e}")
+        log_api.error("llm_risk_analysis_failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"LLM-based risk analysis is required: {e}")
-    try:
-        log_api("calling_generate_action_plan")
-        action_plan = generate_action_plan(risk_report)
-        log_api("action_plan_generated", action_plan=action_plan)
-    except Exception as e:
-        log_api("action_plan_generation_failed", error=str(e))
-        logging.error(f"Action plan generation failed: {e}")
-        action_plan = []
-    # Store alerts
-    for disruption in all_disruptions:
-        alert = {
-            "event": disruption,
-            "risk_report": risk_report,
-            "action_plan": action_plan
-        }
-        supabase.table("alerts").insert(alert).execute()
-        alerts.append(alert)
-    log_api("returning_alerts_response", alerts=alerts)
+    log_api.debug("returning_alerts_response", alerts=alerts)
     return {"alerts": alerts}
 
+@disruption_router.get("/jobs/{job_id}")
+async def get_job(job_id: int, user=Depends(get_current_user_role())):
+    """Status, and once finished the result or error, of queued agent work."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {k: job[k] for k in ("id", "kind", "status", "result", "error", "attempts", "created_at", "started_at", "finished_at")}
+
+@disruption_router.get("/risk_state/")
+async def get_risk_state(user=Depends(get_current_user_role())):
+    """Active disruptions with the shipments each currently affects, highest risk first."""
+    return {"disruptions": risk_state.snapshot()}
+
+@disruption_router.post("/resolve_disruption/")
+async def resolve_disruption(key: str = Body(..., embed=True), user=Depends(get_current_user_role("admin"))):
+    if not risk_state.resolve(key):
+        raise HTTPException(status_code=404, detail="No active disruption with this key.")
+    log_audit("resolve_disruption", user["email"], target=key, details=f"Disruption {key} resolved",
+              severity="low", status="success", ipAddress="N/A", userAgent="N/A")
+    return {"resolved": key}
+
 @disruption_router.get("/risk_heatmap/")
 async def risk_heatmap(user=Depends(get_current_user_role())):
     try:
         log_api("risk_heatmap_called", user=user["email"])
         # Aggregate risk scores by location from Supabase alerts
-        alerts = supabase.table("alerts").select("*").execute().data or []
+        alerts = list_alerts()
         location_risk = {}
         for alert in alerts:
             event = alert.get("event", {})
@@ -270,19 +309,10 @@ async def risk_heatmap(user=Depends(get_current_user_role())):
                     location_risk.setdefault(loc, []).append(score)
         # Compute average risk per location
         heatmap = [{"location": loc, "avg_risk": sum(scores)/len(scores) if scores else 0, "count": len(scores)} for loc, scores in location_risk.items()]
-        log_api("risk_heatmap_result", heatmap=heatmap, user=user["email"])
+        log_api.debug("risk_heatmap_result", heatmap=heatmap, user=user["email"])
         # Log to audit_log
-        supabase.table("audit_log").insert({
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "actor": user["email"],
-            "action": "llm_risk_heatmap",
-            "target": "risk_heatmap",
-            "details": "Heatmap generated",
-            "severity": "low",
-            "status": "success",
-            "ipAddress": "N/A",
-            "userAgent": "N/A"
-        }).execute()
+        log_audit("llm_risk_heatmap", user["email"], target="risk_heatmap", details="Heatmap generated",
+                  severity="low", status="success", ipAddress="N/A", userAgent="N/A")
         return {"heatmap": heatmap}
     except Exception as e:
         import logging
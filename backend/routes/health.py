@@ -1,6 +1,7 @@
 import os
 import requests
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Depends
+from ratelimit import rate_limit
 
 health_router = APIRouter()
 
@@ -12,4 +13,10 @@ async def root(request: Request):
 @health_router.get("/healthz")
 async def healthz():
     print("[API] /healthz endpoint called")
-    return {"status": "ok"} 
\ No newline at end of file
+    return {"status": "ok"}
+
+# Example of per-endpoint rate limiting (limit configured as "limited_healthz" in RATE_LIMITS)
+@health_router.get("/limited_healthz", dependencies=[Depends(rate_limit("limited_healthz"))])
+async def limited_healthz():
+    print("[API] /limited_healthz endpoint called (rate limited)")
+    return {"status": "ok (rate limited)"}
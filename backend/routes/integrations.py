@@ -2,7 +2,6 @@ import os
 import requests
 from fastapi import APIRouter
 from datetime import datetime, timedelta
-from supabase import create_client, Client
 
 integrations_router = APIRouter()
 
@@ -2,18 +2,16 @@ import os
 from fastapi import APIRouter, Request, Body, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from models import ShipmentUpdateRequest, ShipmentUpdateResponse
 from auth import get_current_user_role
+from db import get_shipment, get_all_shipments, update_shipment as update_shipment_record
 from utils.data_loader import get_latest_gps_position, update_shipment_location_by_gps, get_latest_location_from_provider
+from agents.risk_state import on_shipment_changed
 import json
 from typing import Any, Dict, List
-from supabase import create_client
 from dotenv import load_dotenv
 import asyncio
 import random
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 shipment_router = APIRouter()
 
@@ -25,9 +23,10 @@ async def update_shipment(request: Request, update: ShipmentUpdateRequest, user=
         raise HTTPException(status_code=400, detail="Missing product_id in update.")
     update_dict = update.dict(exclude_unset=True)
     # Update in Supabase
-    resp = supabase.table("shipment").update(update_dict).eq("product_id", product_id).execute()
-    if not resp.data:
+    if not update_shipment_record(product_id, update_dict):
         raise HTTPException(status_code=404, detail="Shipment not found.")
+    # Re-score just this shipment against active disruptions if its location or route moved
+    on_shipment_changed(update_dict)
     return {"updated_shipment": update_dict}
 
 @shipment_router.post("/associate_traccar_device/")
@@ -35,9 +34,9 @@ async def associate_traccar_device(request: Request, payload: dict = Body(...),
     product_id = payload.get("product_id")
     device_id = payload.get("device_id")
     print(f"[API] /associate_traccar_device/ called for product_id={product_id}, device_id={device_id}")
-    resp = supabase.table("shipment").update({"traccar_device_id": device_id}).eq("product_id", product_id).execute()
-    if not resp.data:
+    if not update_shipment_record(product_id, {"traccar_device_id": device_id}):
         raise HTTPException(status_code=404, detail="Shipment not found.")
+    on_shipment_changed({"product_id": product_id, "traccar_device_id": device_id})
     return {"message": f"Device {device_id} associated with shipment {product_id}"}
 
 @shipment_router.post("/update_shipment_gps/")
@@ -46,7 +45,7 @@ async def update_shipment_gps(request: Request, payload: dict = Body(...), user=
     device_id = payload.get("device_id")
     print(f"[API] /update_shipment_gps/ called for product_id={product_id}, device_id={device_id}")
     # If device_id is not provided, try to get it from the shipment
-    shipment = supabase.table("shipment").select("*").eq("product_id", product_id).single().execute().data
+    shipment = get_shipment(product_id)
     if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found.")
     if not device_id:
@@ -127,7 +126,7 @@ async def list_traccar_devices(user=Depends(get_current_user_role("operator"))):
 
 @shipment_router.get("/shipments/")
 async def list_shipments():
-    shipments = supabase.table("shipment").select("*").execute().data
+    shipments = get_all_shipments()
     return {"shipments": shipments}
 
 @shipment_router.websocket("/ws/shipments/")
@@ -136,7 +135,7 @@ async def websocket_shipments(websocket: WebSocket):
     try:
         while True:
             # Fetch all shipments from DB
-            shipments = supabase.table("shipment").select("*").execute().data or []
+            shipments = get_all_shipments()
             if shipments:
                 # Simulate a random update
                 shipment = random.choice(shipments)
@@ -1,51 +1,278 @@
 import os
+import time
+import socket
 import asyncio
-from apscheduler.schedulers.background import BackgroundScheduler
-from agents.event_monitor import fetch_or_simulate_events
-from agents.risk_analyzer import analyze_risk
-from agents.response_planner import generate_action_plan
-from utils.notifications import send_notification
-from supabase import create_client
+import logging
+import threading
+from db import alert_exists_for_event, insert_alert, get_client
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-
-def periodic_disruption_check():
-    try:
-        events = asyncio.run(fetch_or_simulate_events())
-        for event_payload in events:
-            # Check for duplicate event in Supabase
-            existing = supabase.table("alerts").select("*").eq("event->>event_type", event_payload["event_type"]).eq("event->>location", event_payload["location"]).eq("event->>timestamp", event_payload["timestamp"]).execute().data
-            if existing:
-                continue
-            risk_report = analyze_risk(event_payload)
-            action_plan = generate_action_plan(risk_report)
-            alert = {
-                # Required fields for 'alerts' table
-                "isreal": True,
-                "severity": event_payload.get("severity", "medium"),
-                "riskscore": risk_report["risk_score"] if isinstance(risk_report, dict) and "risk_score" in risk_report else 0,
-                "affectedshipments": risk_report["affected_shipments"] if isinstance(risk_report, dict) and "affected_shipments" in risk_report else 0,
-                "title": event_payload.get("event_type", "Disruption Alert"),
-                "description": event_payload.get("description", "Disruption detected"),
-                "location": event_payload.get("location", "Unknown"),
-                "timeago": "just now",
-                "type": event_payload.get("event_type", "disruption"),
-                "event": event_payload,
-                "risk_report": risk_report,
-                "action_plan": action_plan
-            }
-            supabase.table("alerts").insert(alert).execute()
-            # Optionally send notifications
-            # send_notification(alert)
-    except Exception as e:
-        import logging
-        logging.error(f"Scheduler disruption check failed: {e}")
+
+# The disruption check starts at SCHEDULER_INTERVAL_SECONDS and adapts between the bounds:
+# halved after a run that found new events, stretched by half after a quiet run
+SCHEDULER_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_INTERVAL_SECONDS", 600))
+SCHEDULER_MIN_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_MIN_INTERVAL_SECONDS", 120))
+SCHEDULER_MAX_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_MAX_INTERVAL_SECONDS", 1800))
+# Only the process holding the lock runs jobs: "file" (one host), "db" (shared across hosts) or "none"
+SCHEDULER_LOCK = os.getenv("SCHEDULER_LOCK", "file")
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", os.path.join(os.path.dirname(__file__), "logs", "scheduler.lock"))
+SCHEDULER_LEADER_CHECK_SECONDS = float(os.getenv("SCHEDULER_LEADER_CHECK_SECONDS", 30))
+
+JOB_ID = "disruption_check"
+
+def periodic_disruption_check(on_backlog=None):
+    """
+    Fetch events and store an alert for each new one, most severe first.
+    on_backlog(n) is called with the number of events still to process. Returns
+    {"fetched": ..., "new": ...}.
+    """
+    # Agent modules pull in the LLM/HTTP stacks; load them on the first run, not at app import
+    from agents.event_monitor import fetch_or_simulate_events
+    from agents.risk_analyzer import analyze_risk
+    from agents.response_planner import generate_action_plan
+    from agents.alert_index import index_alert
+    from agents.risk_state import track_disruptions
+    from utils.alert_rules import fan_out_alert, severity_level
+    events = sorted(asyncio.run(fetch_or_simulate_events()) or [], key=lambda e: -severity_level(e.get("severity")))
+    new = 0
+    for i, event_payload in enumerate(events):
+        if on_backlog:
+            on_backlog(len(events) - i)
+        # Check for duplicate event in Supabase
+        if alert_exists_for_event(event_payload):
+            continue
+        new += 1
+        risk_report = analyze_risk(event_payload)
+        track_disruptions([event_payload], risk_report)
+        action_plan = generate_action_plan(risk_report)
+        alert = {
+            # Required fields for 'alerts' table
+            "isreal": True,
+            "severity": event_payload.get("severity", "medium"),
+            "riskscore": risk_report["risk_score"] if isinstance(risk_report, dict) and "risk_score" in risk_report else 0,
+            "affectedshipments": risk_report["affected_shipments"] if isinstance(risk_report, dict) and "affected_shipments" in risk_report else 0,
+            "title": event_payload.get("event_type", "Disruption Alert"),
+            "description": event_payload.get("description", "Disruption detected"),
+            "location": event_payload.get("location", "Unknown"),
+            "timeago": "just now",
+            "type": event_payload.get("event_type", "disruption"),
+            "event": event_payload,
+            "risk_report": risk_report,
+            "action_plan": action_plan
+        }
+        index_alert(insert_alert(alert))
+        # Queues notifications for matching subscribers; delivery runs on the dispatcher thread
+        fan_out_alert(alert)
+    if on_backlog:
+        on_backlog(0)
+    return {"fetched": len(events), "new": new}
+
+class FileLeaderLock:
+    """Exclusive, non-blocking flock on a local file; the OS releases it if the process dies."""
+    def __init__(self, path=SCHEDULER_LOCK_PATH):
+        self.path = path
+        self._fh = None
+
+    def acquire(self):
+        if self._fh is not None:
+            return True
+        import fcntl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fh = open(self.path, "a+")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(os.getpid()))
+        fh.flush()
+        self._fh = fh
+        return True
+
+    def release(self):
+        fh, self._fh = self._fh, None
+        if fh is not None:
+            import fcntl
+            fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+
+class DbLeaderLock:
+    """
+    Lease in the scheduler_lock table (see schema.sql), renewed on every leader check and
+    taken over by another process once it expires.
+    """
+    def __init__(self, name="scheduler", ttl=SCHEDULER_LEADER_CHECK_SECONDS * 3, owner=None):
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self):
+        table = lambda: get_client().table("scheduler_lock")
+        now = time.time()
+        lease = {"owner": self.owner, "expires_at": now + self.ttl}
+        if table().update(lease).eq("name", self.name).eq("owner", self.owner).execute().data:
+            return True  # renewed
+        if table().update(lease).eq("name", self.name).lt("expires_at", now).execute().data:
+            return True  # previous leader's lease expired
+        if table().select("name").eq("name", self.name).execute().data:
+            return False
+        try:
+            table().insert({"name": self.name, **lease}).execute()  # primary key settles a race here
+            return True
+        except Exception:
+            return False
+
+    def release(self):
+        try:
+            get_client().table("scheduler_lock").delete().eq("name", self.name).eq("owner", self.owner).execute()
+        except Exception as e:
+            logging.warning(f"Could not release scheduler lock: {e}")
+
+class NoLock:
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+def _make_lock(kind=SCHEDULER_LOCK):
+    return {"file": FileLeaderLock, "db": DbLeaderLock}.get(kind, NoLock)()
+
+class DisruptionScheduler:
+    """
+    Runs the disruption check in one process only, never overlapping itself.
+
+    Every process schedules a cheap leader check; the one that acquires the lock adds the
+    disruption job (max_instances=1, coalesce=True, so a slow run is never doubled and
+    missed ticks collapse into one) and drops it again if it loses the lock. The interval
+    adapts to event volume, and run duration, backlog and skipped ticks are tracked.
+    """
+    def __init__(self, job=periodic_disruption_check, lock=None, interval=SCHEDULER_INTERVAL_SECONDS,
+                 min_interval=SCHEDULER_MIN_INTERVAL_SECONDS, max_interval=SCHEDULER_MAX_INTERVAL_SECONDS,
+                 leader_check=SCHEDULER_LEADER_CHECK_SECONDS):
+        self.job = job
+        self.lock = lock if lock is not None else _make_lock()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.leader_check = leader_check
+        self.is_leader = False
+        self._scheduler = None
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "failures": 0, "skipped": 0, "running": False, "backlog": 0,
+                       "events_fetched": 0, "events_new": 0, "last_run_at": None, "last_duration_s": None,
+                       "max_duration_s": 0.0, "total_duration_s": 0.0}
+
+    def start(self):
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+        self._scheduler = BackgroundScheduler()
+        self._scheduler.add_listener(self._on_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+        self._scheduler.add_job(self._elect, "interval", seconds=self.leader_check, id="leader_check",
+                                max_instances=1, coalesce=True, next_run_time=self._now())
+        self._scheduler.start()
+        return self
+
+    def stop(self):
+        if self._scheduler is not None and self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+        self._scheduler = None
+        if self.is_leader:
+            self.lock.release()
+            self.is_leader = False
+
+    @staticmethod
+    def _now():
+        from datetime import datetime
+        return datetime.now()
+
+    def _elect(self):
+        try:
+            leader = self.lock.acquire()
+        except Exception as e:
+            logging.warning(f"Scheduler leader check failed: {e}")
+            leader = False
+        if leader != self.is_leader:
+            logging.info(f"Scheduler leadership {'acquired' if leader else 'lost'} (pid {os.getpid()})")
+        self.is_leader = leader
+        job = self._scheduler.get_job(JOB_ID) if self._scheduler else None
+        if leader and job is None and self._scheduler is not None:
+            self._scheduler.add_job(self._run, "interval", seconds=self.interval, id=JOB_ID, max_instances=1,
+                                    coalesce=True, misfire_grace_time=int(self.interval))
+        elif not leader and job is not None:
+            job.remove()
+
+    def _on_skipped(self, event):
+        if event.job_id == JOB_ID:
+            with self._lock:
+                self._stats["skipped"] += 1
+
+    def _set_backlog(self, n):
+        with self._lock:
+            self._stats["backlog"] = n
+
+    def _run(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._stats["running"] = True
+            self._stats["last_run_at"] = time.time()
+        result = None
+        try:
+            result = self.job(on_backlog=self._set_backlog)
+        except Exception as e:
+            logging.error(f"Scheduler disruption check failed: {e}")
+        finally:
+            self._set_backlog(0)  # nothing is queued once the run is over, finished or not
+        duration = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats
+            stats["running"] = False
+            stats["runs"] += 1
+            stats["last_duration_s"] = round(duration, 3)
+            stats["max_duration_s"] = max(stats["max_duration_s"], round(duration, 3))
+            stats["total_duration_s"] += duration
+            if result is None:
+                stats["failures"] += 1
+            else:
+                stats["events_fetched"] += result.get("fetched", 0)
+                stats["events_new"] += result.get("new", 0)
+        if result is not None:
+            self._adapt(result.get("new", 0))
+        if duration > self.interval:
+            logging.warning(f"Disruption check took {duration:.0f}s, longer than its {self.interval:.0f}s interval")
+
+    def _adapt(self, new_events):
+        interval = self.interval / 2 if new_events else self.interval * 1.5
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        if interval == self.interval:
+            return
+        self.interval = interval
+        if self._scheduler is not None and self._scheduler.get_job(JOB_ID) is not None:
+            self._scheduler.reschedule_job(JOB_ID, trigger="interval", seconds=interval)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        runs = stats["runs"] or 1
+        job = self._scheduler.get_job(JOB_ID) if self._scheduler else None
+        return {
+            **stats,
+            "total_duration_s": round(stats["total_duration_s"], 3),
+            "avg_duration_s": round(stats["total_duration_s"] / runs, 3),
+            "is_leader": self.is_leader,
+            "interval_s": self.interval,
+            "next_run_at": job.next_run_time.isoformat() if job and job.next_run_time else None,
+        }
+
+disruption_scheduler = DisruptionScheduler()
 
 def start_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(periodic_disruption_check, 'interval', minutes=10)
-    scheduler.start() 
\ No newline at end of file
+    """Start the background disruption check; called from the app lifespan, returns the scheduler."""
+    return disruption_scheduler.start()
+
+def stop_scheduler(scheduler):
+    if scheduler is not None:
+        scheduler.stop()
@@ -0,0 +1,28 @@
+-- Tables the backend needs beyond the core Supabase tables (shipment, alerts, user, ...).
+-- Apply once per database, e.g. in the Supabase SQL editor or with
+--     psql "$DATABASE_URL" -f backend/schema.sql
+-- Every statement is idempotent.
+
+-- Risk state (agents/risk_state.py): active disruptions and the shipments each affects,
+-- one row per (disruption, shipment) so processes only write the rows they change.
+CREATE TABLE IF NOT EXISTS risk_disruptions (
+    key text PRIMARY KEY,
+    disruption jsonb NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS risk_exposures (
+    disruption_key text NOT NULL REFERENCES risk_disruptions (key) ON DELETE CASCADE,
+    product_id text NOT NULL,
+    report jsonb NOT NULL,
+    PRIMARY KEY (disruption_key, product_id)
+);
+CREATE INDEX IF NOT EXISTS risk_exposures_product_id ON risk_exposures (product_id);
+
+-- Scheduler leader lease (scheduler.py, SCHEDULER_LOCK=db): one row per lock name,
+-- held by `owner` until `expires_at` (epoch seconds).
+CREATE TABLE IF NOT EXISTS scheduler_lock (
+    name text PRIMARY KEY,
+    owner text NOT NULL,
+    expires_at float8 NOT NULL
+);
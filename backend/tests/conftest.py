@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Backend modules use top-level imports (e.g. `from db import ...`), so put backend/ on the path
+sys.path.insert(0, str(Path(__file__).parent.parent))
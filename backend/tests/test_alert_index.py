@@ -0,0 +1,67 @@
+import pytest
+
+import db
+from fake_db import InMemoryClient
+import agents.alert_index as alert_index_module
+from agents.alert_index import AlertIndex, retrieve_chat_context
+
+ALERTS = [
+    {"event": {"event_type": "Strike", "location": "Chennai Port", "severity": "High"},
+     "risk_report": [{"product_id": "P1", "summary": "Dock workers strike halts unloading"}]},
+    {"event": {"event_type": "Weather", "location": "Mumbai", "severity": "Medium"},
+     "risk_report": [{"product_id": "P2", "summary": "Monsoon flooding on the highway"}]},
+    {"event": {"event_type": "Port Congestion", "location": "Singapore", "severity": "Low"},
+     "action_plan": [{"product_id": "P3", "recommended_actions": ["Reroute via Port Klang"]}]},
+]
+
+@pytest.fixture
+def memory_db():
+    client = db.init_db(InMemoryClient())
+    yield client
+    db.close_db()
+
+def test_search_ranks_relevant_alert_first(tmp_path, memory_db):
+    index = AlertIndex(tmp_path / "index.jsonl")
+    for alert in ALERTS:
+        index.add(db.insert_alert(alert))
+    assert index.search("flooding monsoon Mumbai")[0][0] == 2
+    assert index.search("reroute klang")[0][0] == 3
+    assert index.search("zzz") == []
+
+def test_index_persists_and_catches_up(tmp_path, memory_db):
+    path = tmp_path / "index.jsonl"
+    AlertIndex(path).add(db.insert_alert(ALERTS[0]))
+    db.insert_alert(ALERTS[1])  # written without indexing, e.g. by another process
+    reloaded = AlertIndex(path)
+    reloaded.load()
+    assert len(reloaded) == 1 and reloaded.max_id == 1
+    assert reloaded.sync() == 1
+    assert reloaded.search("monsoon")[0][0] == 2
+
+def test_sync_reads_in_pages_and_compacts_duplicates(tmp_path, memory_db, monkeypatch):
+    path = tmp_path / "index.jsonl"
+    reads = []
+    real_read = alert_index_module.list_alerts_after
+    monkeypatch.setattr(alert_index_module, "list_alerts_after",
+                        lambda after, columns, limit: reads.append(after) or real_read(after, columns, limit))
+    for alert in ALERTS * 2:
+        db.insert_alert(alert)
+    first, second = AlertIndex(path, page_size=4), AlertIndex(path, page_size=4)
+    assert first.sync() == 6 and reads == [0, 4]
+    first.add(db.get_alerts([1, 2]))  # re-indexed rows, e.g. appended by another worker
+    assert len(path.read_text().splitlines()) == 8
+    second.load()
+    assert len(second) == 6 and len(path.read_text().splitlines()) == 6
+    assert second.search("monsoon")[0][0] == 5
+
+def test_background_sync_keeps_requests_off_the_database(tmp_path, memory_db, monkeypatch):
+    index = AlertIndex(tmp_path / "index.jsonl", sync_interval=3600)
+    monkeypatch.setattr(alert_index_module, "alert_index", index)
+    for alert in ALERTS:
+        db.insert_alert(alert)
+    monkeypatch.setattr(alert_index_module, "list_alerts", lambda limit: [])
+    assert "Chennai" not in retrieve_chat_context("strike at chennai", k=1)  # nothing indexed yet
+    index.start()
+    index.stop()
+    context = retrieve_chat_context("strike at chennai", k=1)
+    assert "Chennai Port" in context and "Mumbai" not in context
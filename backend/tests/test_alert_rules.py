@@ -0,0 +1,82 @@
+from utils.alert_rules import AlertRouter, AlertRules, subscription_from_settings
+
+def _settings(**prefs):
+    return {"notifications": {"email": True, "slack": False, "sms": False, **prefs}}
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.sent = []
+
+    def notify(self, channel, to, subject, body):
+        self.sent.append((channel, to, subject))
+        return True
+
+ROWS = [
+    {"user_id": "1", "settings": _settings(min_severity="Low")},
+    {"user_id": "2", "settings": _settings(min_severity="High", locations=["Chennai"], sms=True, phone="+999")},
+    {"user_id": "3", "settings": _settings(min_severity="Medium", modes=["sea"])},
+    {"user_id": "4", "settings": _settings(email=False)},  # nothing deliverable
+    {"user_id": "demo", "settings": _settings(min_severity="Low", email_address="victim@test")},  # no account
+]
+CONTACTS = {"1": {"email": "a@test"}, "2": {"email": "b@test", "phone": "+100"}, "3": {"email": "c@test"}, "4": {"email": "d@test"}}
+
+def test_rules_route_by_severity_location_and_mode():
+    subs = [subscription_from_settings(r["user_id"], r["settings"], CONTACTS.get(r["user_id"])) for r in ROWS]
+    assert subs[3] is None and subs[4] is None
+    rules = AlertRules([s for s in subs if s])
+    match = lambda *args: sorted(s.user_id for s in rules.match(*args))
+    assert match("High", "chennai ", "sea") == ["1", "2", "3"]
+    assert match("Medium", "Chennai", "air") == ["1"]
+    assert match("Critical", "Mumbai", "sea") == ["1", "3"]
+    assert match("Low", "Chennai", "sea") == ["1"]
+
+def test_settings_page_schema_is_understood():
+    # As saved by frontend/src/pages/Settings.tsx
+    row = {"settings": {"notifications": {"emailAlerts": True, "pushNotifications": False, "smsAlerts": True,
+                                          "riskThreshold": "high"},
+                        "display": {"darkMode": False}}}
+    sub = subscription_from_settings("2", row, CONTACTS["2"])
+    assert sub.channels == (("email", "b@test"), ("sms", "+100")) and sub.min_level == 2
+    off = {"notifications": {"emailAlerts": False, "smsAlerts": False, "riskThreshold": "low"}}
+    assert subscription_from_settings("2", off, CONTACTS["2"]) is None
+
+def test_fan_out_deduplicates_and_throttles_per_subscriber():
+    dispatcher = RecordingDispatcher()
+    router = AlertRouter(loader=lambda: ROWS, contact_lookup=lambda ids: CONTACTS, dispatcher=dispatcher, subscriber_rate="2/hour")
+    event = {"event_type": "Strike", "location": "Chennai", "severity": "High", "timestamp": "t1", "mode": "road"}
+    alert = {"event": event, "severity": "High", "location": "Chennai", "risk_report": [{"product_id": "P1", "risk_score": 80}]}
+    assert router.fan_out(alert) == 3  # user 1 email, user 2 email + sms
+    # The account's phone, not the one written into the settings
+    assert ("sms", "+100", "[High] Strike at Chennai") in dispatcher.sent
+    assert router.fan_out(alert) == 0  # same alert again
+    assert router.fan_out({**alert, "event": {**event, "timestamp": "t2"}}) == 3
+    assert router.fan_out({**alert, "event": {**event, "timestamp": "t3"}}) == 0  # 2/hour per subscriber and channel
+    assert router.metrics() == {"alerts": 4, "notified": 6, "deduplicated": 3, "throttled": 3, "subscriptions": 3}
+
+def test_settings_are_saved_for_the_authenticated_account_only(monkeypatch):
+    from datetime import datetime, timedelta
+    import jwt
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import auth
+    import db
+    from fake_db import InMemoryClient
+    from routes.analytics import analytics_router
+    monkeypatch.setattr(auth, "AUTH_ENABLED", True)
+    memory = db.init_db(InMemoryClient({"user_settings": []}))
+    try:
+        app = FastAPI()
+        app.include_router(analytics_router)
+        client = TestClient(app)
+        settings = {"notifications": {"email": True}}
+        assert client.post("/user/settings/?user_id=2", json=settings).status_code == 401
+        token = jwt.encode({"sub": "a@test", "id": 1, "exp": datetime.utcnow() + timedelta(hours=1)}, auth.JWT_SECRET, algorithm="HS256")
+        resp = client.post("/user/settings/?user_id=2", json=settings, headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 200
+        assert [r["user_id"] for r in memory.table("user_settings").select("user_id").execute().data] == ["1"]
+        # The Settings page's envelope is unwrapped, so GET hands back what was saved
+        client.post("/user/settings/", json={"settings": settings}, headers={"Authorization": f"Bearer {token}"})
+        assert client.get("/user/settings/", headers={"Authorization": f"Bearer {token}"}).json() == {"settings": settings}
+    finally:
+        db.close_db()
+        auth.token_cache.clear()
@@ -0,0 +1,91 @@
+import json
+
+import httpx
+import pytest
+
+from audit import AuditSink, is_transient
+
+class SchemaError(Exception):
+    code = "23502"  # not_null_violation
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+@pytest.fixture
+def sink(tmp_path):
+    def make(writer, batch_size=50):
+        return AuditSink(writer=writer, spool_path=str(tmp_path / "spool.jsonl"), batch_size=batch_size,
+                         flush_interval=0.01, replay_interval=3600, dead_letter_path=str(tmp_path / "dead.jsonl"))
+    return make
+
+def test_batches_are_split_by_keys(sink):
+    written = []
+    audit = sink(written.append, batch_size=3)
+    for i in range(3):
+        audit._queue.put_nowait({"action": "a", "n": i})
+    audit._queue.put_nowait({"action": "b", "n": 3, "severity": "high"})
+    batch = audit._next_batch()
+    assert [e["n"] for e in batch] == [0, 1, 2]
+    assert audit._write(batch + [audit._next_batch()[0]])
+    # The entry carrying severity goes in its own insert, so the others keep the column default
+    assert [[e["n"] for e in b] for b in written] == [[0, 1, 2], [3]]
+
+def test_stop_drains_the_queue(sink):
+    written = []
+    audit = sink(written.extend)
+    for i in range(5):
+        audit.enqueue({"action": "a", "n": i})
+    audit.stop()
+    assert [e["n"] for e in written] == list(range(5)) and audit.pending() == 0
+
+def test_transient_failures_are_spooled_and_replayed(sink, tmp_path):
+    down = [True]
+    written = []
+    def writer(batch):
+        if down[0]:
+            raise httpx.ConnectError("connection refused")
+        written.extend(batch)
+    audit = sink(writer)
+    assert not audit._write([{"action": "a"}, {"action": "b", "status": "ok"}])
+    assert len(read_jsonl(tmp_path / "spool.jsonl")) == 2
+    down[0] = False
+    audit._replay_spool()
+    assert written == [{"action": "a"}, {"action": "b", "status": "ok"}]
+    assert not (tmp_path / "spool.jsonl").exists()
+
+def test_rejected_entries_are_dead_lettered_not_replayed(sink, tmp_path):
+    written = []
+    def writer(batch):
+        if any(e["action"] is None for e in batch):
+            raise SchemaError('null value in column "action" violates not-null constraint')
+        written.extend(batch)
+    audit = sink(writer)
+    assert audit._write([{"action": "a"}, {"action": None}, {"action": "c"}])
+    assert written == [{"action": "a"}, {"action": "c"}]
+    assert not (tmp_path / "spool.jsonl").exists()
+    [dead] = read_jsonl(tmp_path / "dead.jsonl")
+    assert dead["entry"] == {"action": None} and "not-null" in dead["error"]
+
+def test_transient_error_codes():
+    assert is_transient(TimeoutError()) and is_transient(httpx.ReadTimeout("slow"))
+    assert is_transient(type("E", (Exception,), {"code": "08006"})())
+    assert is_transient(type("E", (Exception,), {"code": 503})())
+    assert not is_transient(SchemaError()) and not is_transient(ValueError("bad entry"))
+
+def test_replay_file_survives_a_crash_and_is_replayed_first(sink, tmp_path):
+    spool, replay = tmp_path / "spool.jsonl", tmp_path / "spool.jsonl.replay"
+    def crash(batch):
+        raise KeyboardInterrupt  # the process dies mid-delivery
+    audit = sink(crash)
+    audit._spool([{"action": "old"}])
+    with pytest.raises(KeyboardInterrupt):
+        audit._replay_spool()
+    assert read_jsonl(replay) == [{"action": "old"}]
+    # After a restart more entries were spooled; the interrupted replay goes first and is not overwritten
+    written = []
+    restarted = sink(written.extend)
+    restarted._spool([{"action": "new"}])
+    restarted._replay_spool()
+    assert written == [{"action": "old"}] and not replay.exists()
+    restarted._replay_spool()
+    assert written == [{"action": "old"}, {"action": "new"}] and not spool.exists()
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+
+def _token(role="viewer", hours=1, **claims):
+    payload = {"sub": f"{role}@example.com", "id": 7, "role": role, "is_superuser": False,
+               "is_active": True, "is_verified": True, "exp": datetime.utcnow() + timedelta(hours=hours), **claims}
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=jwt.encode(payload, auth.JWT_SECRET, algorithm="HS256"))
+
+@pytest.fixture(autouse=True)
+def auth_enabled(monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_ENABLED", True)
+    auth.token_cache.clear()
+
+def test_role_hierarchy_is_enforced():
+    operator = _token("operator")
+    assert auth.get_current_user_role("operator")(operator)["role"] == "operator"
+    assert auth.get_current_user_role()(operator)["email"] == "operator@example.com"
+    assert auth.get_current_user_role("operator")(_token("admin"))["role"] == "admin"
+    with pytest.raises(HTTPException) as exc:
+        auth.get_current_user_role("admin")(operator)
+    assert exc.value.status_code == 403
+    assert auth.get_current_user_role("admin")(_token("viewer", is_superuser=True))["is_superuser"]
+
+def test_verified_tokens_are_cached(monkeypatch):
+    creds = _token()
+    calls = []
+    decode = jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **k: calls.append(1) or decode(*a, **k))
+    dep = auth.get_current_user_role()
+    assert dep(creds) == dep(creds)
+    assert len(calls) == 1
+
+def test_rejects_missing_invalid_and_expired_tokens():
+    dep = auth.get_current_user_role()
+    for creds in (None, HTTPAuthorizationCredentials(scheme="Bearer", credentials="junk"), _token(hours=-1)):
+        with pytest.raises(HTTPException) as exc:
+            dep(creds)
+        assert exc.value.status_code == 401
+
+def test_cache_is_bounded():
+    cache = auth.TokenCache(max_size=2)
+    for i in range(3):
+        cache.put(f"t{i}", {"i": i}, exp=datetime.utcnow().timestamp() + 60)
+    assert cache.get("t0") is None and cache.get("t2") == {"i": 2}
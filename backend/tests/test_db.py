@@ -0,0 +1,58 @@
+import pytest
+
+import db
+from fake_db import InMemoryClient, FakeAPIError
+
+@pytest.fixture
+def memory_db():
+    client = db.init_db(InMemoryClient({
+        "shipment": [
+            {"product_id": "P1001", "status": "in-transit", "route": ["Bangalore", "Pune"]},
+            {"product_id": "P1002", "status": "delivered", "route": ["Chennai"]},
+        ],
+    }))
+    yield client
+    db.close_db()
+
+def test_shared_client_is_reused(memory_db):
+    assert db.get_client() is memory_db
+
+def test_shipment_helpers(memory_db):
+    assert db.get_shipment("P1001")["status"] == "in-transit"
+    assert db.get_shipment("NOPE") is None
+    assert db.update_shipment("P1002", {"status": "delayed"})[0]["status"] == "delayed"
+    assert db.update_shipment("NOPE", {"status": "delayed"}) == []
+    assert db.get_all_shipments("product_id") == [{"product_id": "P1001"}, {"product_id": "P1002"}]
+
+def test_alert_helpers(memory_db):
+    event = {"event_type": "Strike", "location": "Bangalore", "timestamp": "2025-07-25T12:00:00Z"}
+    assert not db.alert_exists_for_event(event)
+    db.insert_alert({"event": event, "risk_report": []})
+    db.insert_alert({"event": {**event, "location": "Pune"}, "risk_report": []})
+    assert db.alert_exists_for_event(event)
+    assert [a["id"] for a in db.list_alerts(limit=1)] == [2]
+
+def test_query_builder_filters_and_count(memory_db):
+    for i in range(5):
+        db.create_user({"email": f"user{i}@Example.com", "role": "viewer"})
+    resp = (memory_db.table("user").select("id,email", count="exact")
+            .ilike("email", "%example.com").order("id", desc=True).range(1, 2).execute())
+    assert resp.count == 5
+    assert [u["id"] for u in resp.data] == [4, 3]
+    assert set(resp.data[0]) == {"id", "email"}
+    with pytest.raises(FakeAPIError):
+        memory_db.table("user").select("*").eq("role", "viewer").single().execute()
+
+def test_list_users_page_pushes_down_search_and_projection(memory_db):
+    for i in range(5):
+        db.create_user({"email": f"user{i}@Example.com", "role": "viewer", "hashed_password": "x"})
+    db.create_user({"email": "ops_lead@corp.com", "role": "admin", "hashed_password": "x"})
+    db.create_user({"email": "opsXlead@corp.com", "role": "admin", "hashed_password": "x"})
+    users, total = db.list_users_page(page=2, page_size=2, search="EXAMPLE")
+    assert total == 5
+    assert [u["email"] for u in users] == ["user2@Example.com", "user3@Example.com"]
+    assert all("hashed_password" not in u for u in users)
+    # LIKE wildcards in the search term are matched literally
+    users, total = db.list_users_page(search="ops_lead")
+    assert total == 1 and users[0]["email"] == "ops_lead@corp.com"
+    assert db.list_users_page(page=9, search="example") == ([], 5)
@@ -0,0 +1,88 @@
+import asyncio
+import math
+
+import pytest
+
+from utils.gps_simulator import ScaledClock, VirtualClock, simulate_fleet
+from utils.route_geometry import CITY_COORDS, haversine_km
+
+def test_virtual_clock_wakes_sleepers_in_time_order():
+    clock = VirtualClock()
+    woke = []
+
+    async def sleeper(name, delays):
+        for delay in delays:
+            await clock.sleep(delay)
+            woke.append((clock.now(), name))
+        return name
+
+    results = asyncio.run(clock.run([sleeper("a", [30, 30]), sleeper("b", [45]), sleeper("c", [0, 10])]))
+    assert results == ["a", "b", "c"]
+    assert woke == [(0, "c"), (10, "c"), (30, "a"), (45, "b"), (60, "a")]
+    assert clock.now() == 60
+
+def test_virtual_clock_waits_for_running_coroutines_before_jumping():
+    clock = VirtualClock()
+    seen = []
+
+    async def slow_worker():
+        await asyncio.sleep(0.01)  # real work: the clock must not advance meanwhile
+        seen.append(clock.now())
+        await clock.sleep(5)
+
+    async def sleeper():
+        await clock.sleep(100)
+        seen.append(clock.now())
+
+    asyncio.run(clock.run([slow_worker(), sleeper()]))
+    assert seen == [0, 100]
+
+def test_fleet_reports_every_tick_and_ends_at_the_destination():
+    positions = {}
+
+    async def ingest(product_id, lat, lon):
+        positions.setdefault(product_id, []).append((lat, lon))
+
+    shipments = [{"product_id": "P1", "route": ["Chennai", "Bangalore"]},
+                 {"product_id": "P2", "route": ["mumbai", "Nowhere", "Port of Pune"]},
+                 {"product_id": "P3", "route": ["Atlantis"]}]
+    stats = asyncio.run(simulate_fleet(shipments, speed_kmh=60, tick_seconds=1800, ingest=ingest))
+    leg_hours = haversine_km(CITY_COORDS["Chennai"], CITY_COORDS["Bangalore"]) / 60
+    # The first fix at the origin, then one every half hour of virtual time up to arrival
+    assert len(positions["P1"]) == 1 + math.ceil(leg_hours * 2)
+    assert positions["P1"][0] == pytest.approx(CITY_COORDS["Chennai"])
+    assert positions["P1"][-1] == pytest.approx(CITY_COORDS["Bangalore"])
+    # Names resolve like everywhere else (case, "Port of ..."); unknown stops are skipped
+    assert positions["P2"][0] == pytest.approx(CITY_COORDS["Mumbai"])
+    assert positions["P2"][-1] == pytest.approx(CITY_COORDS["Pune"])
+    assert "P3" not in positions
+    assert stats["shipments"] == 3 and stats["errors"] == 0
+    assert stats["updates"] == sum(len(p) for p in positions.values())
+    assert stats["virtual_seconds"] == pytest.approx(leg_hours * 3600, abs=0.1)
+
+def test_fleet_counts_failed_pushes_and_runs_sync_ingest_in_threads():
+    calls = []
+
+    def ingest(product_id, lat, lon):
+        calls.append(product_id)
+        if len(calls) % 2 == 0:
+            raise ConnectionError("ingest down")
+
+    stats = asyncio.run(simulate_fleet([{"product_id": "P1", "route": ["Hubli", "Pune"]}], tick_seconds=3600,
+                                       ingest=ingest, max_concurrency=1))
+    assert stats["updates"] + stats["errors"] == len(calls) and stats["errors"] == len(calls) // 2
+
+def test_scaled_clock_runs_faster_than_real_time():
+    clock = ScaledClock(time_scale=36000)
+
+    async def trip():
+        await clock.sleep(3600)  # one virtual hour is 0.1 s of wall time
+        return clock.now()
+
+    [virtual] = asyncio.run(clock.run([trip()]))
+    assert 3600 <= virtual < 36000
+
+@pytest.mark.parametrize("options", [{"speed_kmh": 0}, {"speed_kmh": -5}, {"tick_seconds": 0}])
+def test_fleet_rejects_non_positive_speed_and_tick(options):
+    with pytest.raises(ValueError):
+        asyncio.run(simulate_fleet([{"product_id": "P1", "route": ["Chennai", "Bangalore"]}], **options))
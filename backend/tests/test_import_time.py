@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).parent.parent
+# Dependencies that must only load on first use (agent calls, notifications, DB client creation)
+HEAVY_MODULES = ["langchain", "langchain_groq", "pandas", "tweepy", "slack_sdk", "twilio", "supabase", "apscheduler"]
+IMPORT_BUDGET_SECONDS = float(os.getenv("APP_IMPORT_BUDGET_SECONDS", 3.0))
+
+def _import_profile():
+    """Run `import app` in a fresh interpreter with -X importtime; return the profile and what got loaded."""
+    probe = (
+        "import sys, threading, app; "
+        f"print('HEAVY=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules)); "
+        "print('THREADS=' + ','.join(t.name for t in threading.enumerate()))"
+    )
+    env = {**os.environ, "DB_BACKEND": "memory", "LOG_TO_STDOUT": "false"}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+            if cumulative.isdigit():
+                profile[name.strip()] = int(cumulative) / 1e6
+    probes = dict(line.split("=", 1) for line in proc.stdout.splitlines() if line.startswith(("HEAVY=", "THREADS=")))
+    return profile, probes["HEAVY"], probes["THREADS"]
+
+def test_app_import_is_lazy_and_fast():
+    pytest.importorskip("fastapi")
+    profile, heavy_loaded, threads = _import_profile()
+    slowest = sorted(profile.items(), key=lambda kv: kv[1], reverse=True)[:10]
+    print("Slowest imports (cumulative s):", slowest)
+    assert heavy_loaded == "", f"heavy modules imported eagerly: {heavy_loaded}"
+    assert "APScheduler" not in threads
+    assert profile.get("app", 0) < IMPORT_BUDGET_SECONDS
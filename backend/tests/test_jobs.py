@@ -0,0 +1,46 @@
+import jobs
+from jobs import JobQueue, job_handler, run_job
+
+def test_queue_claims_each_job_once_and_stores_results(tmp_path):
+    queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"))
+    first = queue.enqueue("echo", {"n": 1}, actor="ops@test")
+    second = queue.enqueue("echo", {"n": 2})
+    job = queue.claim("w1")
+    assert (job["id"], job["payload"], queue.get(first)["status"]) == (first, {"n": 1}, "running")
+    assert queue.claim("w2")["id"] == second
+    assert queue.claim("w3") is None
+    queue.complete(first, {"alerts": [1]})
+    queue.fail(second, "boom")
+    assert queue.get(first)["result"] == {"alerts": [1]}
+    assert queue.get(second)["error"] == "boom"
+    assert queue.counts()["done"] == 1 and queue.counts()["failed"] == 1
+
+def test_stale_jobs_are_requeued_then_failed(tmp_path):
+    queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), timeout=-1, max_attempts=2)
+    job_id = queue.enqueue("echo", {})
+    queue.claim("w1")
+    assert queue.requeue_stale() == 1
+    assert queue.claim("w2")["attempts"] == 2
+    assert queue.requeue_stale() == 0
+    assert queue.get(job_id)["status"] == "failed"
+
+def test_run_job_dispatches_to_registered_handler(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HANDLERS", {})
+    job_handler("double")(lambda payload: payload["n"] * 2)
+    assert run_job({"id": 1, "kind": "double", "payload": {"n": 4}}) == (True, 8)
+    ok, error = run_job({"id": 2, "kind": "double", "payload": {}})
+    assert not ok and isinstance(error, KeyError)
+    assert run_job({"id": 3, "kind": "missing", "payload": {}})[0] is False
+
+def test_heartbeats_keep_slow_jobs_from_being_requeued(tmp_path):
+    queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), timeout=60)
+    job_id = queue.enqueue("echo", {})
+    queue.claim("w1")
+    with queue._session() as conn:  # started long ago, still beating
+        conn.execute("UPDATE jobs SET started_at = started_at - 3600 WHERE id = ?", (job_id,))
+    assert queue.heartbeat(job_id, "w1")
+    assert queue.requeue_stale() == 0
+    with queue._session() as conn:  # heartbeat stopped
+        conn.execute("UPDATE jobs SET heartbeat_at = heartbeat_at - 120 WHERE id = ?", (job_id,))
+    assert queue.requeue_stale() == 1
+    assert not queue.heartbeat(job_id, "w1")
@@ -0,0 +1,35 @@
+from agents.llm_json import extract_items, match_to_inputs, parse_llm_items, request_items
+from models import RiskReportItem, ActionPlanItem
+
+def test_extracts_array_from_fenced_chatty_output_with_trailing_commas():
+    text = 'Here you go:\n```json\n[\n {"product_id": "P1", "risk_score": 80,},\n {"product_id": "P2", "risk_score": 20}\n]\n```'
+    assert [i["product_id"] for i in extract_items(text)[0]] == ["P1", "P2"]
+
+def test_salvages_valid_objects_from_broken_or_truncated_array():
+    text = '[{"product_id": "P1", "risk_score": 80}, {"product_id": "P2", "risk_score": oops}, {"product_id": "P3", "risk_sc'
+    items, skipped = extract_items(text)
+    assert [i["product_id"] for i in items] == ["P1"] and skipped == 2
+    assert extract_items('{"product_id": "P1"} and {"product_id": "P2", "legs": [{"x": 1}]}')[0][1]["legs"] == [{"x": 1}]
+
+def test_schema_validation_coerces_and_drops_invalid_items():
+    text = '[{"product_id": 1001, "risk_score": "72.5", "extra": true}, {"product_id": "P2"}]'
+    assert parse_llm_items(text, RiskReportItem) == [{"product_id": "1001", "risk_score": 72.5, "extra": True}]
+    assert parse_llm_items('[{"product_id": "P1", "recommended_actions": "reroute"}]', ActionPlanItem) == []
+
+def test_request_items_re_requests_only_missing_inputs():
+    calls = []
+    def run(reports):
+        calls.append([r["product_id"] for r in reports])
+        if len(calls) == 1:
+            return ['[{"product_id": "P1", "risk_score": 10}, {"product_id": "P2"}]']
+        return ['[' + ",".join(f'{{"product_id": "{r["product_id"]}", "risk_score": 50}}' for r in reports) + ']']
+    items, unanswered = request_items(run, [{"product_id": p} for p in ("P1", "P2", "P3")], RiskReportItem,
+                                      key=lambda r: r["product_id"], retries=1)
+    assert calls == [["P1", "P2", "P3"], ["P2", "P3"]]
+    assert sorted(i["product_id"] for i in items) == ["P1", "P2", "P3"] and unanswered == []
+
+def test_echoed_key_wins_over_product_order():
+    inputs = [{"product_id": "P1", "event": "strike"}, {"product_id": "P1", "event": "flood"}, {"product_id": "P2", "event": "flood"}]
+    items = [{"product_id": "P1", "event": "flood"}, {"product_id": "P2"}, {"product_id": "P1", "event": "made up"}]
+    pairs = match_to_inputs(items, inputs, key=lambda i: i["product_id"], echo=("event", lambda i: i["event"]))
+    assert [entry and entry["event"] for _, entry in pairs] == ["flood", "flood", "strike"]
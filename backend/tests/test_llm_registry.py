@@ -0,0 +1,27 @@
+import pytest
+
+from agents import llm_registry
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(llm_registry, "_llms", {})
+    monkeypatch.setattr(llm_registry, "_chains", {})
+    monkeypatch.setattr(llm_registry, "_make_llm", lambda model_name: object())
+
+def test_only_allowed_models_resolve(monkeypatch):
+    monkeypatch.setattr(llm_registry, "LLM_MODELS", [llm_registry.GROQ_MODEL])
+    assert llm_registry.resolve_model(None) == llm_registry.GROQ_MODEL
+    with pytest.raises(ValueError):
+        llm_registry.resolve_model("caller-chosen-model")
+    monkeypatch.setattr(llm_registry, "LLM_MODELS", ["a", "b"])
+    assert llm_registry.resolve_model("b") == "b"
+
+def test_clients_are_cached_per_allowed_model(monkeypatch):
+    monkeypatch.setattr(llm_registry, "LLM_MODELS", [llm_registry.GROQ_MODEL, "small"])
+    default = llm_registry.get_llm()
+    assert llm_registry.get_llm(llm_registry.GROQ_MODEL) is default
+    assert llm_registry.get_llm("small") is not default
+    for i in range(50):
+        with pytest.raises(ValueError):
+            llm_registry.get_llm(f"model-{i}")
+    assert sorted(llm_registry._llms) == sorted([llm_registry.GROQ_MODEL, "small"])
@@ -0,0 +1,106 @@
+import json
+import logging
+import sys
+
+import pytest
+
+import logging_config
+from logging_config import DeferredQueueHandler, JsonFormatter, setup_logging, shutdown_logging
+from tracing import EventLogger, traced
+
+class CountingRepr:
+    renders = 0
+
+    def __repr__(self):
+        CountingRepr.renders += 1
+        return "counted"
+
+def test_event_logger_emits_structured_records(caplog):
+    caplog.set_level(logging.INFO, logger="test.events")
+    log = EventLogger("test.events")
+    log("shipment_moved", product_id="P1", route=["Chennai"] * 500)
+    [record] = caplog.records
+    assert record.event == "shipment_moved" and record.levelno == logging.INFO
+    # The caller, not EventLogger, is recorded as the origin
+    assert record.funcName == "test_event_logger_emits_structured_records"
+    message = record.getMessage()
+    assert message.startswith("shipment_moved | product_id=P1 | route=['Chennai', ") and "..." in message
+    entry = json.loads(JsonFormatter().format(record))
+    assert (entry["event"], entry["logger"], entry["level"]) == ("shipment_moved", "test.events", "INFO")
+
+def test_disabled_levels_render_nothing(caplog):
+    caplog.set_level(logging.INFO, logger="test.events")
+    CountingRepr.renders = 0
+    log = EventLogger("test.events")
+    log.debug("llm_payload", payload=CountingRepr())
+    assert caplog.records == [] and CountingRepr.renders == 0
+    log.error("llm_failed", payload=CountingRepr())
+    assert caplog.records[0].levelno == logging.ERROR and "payload=counted" in caplog.records[0].getMessage()
+
+def test_traced_logs_entry_exit_and_failures(caplog):
+    caplog.set_level(logging.DEBUG, logger=__name__)
+
+    @traced
+    def score(shipment, factor=2):
+        if factor < 0:
+            raise ValueError("negative factor")
+        return shipment["risk"] * factor
+
+    assert score({"risk": 21}) == 42
+    assert [r.getMessage() for r in caplog.records] == [
+        "[ENTER] score args=({'risk': 21},) kwargs={}", "[EXIT] score returned 42"]
+    caplog.clear()
+    caplog.set_level(logging.INFO, logger=__name__)
+    with pytest.raises(ValueError):
+        score({"risk": 1}, factor=-1)
+    [record] = caplog.records  # failures are logged even when entry/exit tracing is off
+    assert record.levelno == logging.ERROR and record.exc_info[0] is ValueError
+
+def test_queue_listener_flushes_every_record_on_shutdown(tmp_path, monkeypatch):
+    monkeypatch.setattr(logging_config, "LOG_TO_STDOUT", False)
+    monkeypatch.setattr(logging_config, "_listener", None)  # an app import may already have set up logging
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "level", root.level)
+    setup_logging(log_dir=str(tmp_path))
+    queue_handler = logging_config._queue_handler
+    try:
+        log = EventLogger("test.flush")
+        for i in range(500):
+            log("tick", n=i)
+        logging.getLogger("test.flush").info("request", extra={"http": {"status": 200}})
+    finally:
+        shutdown_logging()
+    entries = [json.loads(line) for line in (tmp_path / "supplywhiz.log").read_text().splitlines()]
+    assert len(entries) == 501 and entries[-1]["http"] == {"status": 200}
+    assert [e["message"] for e in entries[:2]] == ["tick | n=0", "tick | n=1"]
+    assert logging_config._listener is None and queue_handler not in root.handlers
+
+def test_queue_handler_leaves_formatting_to_the_listener():
+    import queue
+    log_queue = queue.SimpleQueue()
+    CountingRepr.renders = 0
+    try:
+        raise ValueError("bad shipment")
+    except ValueError:
+        record = logging.getLogger("test.queue").makeRecord(
+            "test.queue", logging.ERROR, __file__, 1, "failed %r", (CountingRepr(),), sys.exc_info())
+    DeferredQueueHandler(log_queue).emit(record)
+    queued = log_queue.get_nowait()
+    assert queued is record and queued.exc_info[0] is ValueError and CountingRepr.renders == 0
+
+def test_logged_exceptions_reach_the_json_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(logging_config, "LOG_TO_STDOUT", False)
+    monkeypatch.setattr(logging_config, "_listener", None)
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "level", root.level)
+    setup_logging(log_dir=str(tmp_path))
+    try:
+        try:
+            {}["missing"]
+        except KeyError:
+            logging.getLogger("test.flush").exception("lookup failed for %s", "P1")
+    finally:
+        shutdown_logging()
+    [entry] = [json.loads(line) for line in (tmp_path / "supplywhiz.log").read_text().splitlines()]
+    assert entry["message"] == "lookup failed for P1"
+    assert "Traceback" in entry["exc_info"] and "KeyError: 'missing'" in entry["exc_info"]
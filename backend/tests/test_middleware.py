@@ -0,0 +1,83 @@
+import logging
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from middleware import RequestLoggingMiddleware
+
+def make_client(**options):
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((f"chunk {i}\n" for i in range(3)), media_type="text/plain")
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("kaboom")
+
+    @app.get("/broken_stream")
+    def broken_stream():
+        def chunks():
+            yield "first\n"
+            raise RuntimeError("stream died")
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app.add_middleware(RequestLoggingMiddleware, **{"sample_rate": 1, "body_max_bytes": 16, **options})
+    return TestClient(app, raise_server_exceptions=False)
+
+def request_logs(caplog):
+    return [r for r in caplog.records if r.name == "supplywhiz.requests" and hasattr(r, "http")]
+
+def test_sampled_request_logs_redacted_headers_and_capped_body(caplog):
+    caplog.set_level(logging.INFO, logger="supplywhiz.requests")
+    body = '{"query": "' + "x" * 100 + '"}'
+    resp = make_client().post("/echo?debug=1", content=body,
+                              headers={"Content-Type": "application/json", "Authorization": "Bearer secret"})
+    assert resp.json() == {"size": len(body)}  # the app still reads the whole body
+    [record] = request_logs(caplog)
+    fields = record.http
+    assert (fields["method"], fields["path"], fields["query"], fields["status"]) == ("POST", "/echo", "debug=1", 200)
+    assert fields["sampled"] and len(fields["request_id"]) == 12 and fields["duration_ms"] >= 0
+    assert fields["headers"]["authorization"] == "[REDACTED]"
+    assert fields["headers"]["content-type"] == "application/json"
+    assert fields["body"] == body[:16]
+    assert record.levelno == logging.INFO
+
+def test_streaming_response_is_logged_once_it_completes(caplog):
+    caplog.set_level(logging.INFO, logger="supplywhiz.requests")
+    resp = make_client().get("/stream")
+    assert resp.text == "chunk 0\nchunk 1\nchunk 2\n"
+    [record] = request_logs(caplog)
+    assert record.http["status"] == 200 and "body" not in record.http
+
+def test_exception_becomes_500_and_is_logged_even_when_not_sampled(caplog):
+    caplog.set_level(logging.INFO, logger="supplywhiz.requests")
+    client = make_client(sample_rate=0)
+    assert client.get("/stream").status_code == 200
+    assert request_logs(caplog) == []  # unsampled, fast and successful: nothing logged
+    resp = client.get("/boom")
+    assert resp.status_code == 500 and resp.json() == {"detail": "Internal Server Error"}
+    [record] = request_logs(caplog)
+    assert record.levelno == logging.ERROR and record.http["status"] == 500 and not record.http["sampled"]
+    assert "headers" not in record.http
+    assert any("Unhandled exception: GET /boom" in r.getMessage() for r in caplog.records)
+
+def test_failure_after_the_response_started_keeps_its_status(caplog):
+    caplog.set_level(logging.INFO, logger="supplywhiz.requests")
+    with pytest.raises(RuntimeError):
+        TestClient(make_client().app).get("/broken_stream")
+    [record] = request_logs(caplog)
+    assert record.http["status"] == 200 and record.http["path"] == "/broken_stream"
+
+def test_slow_requests_are_logged_as_warnings(caplog):
+    caplog.set_level(logging.INFO, logger="supplywhiz.requests")
+    make_client(sample_rate=0, slow_ms=0).get("/stream")
+    [record] = request_logs(caplog)
+    assert record.levelno == logging.WARNING
@@ -0,0 +1,25 @@
+from migrate_normalize_alerts import normalize_alert
+from utils.route_geometry import LocationNameIndex, RouteIndex
+from agents.risk_analyzer import disruption_key
+
+SHIPMENTS = [{"product_id": "P1", "route": ["Chennai", "Kolkata"]}, {"product_id": "P2", "route": ["Singapore"]}]
+EVENT = {"event_type": "Strike", "location": "Chennai", "severity": "High", "timestamp": "t1"}
+
+def normalize(alert):
+    return normalize_alert(alert, LocationNameIndex.from_shipments(SHIPMENTS), RouteIndex.from_shipments(SHIPMENTS))
+
+def test_batch_wide_reports_and_plans_are_cut_to_the_event():
+    alert = {"event": EVENT,
+             "risk_report": [{"product_id": "P1", "risk_score": 90}, {"product_id": "P2", "risk_score": 40}],
+             "action_plan": [{"product_id": "P1", "recommended_actions": ["reroute"]},
+                             {"product_id": "P2", "recommended_actions": ["wait"]}]}
+    reports, plans = normalize(alert)
+    assert [r["product_id"] for r in reports] == ["P1"] and [p["product_id"] for p in plans] == ["P1"]
+
+def test_alert_without_reports_keeps_its_plans():
+    alert = {"event": EVENT, "risk_report": [],
+             "action_plan": [{"product_id": "P1", "recommended_actions": ["reroute"]},
+                             {"product_id": "P1", "recommended_actions": ["reroute"]},
+                             {"product_id": "P9", "recommended_actions": ["call vendor"], "disruption_key": "other|event|t2"}]}
+    reports, plans = normalize(alert)
+    assert reports == [] and plans == [{"product_id": "P1", "recommended_actions": ["reroute"], "disruption_key": disruption_key(EVENT)}]
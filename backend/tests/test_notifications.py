@@ -0,0 +1,113 @@
+import smtplib
+import threading
+
+import pytest
+
+from ratelimit import Rate
+from utils import notifications
+from utils.notifications import EmailSender, NotificationDispatcher, SlackSender
+
+class FakeSMTP:
+    """Local SMTP stand-in recording sessions and messages."""
+    sessions = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.closed = False
+        FakeSMTP.sessions.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("gone")
+        if to_addrs[0].startswith("refused"):
+            raise smtplib.SMTPRecipientsRefused({to_addrs[0]: (550, b"no such user")})
+        self.sent.append((to_addrs, msg))
+
+    def quit(self):
+        self.closed = True
+
+class FakeSlack:
+    def __init__(self, fail=False):
+        self.posts = []
+        self.fail = fail
+
+    def chat_postMessage(self, channel, text):
+        if self.fail:
+            raise RuntimeError("slack down")
+        self.posts.append((channel, text))
+
+def _dispatcher(slack=None, **kwargs):
+    FakeSMTP.sessions = []
+    email = EmailSender(host="localhost", port=1025, user=None, from_email="alerts@test", smtp_factory=FakeSMTP)
+    return NotificationDispatcher({"email": email, "slack": SlackSender(client=slack or FakeSlack())}, **kwargs)
+
+def test_messages_are_digested_over_one_smtp_session():
+    dispatcher = _dispatcher(digest_seconds=60)
+    for i in range(3):
+        assert dispatcher.notify("email", "ops@test", f"Alert {i}", f"body {i}")
+    assert dispatcher.notify("email", "cfo@test", "Alert 9", "body 9")
+    assert not dispatcher.notify("sms", "+100", "x", "y")  # channel not configured
+    dispatcher.stop()
+    assert len(FakeSMTP.sessions) == 1
+    sent = {to[0]: msg for to, msg in FakeSMTP.sessions[0].sent}
+    assert set(sent) == {"ops@test", "cfo@test"}
+    assert "3 notifications" in sent["ops@test"] and "body 2" in sent["ops@test"]
+    assert dispatcher.metrics() == {"queued": 4, "dropped": 0, "sent": 2, "digests": 1, "failed": 0, "deferred": 0, "pending": 0}
+
+def test_stale_smtp_session_is_reopened():
+    FakeSMTP.sessions = []
+    sender = EmailSender(host="localhost", user=None, from_email="alerts@test", smtp_factory=FakeSMTP)
+    sender.send("a@test", "s", "b")
+    FakeSMTP.sessions[0].closed = True
+    sender.send("b@test", "s", "b")
+    assert len(FakeSMTP.sessions) == 2 and FakeSMTP.sessions[1].sent
+
+def test_smtp_errors_other_than_a_dropped_session_are_not_retried():
+    FakeSMTP.sessions = []
+    sender = EmailSender(host="localhost", user=None, from_email="alerts@test", smtp_factory=FakeSMTP)
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        sender.send("refused@test", "s", "b")
+    # The session is still good and is reused for the next message
+    sender.send("ok@test", "s", "b")
+    assert len(FakeSMTP.sessions) == 1 and len(FakeSMTP.sessions[0].sent) == 1
+
+def test_notify_counts_are_exact_across_threads():
+    dispatcher = _dispatcher(max_queue=500)
+    dispatcher.start = lambda: None  # keep the queue undrained; only the counters matter here
+    threads = [threading.Thread(target=lambda: [dispatcher.notify("slack", "#a", "s", "b") for _ in range(500)])
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    m = dispatcher.metrics()
+    assert (m["queued"], m["dropped"]) == (500, 1500)
+
+def test_rate_limited_channel_defers_and_keeps_collecting():
+    slack = FakeSlack()
+    dispatcher = _dispatcher(slack, rate_limits={"slack": Rate(1, 3600)}, digest_seconds=0)
+    dispatcher.notify("slack", "#a", "first", "1")
+    dispatcher._collect(0)
+    dispatcher._flush()
+    dispatcher.notify("slack", "#a", "second", "2")
+    dispatcher.notify("slack", "#a", "third", "3")
+    dispatcher._collect(0)
+    dispatcher._flush()
+    assert len(slack.posts) == 1 and dispatcher.metrics()["deferred"] == 1
+    dispatcher._flush(force=True)
+    assert len(slack.posts) == 2 and "2 notifications" in slack.posts[1][1]
+
+def test_failed_delivery_is_audited(monkeypatch):
+    audited = []
+    monkeypatch.setattr(notifications, "log_audit", lambda action, actor, **kw: audited.append((action, kw["target"])))
+    dispatcher = _dispatcher(FakeSlack(fail=True), digest_seconds=0)
+    dispatcher.notify("slack", "#ops", "s", "b")
+    dispatcher.stop()
+    assert audited == [("slack_notification_failed", "#ops")]
+    assert dispatcher.metrics()["failed"] == 1
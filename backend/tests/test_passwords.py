@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from passlib.context import CryptContext
+
+from passwords import PasswordHasher, HashingPoolBusy
+
+def _hasher(rounds=4, **kwargs):
+    return PasswordHasher(CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds), **kwargs)
+
+def test_hash_verify_and_metrics():
+    hasher = _hasher(workers=2)
+    async def run():
+        hashed = await hasher.hash("s3cret!")
+        return hashed, await hasher.verify("s3cret!", hashed), await hasher.verify("wrong", hashed), await hasher.verify("x", None)
+    hashed, ok, bad, missing = asyncio.run(run())
+    assert ok and not bad and not missing
+    metrics = hasher.metrics()
+    assert metrics["completed"] == 3 and metrics["pending"] == 0 and metrics["rejected"] == 0
+    hasher.shutdown()
+
+def test_outdated_hash_is_upgraded():
+    old = _hasher(rounds=4).context.hash("s3cret!")
+    hasher = _hasher(rounds=5)
+    valid, new_hash = asyncio.run(hasher.verify_and_update("s3cret!", old))
+    assert valid and new_hash and new_hash != old
+    assert asyncio.run(hasher.verify_and_update("s3cret!", new_hash)) == (True, None)
+    assert hasher.metrics()["rehashed"] == 1
+    hasher.shutdown()
+
+def test_full_queue_is_rejected():
+    hasher = _hasher(workers=1, max_pending=1)
+    async def run():
+        return await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+    results = asyncio.run(run())
+    assert sum(isinstance(r, HashingPoolBusy) for r in results) == 1
+    assert hasher.metrics()["rejected"] == 1
+    hasher.shutdown()
@@ -0,0 +1,52 @@
+import json
+
+from agents.prompt_builder import build_risk_inputs, build_chat_context, estimate_tokens
+
+SHIPMENT = {"product_id": "P1", "criticality_score": 80, "route": ["Bangalore", "Pune"], "notes": "x" * 500, "created_at": "2025-01-01"}
+VENDOR = {"vendor_id": "V1", "name": "Acme", "bank_account": "secret"}
+STRIKE = {"event_type": "Strike", "location": "Bangalore", "severity": "High", "source": "news", "raw": {"html": "..."}}
+FLOOD = {"event_type": "Weather", "location": "Pune", "severity": "Medium"}
+
+def test_risk_input_projects_and_deduplicates():
+    pairs = [
+        {"shipment": SHIPMENT, "vendor": VENDOR, "disruption": STRIKE},
+        {"shipment": SHIPMENT, "vendor": VENDOR, "disruption": FLOOD},
+    ]
+    [chunk] = build_risk_inputs(pairs)
+    data = json.loads(chunk)
+    assert data["shipments"] == {"P1": {"product_id": "P1", "criticality_score": 80, "route": ["Bangalore", "Pune"]}}
+    assert data["vendors"] == {"V1": {"vendor_id": "V1", "name": "Acme"}}
+    assert len(data["disruptions"]) == 2
+    assert [p["shipment"] for p in data["pairs"]] == ["P1", "P1"]
+    assert len(chunk) < len(json.dumps(pairs)) / 2
+
+def test_risk_input_is_chunked_within_budget():
+    pairs = [{"shipment": {"product_id": f"P{i}", "route": ["Chennai", "Kolkata"]}, "disruption": STRIKE} for i in range(200)]
+    chunks = build_risk_inputs(pairs, max_tokens=400)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 400 for c in chunks)
+    decoded = [json.loads(c) for c in chunks]
+    assert sum(len(d["pairs"]) for d in decoded) == 200
+    # Every chunk is self-contained: each reference resolves within it
+    for d in decoded:
+        assert all(p["shipment"] in d["shipments"] and p["disruption"] in d["disruptions"] for p in d["pairs"])
+
+def test_risk_input_fallback_keys_never_replace_rows():
+    pairs = [
+        {"shipment": {"product_id": "s1", "route": ["Pune"]}, "disruption": STRIKE, "disruption_key": "k"},
+        {"shipment": {"route": ["Chennai"]}, "disruption": FLOOD, "disruption_key": "k"},
+        {"shipment": {"route": ["Kolkata"]}, "disruption": {**FLOOD, "severity": "High"}},
+    ]
+    [chunk] = build_risk_inputs(pairs)
+    data = json.loads(chunk)
+    assert len(data["shipments"]) == 3 and len(data["disruptions"]) == 3
+    assert len({p["shipment"] for p in data["pairs"]}) == 3
+    assert len({p["disruption"] for p in data["pairs"]}) == 3
+    assert data["shipments"]["s1"]["route"] == ["Pune"]
+    assert data["disruptions"]["k"] == {"event_type": "Strike", "location": "Bangalore", "severity": "High"}
+
+def test_chat_context_respects_budget():
+    alerts = [{"event": STRIKE, "risk_report": [{"product_id": f"P{i}", "risk_score": 90, "escalation": ["x"] * 50}]} for i in range(50)]
+    context = build_chat_context(alerts, max_tokens=200)
+    assert estimate_tokens(context) <= 230
+    assert '"P0"' in context and "escalation" not in context and "raw" not in context
@@ -0,0 +1,65 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import ratelimit
+from ratelimit import MemoryBucketStore, Rate, RateLimiter, parse_limits, parse_rate
+
+def test_parse_rates():
+    assert parse_rate("10/minute") == Rate(10, 60)
+    assert parse_rate("3 per hours") == Rate(3, 3600)
+    assert parse_limits("chat=5/second, genai_plan=1/day") == {"chat": Rate(5, 1), "genai_plan": Rate(1, 86400)}
+    with pytest.raises(ValueError):
+        parse_rate("5/fortnight")
+
+def test_processes_sharing_a_store_never_exceed_the_bucket():
+    store = MemoryBucketStore()
+    workers = [RateLimiter(store, lease_fraction=0.2) for _ in range(3)]
+    rate = Rate(10, 60)
+    allowed = sum(workers[i % 3].hit("chat:user:1", rate, now=100.0)[0] for i in range(30))
+    assert allowed == 10
+    # Most hits were served from local leases rather than the shared store
+    assert sum(w.metrics()["store_calls"] for w in workers) < 30
+    ok, retry_after = workers[0].hit("chat:user:1", rate, now=100.0)
+    assert not ok and retry_after == pytest.approx(6.0)
+    # Tokens refill at capacity / period
+    assert workers[0].hit("chat:user:1", rate, now=112.0)[0]
+
+def test_store_failure_falls_back_to_local_buckets_and_backs_off():
+    calls = []
+    class Broken:
+        def take(self, *args):
+            calls.append(args[-1])
+            raise ConnectionError("down")
+    limiter = RateLimiter(Broken(), lease_fraction=1, backoff=1, max_backoff=3)
+    assert [limiter.hit("k", Rate(2, 60), now=0)[0] for _ in range(3)] == [True, True, False]
+    # The dead store was tried once, then skipped until the back-off ran out; it doubles up to the max
+    assert calls == [0]
+    for now in (0.5, 1, 2, 3, 5, 7):
+        limiter.hit("k", Rate(2, 60), now=now)
+    assert calls == [0, 1, 3, 7]
+    assert limiter.metrics()["store_errors"] == 4
+
+def test_memory_store_prunes_refilled_buckets():
+    store = MemoryBucketStore(max_buckets=3)
+    rate = Rate(2, 10)
+    for i in range(3):
+        store.take(f"ip:{i}", 1, rate, now=0)
+    store.take("ip:3", 1, rate, now=2)  # nothing has refilled yet
+    assert len(store) == 4
+    store.take("ip:4", 2, rate, now=6)  # the 1-token buckets from t=0 are full again
+    assert len(store) == 2
+    assert store.take("ip:4", 1, rate, now=6) == (0, pytest.approx(5.0))
+
+def test_rate_limit_dependency_returns_429(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", RateLimiter(MemoryBucketStore()))
+    monkeypatch.setattr(ratelimit, "route_limits", {"ping": Rate(2, 60)})
+    app = FastAPI()
+
+    @app.get("/ping", dependencies=[Depends(ratelimit.rate_limit("ping"))])
+    def ping():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert [client.get("/ping").status_code for _ in range(3)] == [200, 200, 429]
+    assert int(client.get("/ping").headers["Retry-After"]) >= 1
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import db
+from fake_db import InMemoryClient
+from agents import risk_analyzer
+from agents.shipment_index import shipment_index
+
+@pytest.fixture
+def memory_db():
+    client = db.init_db(InMemoryClient({
+        "shipment": [
+            {"product_id": "P1", "criticality_score": 90, "route": ["Chennai", "Kolkata"], "vendor_id": "V1"},
+            {"product_id": "P2", "criticality_score": 10, "route": ["Chennai"], "vendor_id": "V1"},
+            {"product_id": "P3", "criticality_score": 50, "route": ["Singapore"]},
+        ],
+        "vendor": [{"vendor_id": "V1", "name": "Acme"}],
+    }))
+    shipment_index.invalidate()
+    yield client
+    shipment_index.invalidate()
+    db.close_db()
+
+def test_tiered_mode_scores_with_rules_without_api_key(memory_db, monkeypatch):
+    monkeypatch.setattr(risk_analyzer, "GROQ_API_KEY", None)
+    monkeypatch.setattr(risk_analyzer, "RISK_SCORING_MODE", "tiered")
+    reports = risk_analyzer.analyze_risk({"location": "Chennai", "event_type": "Strike", "severity": "High"})
+    assert {r["product_id"]: r["risk_score"] for r in reports} == {"P1": 90, "P2": 58}
+    assert all(r["source"] == "rules" for r in reports)
+
+def test_tiered_mode_only_escalates_risky_or_uncertain_pairs(memory_db, monkeypatch):
+    sent = []
+    def fake_llm(pairs):
+        sent.extend(p["shipment"]["product_id"] for p in pairs)
+        return [{"product_id": pid, "risk_score": 99, "summary": "llm"} for pid in sent]
+    monkeypatch.setattr(risk_analyzer, "GROQ_API_KEY", "test")
+    monkeypatch.setattr(risk_analyzer, "RISK_SCORING_MODE", "tiered")
+    monkeypatch.setattr(risk_analyzer, "_llm_risk_reports", fake_llm)
+    reports = risk_analyzer.analyze_risk([
+        {"location": "Chennai", "event_type": "Strike", "severity": "High"},
+        {"location": "Singapore", "event_type": "Cyberattack", "severity": "Low"},
+    ])
+    # P1 is above the threshold and P3 has an event type the rules don't know; P2 stays local
+    assert sorted(sent) == ["P1", "P3"]
+    assert {r["product_id"]: r["source"] for r in reports} == {"P1": "llm", "P2": "rules", "P3": "llm"}
+
+def test_reports_are_attributed_to_their_own_event(memory_db, monkeypatch):
+    from agents.pipeline import build_event_alerts
+    monkeypatch.setattr(risk_analyzer, "RISK_SCORING_MODE", "rules")
+    events = [
+        {"location": "Chennai", "event_type": "Strike", "severity": "High", "timestamp": "t1"},
+        {"location": "Singapore", "event_type": "Weather", "severity": "Low", "timestamp": "t2"},
+    ]
+    reports = risk_analyzer.analyze_risk(events)
+    plans = [{"product_id": "P3", "recommended_actions": ["wait"]}]
+    alerts = build_event_alerts(events, reports, plans)
+    assert [[r["product_id"] for r in a["risk_report"]] for a in alerts] == [["P1", "P2"], ["P3"]]
+    assert [len(a["action_plan"]) for a in alerts] == [0, 1]
+
+def test_shipment_index_is_reused_and_follows_shipment_writes(memory_db, monkeypatch):
+    from agents.risk_state import on_shipment_changed
+    monkeypatch.setattr(risk_analyzer, "RISK_SCORING_MODE", "rules")
+    loads = []
+    monkeypatch.setattr(shipment_index, "loader", lambda: loads.append(1) or db.get_all_shipments())
+    strike = {"location": "Singapore", "event_type": "Strike", "severity": "High"}
+    assert [r["product_id"] for r in risk_analyzer.analyze_risk(strike)] == ["P3"]
+    db.update_shipment("P2", {"current_location": "Singapore"})
+    on_shipment_changed({"product_id": "P2", "current_location": "Singapore"})
+    assert [r["product_id"] for r in risk_analyzer.analyze_risk(strike)] == ["P2", "P3"]
+    assert len(loads) == 1
+
+def test_llm_reports_are_matched_by_the_disruption_key_they_echo(memory_db, monkeypatch):
+    class ReversingChain:
+        """Answers every pair, last pair first, echoing the disruption key the prompt gave it."""
+        def run(self, llm_input):
+            data = json.loads(llm_input)
+            return json.dumps([{"product_id": p["shipment"], "disruption_key": p["disruption"],
+                                "risk_score": 10 if p["disruption"].startswith("strike") else 20}
+                               for p in reversed(data["pairs"])])
+    monkeypatch.setattr(risk_analyzer, "GROQ_API_KEY", "test")
+    monkeypatch.setattr(risk_analyzer, "RISK_SCORING_MODE", "llm")
+    monkeypatch.setattr(risk_analyzer, "get_chain", lambda name: ReversingChain())
+    strike = {"location": "Chennai", "event_type": "Strike", "severity": "High", "timestamp": "t1"}
+    flood = {"location": "Kolkata", "event_type": "Weather", "severity": "Low", "timestamp": "t2"}
+    reports = risk_analyzer.analyze_risk([strike, flood])
+    by_event = {(r["product_id"], r["disruption_key"]): r["risk_score"] for r in reports}
+    assert by_event == {("P1", risk_analyzer.disruption_key(strike)): 10, ("P2", risk_analyzer.disruption_key(strike)): 10,
+                        ("P1", risk_analyzer.disruption_key(flood)): 20}
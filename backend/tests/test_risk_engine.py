@@ -0,0 +1,41 @@
+import random
+
+from agents.risk_analyzer import generate_fallback_risk_reports, DELAY_MAP
+from agents.risk_engine import score_pairs, score_batch
+
+def _random_pairs(n, seed=7):
+    rng = random.Random(seed)
+    event_types = list(DELAY_MAP) + ["Cyberattack", None]
+    severities = ["Low", "Medium", "High", "Extreme", None]
+    pairs = []
+    for i in range(n):
+        shipment = {"product_id": f"P{i}"}
+        if rng.random() > 0.1:
+            shipment["criticality_score"] = rng.choice([rng.randint(0, 100), rng.uniform(0, 100), 62.5, 37.5])
+        disruption = {}
+        if rng.random() > 0.1:
+            disruption["severity"] = rng.choice(severities)
+        if rng.random() > 0.1:
+            disruption["event_type"] = rng.choice(event_types)
+        pairs.append({"shipment": shipment, "disruption": disruption})
+    return pairs
+
+def test_vectorised_engine_matches_row_wise_reports():
+    pairs = _random_pairs(5000)
+    assert score_pairs(pairs) == generate_fallback_risk_reports(pairs)
+
+def test_null_or_bad_criticality_scores_as_default():
+    pairs = [{"shipment": {"product_id": p, **extra}, "disruption": {"severity": "High", "event_type": "Strike"}}
+             for p, extra in [("P1", {"criticality_score": None}), ("P2", {}), ("P3", {"criticality_score": "n/a"}),
+                              ("P4", {"criticality_score": float("nan")}), ("P5", {"criticality_score": 50})]]
+    reports = score_pairs(pairs)
+    assert reports == generate_fallback_risk_reports(pairs)
+    assert {(r["risk_score"], r["cost_impact"]) for r in reports} == {(74, 37000)}
+
+def test_score_batch_accepts_plain_columns():
+    out = score_batch([90, 10], ["High", "Low"], ["Strike", "Weather"])
+    assert out["risk_score"].tolist() == [90, 22]
+    assert out["impact_level"].tolist() == ["Critical", "Low"]
+    assert out["delay_estimate"].tolist() == ["7-10 days", "1 day"]
+    assert out["escalate"].tolist() == [True, False]
+    assert score_pairs([]) == []
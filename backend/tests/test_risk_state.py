@@ -0,0 +1,108 @@
+import pytest
+
+import db
+from fake_db import InMemoryClient
+from agents.risk_state import RiskState, disruption_key
+from agents.shipment_index import ShipmentIndex
+
+SHIPMENTS = [
+    {"product_id": "P1", "criticality_score": 80, "route": ["Bangalore", "Pune", "Mumbai"]},
+    {"product_id": "P2", "criticality_score": 40, "route": ["Chennai", "Kolkata"]},
+    {"product_id": "P3", "criticality_score": 60, "current_location": "Singapore"},
+]
+STRIKE = {"event_type": "Strike", "location": "Hubli", "severity": "High", "timestamp": "2025-07-01T00:00:00Z"}
+FLOOD = {"event_type": "Weather", "location": "Kolkata", "severity": "Medium", "timestamp": "2025-07-02T00:00:00Z"}
+
+@pytest.fixture(autouse=True)
+def memory_db():
+    client = db.init_db(InMemoryClient())
+    yield client
+    db.close_db()
+
+def make_state(scored, shipments=SHIPMENTS):
+    def scorer(pairs):
+        scored.extend(p["shipment"]["product_id"] for p in pairs)
+        return [{"product_id": p["shipment"]["product_id"], "risk_score": 50} for p in pairs]
+    return RiskState(index=ShipmentIndex(loader=lambda: shipments), radius_km=100, scorer=scorer, rescorer=scorer)
+
+def test_new_disruption_scores_only_reachable_shipments():
+    scored = []
+    state = make_state(scored)
+    changed = state.add_disruptions([STRIKE, FLOOD])
+    # Hubli lies on P1's Bangalore-Pune leg; Kolkata is a stop of P2
+    assert changed == {disruption_key(STRIKE): ["P1"], disruption_key(FLOOD): ["P2"]}
+    assert scored == ["P1", "P2"]
+
+def test_analyzer_reports_are_stored_as_given():
+    scored = []
+    state = make_state(scored)
+    reports = [{"product_id": "P2", "risk_score": 91, "source": "llm", "disruption_key": disruption_key(FLOOD)},
+               {"product_id": "P1", "risk_score": 10, "disruption_key": "some|other|event"}]
+    assert state.add_disruptions([FLOOD], reports) == {disruption_key(FLOOD): ["P2"]}
+    assert scored == []
+    assert state.snapshot()[0]["affected"] == [reports[0]]
+
+def test_shipment_update_rescores_only_that_shipment():
+    scored = []
+    state = make_state(scored)
+    state.add_disruptions([STRIKE, FLOOD])
+    scored.clear()
+    assert state.update_shipment({"product_id": "P3", "route": ["Chennai", "Kolkata"]}) == [disruption_key(FLOOD)]
+    assert scored == ["P3"]
+    assert state.update_shipment({"product_id": "P2", "route": ["Delhi"]}) == [disruption_key(FLOOD)]
+    flood = next(d for d in state.snapshot() if d["key"] == disruption_key(FLOOD))
+    assert [r["product_id"] for r in flood["affected"]] == ["P3"]
+
+def test_processes_share_state_through_the_database():
+    writer, other = make_state([]), make_state([])
+    writer.add_disruptions([FLOOD])
+    other.add_disruptions([STRIKE])  # does not clobber the other process's disruption
+    assert sorted(d["key"] for d in writer.snapshot()) == sorted([disruption_key(FLOOD), disruption_key(STRIKE)])
+    assert other.resolve(disruption_key(FLOOD))
+    assert not writer.resolve(disruption_key(FLOOD))
+    assert [d["key"] for d in writer.snapshot()] == [disruption_key(STRIKE)]
+    assert {r["disruption_key"] for r in db.get_client().rows("risk_exposures")} == {disruption_key(STRIKE)}
+
+def test_shipment_index_applies_writes_and_rebuilds_after_ttl():
+    shipments = [dict(s) for s in SHIPMENTS]
+    loads = []
+    index = ShipmentIndex(loader=lambda: loads.append(1) or shipments, ttl=3600)
+    assert [s["product_id"] for s in index.candidates(FLOOD, 100)] == ["P2"]
+    index.update({"product_id": "P3", "current_location": "Kolkata"})
+    assert [s["product_id"] for s in index.candidates(FLOOD, 100)] == ["P2", "P3"]
+    assert len(loads) == 1
+    shipments[0]["current_location"] = "Kolkata"  # written by another process
+    index.invalidate()
+    assert [s["product_id"] for s in index.candidates(FLOOD, 100)] == ["P1", "P2"]
+    assert len(loads) == 2
+
+def test_rescoring_matches_reports_by_disruption_not_order():
+    strike = {"event_type": "Strike", "location": "Kolkata", "severity": "High", "timestamp": "2025-07-03T00:00:00Z"}
+    scores = {disruption_key(strike): 90, disruption_key(FLOOD): 10}
+    calls = []
+    def scorer(pairs):
+        # Like the LLM: last pair first, each report echoing its disruption_key; the first call drops a pair
+        calls.append(pairs)
+        reports = [{"product_id": p["shipment"]["product_id"], "disruption_key": disruption_key(p["disruption"]),
+                    "risk_score": scores[disruption_key(p["disruption"])]} for p in reversed(pairs)]
+        return reports[:-1] if len(calls) == 1 else reports
+    state = RiskState(index=ShipmentIndex(loader=lambda: SHIPMENTS), radius_km=100, scorer=scorer, rescorer=scorer)
+    state.add_disruptions([FLOOD, strike], reports=[])
+    # First re-score: the FLOOD pair goes unanswered, so no exposure is stored for it
+    assert state.update_shipment({"product_id": "P3", "route": ["Chennai", "Kolkata"]}) == [disruption_key(strike)]
+    stored = lambda: {r["disruption_key"]: r["report"]["risk_score"] for r in db.get_client().rows("risk_exposures")}
+    assert stored() == {disruption_key(strike): 90}
+    state.update_shipment({"product_id": "P3", "route": ["Chennai", "Kolkata"]})
+    assert stored() == {disruption_key(strike): 90, disruption_key(FLOOD): 10}
+
+def test_shipment_writes_are_rescored_by_the_rules_by_default(monkeypatch):
+    import agents.risk_analyzer as risk_analyzer
+    def no_llm(pairs):
+        raise AssertionError("shipment updates must not call the LLM")
+    monkeypatch.setattr(risk_analyzer, "RISK_SCORING_MODE", "llm")
+    monkeypatch.setattr(risk_analyzer, "_llm_risk_reports", no_llm)
+    state = RiskState(index=ShipmentIndex(loader=lambda: SHIPMENTS), radius_km=100, scorer=no_llm)
+    state.add_disruptions([FLOOD], reports=[])
+    assert state.update_shipment({"product_id": "P3", "route": ["Chennai", "Kolkata"]}) == [disruption_key(FLOOD)]
+    [flood] = state.snapshot()
+    assert [(r["product_id"], r["source"]) for r in flood["affected"]] == [("P3", "rules")]
@@ -0,0 +1,43 @@
+from utils.route_geometry import RouteIndex, build_route_geometry, resolve_coords, haversine_km, point_segment_distance_km
+
+SHIPMENTS = [
+    {"product_id": "P1", "route": ["Bangalore", "Pune", "Mumbai"]},
+    {"product_id": "P2", "route": ["Chennai", "Kolkata"]},
+    {"product_id": "P3", "route": ["Shanghai", "Hong Kong", "Singapore"]},
+    {"product_id": "P4", "current_location": "Delhi"},
+]
+
+def test_resolve_coords_is_case_insensitive_and_fuzzy():
+    assert resolve_coords("chennai") == (13.08, 80.27)
+    assert resolve_coords("Port of Chennai") == (13.08, 80.27)
+    assert resolve_coords("Atlantis") is None
+
+def test_build_route_geometry_segments():
+    assert len(build_route_geometry(SHIPMENTS[0])) == 2
+    assert build_route_geometry(SHIPMENTS[3]) == [((28.61, 77.21), (28.61, 77.21))]
+
+def test_query_finds_disruption_between_stops():
+    index = RouteIndex.from_shipments(SHIPMENTS)
+    # Hubli lies between Bangalore and Pune but is not a stop on P1's route
+    hits = index.query(15.36, 75.12, radius_km=100)
+    assert set(hits) == {"P1"}
+    assert index.query_disruption({"location": "Delhi"}, 10) == {"P4": 0.0}
+
+def test_query_matches_brute_force():
+    index = RouteIndex.from_shipments(SHIPMENTS, cell_deg=0.5)
+    for lat, lon in [(17.0, 79.0), (22.0, 118.0), (10.0, 100.0), (20.0, 73.0)]:
+        for radius in (50, 300, 1200):
+            expected = {
+                shipment["product_id"] for shipment in SHIPMENTS
+                if any(point_segment_distance_km((lat, lon), a, b) <= radius for a, b in build_route_geometry(shipment))
+            }
+            assert set(index.query(lat, lon, radius)) == expected
+
+def test_remove_shipment():
+    index = RouteIndex.from_shipments(SHIPMENTS)
+    index.remove_shipment("P1")
+    assert "P1" not in index.query(15.36, 75.12, 100)
+    assert len(index) == 3
+
+def test_haversine_known_distance():
+    assert 1140 < haversine_km((28.61, 77.21), (19.07, 72.88)) < 1160
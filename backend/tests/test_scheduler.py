@@ -0,0 +1,53 @@
+import db
+import scheduler
+from fake_db import InMemoryClient
+from scheduler import DbLeaderLock, DisruptionScheduler, FileLeaderLock, NoLock
+
+def test_file_lock_elects_one_leader(tmp_path):
+    path = str(tmp_path / "scheduler.lock")
+    first, second = FileLeaderLock(path), FileLeaderLock(path)
+    assert first.acquire() and first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+def test_db_lock_lease_expires_and_is_taken_over(monkeypatch):
+    db.init_db(InMemoryClient())
+    try:
+        clock = [1000.0]
+        monkeypatch.setattr(scheduler.time, "time", lambda: clock[0])
+        a, b = DbLeaderLock(ttl=90, owner="a"), DbLeaderLock(ttl=90, owner="b")
+        assert a.acquire() and not b.acquire()
+        clock[0] += 60
+        assert a.acquire()  # renewal pushes expiry out
+        clock[0] += 60
+        assert not b.acquire()
+        clock[0] += 100
+        assert b.acquire() and not a.acquire()
+        b.release()
+        assert a.acquire()
+    finally:
+        db.close_db()
+
+def test_runs_record_metrics_and_adapt_interval():
+    results = iter([{"fetched": 5, "new": 3}, {"fetched": 5, "new": 0}, None])
+
+    def job(on_backlog):
+        on_backlog(2)
+        result = next(results)
+        if result is None:
+            raise RuntimeError("feed down")
+        return result
+
+    sched = DisruptionScheduler(job=job, lock=NoLock(), interval=600, min_interval=120, max_interval=1800)
+    sched._run()
+    assert sched.interval == 300
+    sched._run()
+    assert sched.interval == 450
+    sched._run()
+    assert sched.interval == 450  # failures leave the interval alone
+    m = sched.metrics()
+    # The failed run reported a backlog of 2 before raising; it is cleared once the run ends
+    assert (m["runs"], m["failures"], m["events_fetched"], m["events_new"], m["backlog"]) == (3, 1, 10, 3, 0)
+    assert not m["running"] and m["next_run_at"] is None
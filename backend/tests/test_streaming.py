@@ -0,0 +1,44 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes.disruption as disruption
+
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def _client(monkeypatch, chunks, fail_after=None):
+    async def fake_astream(prompt_name, model_name, **inputs):
+        for i, chunk in enumerate(chunks):
+            if fail_after is not None and i == fail_after:
+                raise RuntimeError("model went away")
+            yield chunk
+    audited = []
+    monkeypatch.setattr(disruption, "astream", fake_astream)
+    monkeypatch.setattr(disruption, "retrieve_chat_context", lambda query: "context")
+    monkeypatch.setattr(disruption, "log_audit", lambda action, actor, **kw: audited.append((action, kw["details"])))
+    app = FastAPI()
+    app.include_router(disruption.disruption_router)
+    return TestClient(app), audited
+
+def test_chat_stream_sends_tokens_then_audits_the_full_answer(monkeypatch):
+    client, audited = _client(monkeypatch, ["Port ", "closed ", "until Friday."])
+    resp = client.post("/chat/stream/", json={"query": "Chennai?"})
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert _events(resp.text) == [("token", "Port "), ("token", "closed "), ("token", "until Friday."),
+                                  ("done", {"answer": "Port closed until Friday."})]
+    [(action, details)] = audited
+    assert action == "llm_chat" and details.endswith("| Streamed | Answer: Port closed until Friday.")
+
+def test_long_answers_are_clipped_and_failed_streams_not_audited(monkeypatch):
+    monkeypatch.setattr(disruption, "AUDIT_ANSWER_MAX_CHARS", 10)
+    assert disruption._clip("x" * 25, 10) == "x" * 10 + "... [15 more chars]"
+    client, audited = _client(monkeypatch, ["partial", "never sent"], fail_after=1)
+    events = _events(client.post("/chat/stream/", json={"query": "q"}).text)
+    assert events == [("token", "partial"), ("error", {"error": "model went away"})]
+    assert audited == []
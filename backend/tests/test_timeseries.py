@@ -0,0 +1,119 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import db
+from fake_db import InMemoryClient
+from utils.timeseries import downsample, parse_columns, pick_bucket
+
+ROWS = [
+    {"timestamp": "2024-05-01T10:00:10Z", "type": "weather", "incidents": 1, "resolved": 0},
+    {"timestamp": "2024-05-01T10:20:00Z", "type": "weather", "incidents": 3, "resolved": None},
+    {"timestamp": "2024-05-01T10:40:00Z", "type": "strike", "incidents": 5, "resolved": 2},
+    {"timestamp": "2024-05-01T11:05:00+00:00", "type": "weather", "incidents": 7, "resolved": 4},
+    {"timestamp": "not a date", "type": "weather", "incidents": 100, "resolved": 100},
+]
+
+def test_downsample_groups_by_bucket_and_column():
+    bucket, points = downsample(ROWS, ["incidents", "resolved"], bucket="hour", group_by="type")
+    assert bucket == "hour"
+    assert points == [
+        {"timestamp": "2024-05-01T11:00:00+00:00", "type": "weather", "incidents": 7.0, "resolved": 4.0, "count": 1},
+        {"timestamp": "2024-05-01T10:00:00+00:00", "type": "strike", "incidents": 5.0, "resolved": 2.0, "count": 1},
+        {"timestamp": "2024-05-01T10:00:00+00:00", "type": "weather", "incidents": 2.0, "resolved": 0.0, "count": 2},
+    ]
+
+@pytest.mark.parametrize("agg, expected", [("min", 1.0), ("max", 5.0), ("sum", 9.0), ("count", 3.0), ("p95", 4.8)])
+def test_downsample_aggregates(agg, expected):
+    _, points = downsample(ROWS, ["incidents"], bucket="hour", agg=agg)
+    assert points[-1]["incidents"] == pytest.approx(expected)
+
+def test_auto_bucket_caps_points_and_bad_input_is_rejected():
+    assert pick_bucket("auto", "2024-05-01T00:00:00", "2024-05-01T06:00:00", max_points=500) == "minute"
+    assert pick_bucket("auto", "2024-05-01T00:00:00", "2024-05-08T00:00:00", max_points=500) == "hour"
+    assert pick_bucket("auto", "2023-01-01T00:00:00", "2024-01-01T00:00:00", max_points=500) == "day"
+    with pytest.raises(ValueError):
+        downsample(ROWS, ["incidents"], bucket="fortnight")
+    with pytest.raises(ValueError):
+        downsample(ROWS, ["incidents"], agg="median")
+    with pytest.raises(ValueError):
+        parse_columns("incidents,resolved;drop")
+
+def test_analytics_endpoints_bucket_server_side():
+    from routes.analytics import analytics_router
+    db.init_db(InMemoryClient({
+        "risk_trends": ROWS[:4],
+        "analytics_metrics": [{"timestamp": f"2024-05-01T10:0{i}:00Z", "on_time_delivery": 90 + i, "cost_savings": i}
+                              for i in range(4)],
+    }))
+    try:
+        app = FastAPI()
+        app.include_router(analytics_router)
+        client = TestClient(app)
+        body = client.get("/analytics/performance_metrics/", params={"metric": "on_time_delivery", "bucket": "hour", "agg": "max"}).json()
+        assert body["series"] == [{"timestamp": "2024-05-01T10:00:00+00:00", "value": 93.0}]
+        # Raw series only carries the requested column
+        raw = client.get("/analytics/performance_metrics/", params={"fields": "on_time_delivery", "start": "2024-05-01"}).json()
+        assert raw["metrics"][0] == {"timestamp": "2024-05-01T10:03:00Z", "on_time_delivery": 93}
+        trends = client.get("/analytics/risk_trends/", params={"bucket": "auto", "risk_type": "weather"}).json()
+        assert trends["bucket"] == "minute" and sum(p["count"] for p in trends["riskData"]) == 3
+        assert client.get("/analytics/risk_trends/", params={"bucket": "hour", "fields": "x;y"}).status_code == 400
+        # Without bucket the endpoints keep returning raw rows
+        assert len(client.get("/analytics/risk_trends/").json()["riskData"]) == 4
+    finally:
+        db.close_db()
+
+def test_bucketed_series_read_the_whole_range_in_pages(monkeypatch):
+    import routes.analytics as analytics
+    monkeypatch.setattr(analytics, "ANALYTICS_PAGE_SIZE", 3)
+    rows = [{"timestamp": f"2024-05-0{1 + i % 7}T10:00:00Z", "port_id": "P1", "efficiency": i, "capacity": 10}
+            for i in range(20)]
+    db.init_db(InMemoryClient({"port_performance": rows}))
+    try:
+        app = FastAPI()
+        app.include_router(analytics.analytics_router)
+        body = TestClient(app).get("/analytics/port_performance/", params={"bucket": "day", "agg": "count"}).json()
+        assert sum(p["count"] for p in body["ports"]) == 20
+        assert len(body["ports"]) == 7
+    finally:
+        db.close_db()
+
+def test_unknown_columns_are_a_client_error_and_raw_metrics_stay_tolerant():
+    import routes.analytics as analytics
+
+    class UndefinedColumn(Exception):
+        code = "42703"
+
+    class StrictClient(InMemoryClient):
+        """Fails like PostgREST when a select names a column the table lacks."""
+        def table(self, name):
+            query = super().table(name)
+            select = query.select
+            def strict(columns="*", count=None):
+                if "bogus" in columns:
+                    raise UndefinedColumn(f"column {name}.bogus does not exist")
+                return select(columns, count=count)
+            query.select = strict
+            return query
+
+    db.init_db(StrictClient({"analytics_metrics": [{"timestamp": "2024-05-01T10:00:00Z", "on_time_delivery": 90}]}))
+    try:
+        app = FastAPI()
+        app.include_router(analytics.analytics_router)
+        client = TestClient(app)
+        assert client.get("/analytics/performance_metrics/", params={"metric": "bogus"}).json() == {"metric": "bogus", "series": []}
+        assert client.get("/analytics/performance_metrics/", params={"metric": "bogus", "bucket": "day"}).status_code == 400
+        assert client.get("/analytics/performance_metrics/", params={"fields": "bogus", "start": "2024"}).status_code == 400
+    finally:
+        db.close_db()
+
+def test_paged_reads_break_timestamp_ties_by_id(monkeypatch):
+    import routes.analytics as analytics
+    monkeypatch.setattr(analytics, "ANALYTICS_PAGE_SIZE", 2)
+    rows = [{"id": i, "timestamp": "2024-05-01T10:00:00Z", "incidents": i} for i in (4, 1, 5, 3, 2)]
+    db.init_db(InMemoryClient({"risk_trends": rows}))
+    try:
+        paged = analytics._time_range("risk_trends", ["id", "timestamp"], None, None, paged=True)
+        assert [r["id"] for r in paged] == [1, 2, 3, 4, 5]
+    finally:
+        db.close_db()
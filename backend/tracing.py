@@ -0,0 +1,92 @@
+import functools
+import logging
+import os
+import reprlib
+
+# Upper bound on the rendered size of any single traced value (args, LLM payloads, results)
+TRACE_MAX_CHARS = int(os.getenv("TRACE_MAX_CHARS", 2000))
+
+_repr = reprlib.Repr()
+_repr.maxlevel = 4
+_repr.maxdict = 20
+_repr.maxlist = 20
+_repr.maxtuple = 20
+_repr.maxset = 20
+_repr.maxstring = 400
+_repr.maxother = 400
+
+def truncate(value, max_chars=TRACE_MAX_CHARS):
+    """Bounded repr of value: nested containers and long strings are elided, then the result is capped."""
+    text = value if isinstance(value, str) else _repr.repr(value)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}...[{len(text) - max_chars} more chars]"
+    return text
+
+class LazyRepr:
+    """Defers truncate(value) until a log record is actually formatted."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return truncate(self.value)
+
+class LazyFields:
+    """Renders key=value pairs only if and when a log record is actually formatted."""
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return " | ".join(f"{k}={truncate(v)}" for k, v in self.fields.items())
+
+class EventLogger:
+    """
+    Structured event logger replacing the old print-based log_agent/log_api helpers.
+
+    log("event", key=value) emits at INFO; log.debug(...) is for bulky payloads such
+    as LLM inputs and outputs. Nothing is rendered unless the level is enabled.
+    """
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def log(self, level, event, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "%s | %s", event, LazyFields(fields), extra={"event": event}, stacklevel=3)
+
+    def __call__(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+def traced(func=None, *, level=logging.DEBUG):
+    """
+    Decorator logging entry, exit and failures of a function.
+
+    Entry/exit records (with truncated arguments and result) are only produced when
+    `level` is enabled for the function's module logger; exceptions are always logged.
+    """
+    if func is None:
+        return functools.partial(traced, level=level)
+    logger = logging.getLogger(func.__module__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        enabled = logger.isEnabledFor(level)
+        if enabled:
+            logger.log(level, "[ENTER] %s args=%s kwargs=%s", func.__name__, LazyRepr(args), LazyRepr(kwargs))
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            logger.error("[ERROR] %s exception: %s", func.__name__, e, exc_info=True)
+            raise
+        if enabled:
+            logger.log(level, "[EXIT] %s returned %s", func.__name__, LazyRepr(result))
+        return result
+    return wrapper
@@ -0,0 +1,207 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from db import list_user_settings, get_user_contacts
+from ratelimit import MemoryBucketStore, parse_rate
+from agents.risk_analyzer import disruption_key
+
+NOTIFY_RULES_REFRESH_SECONDS = float(os.getenv("NOTIFY_RULES_REFRESH_SECONDS", 300))
+NOTIFY_DEDUP_SECONDS = float(os.getenv("NOTIFY_DEDUP_SECONDS", 6 * 3600))  # same alert, same subscriber and channel
+NOTIFY_SUBSCRIBER_RATE = os.getenv("NOTIFY_SUBSCRIBER_RATE", "20/hour")  # per subscriber and channel
+NOTIFY_DEFAULT_MIN_SEVERITY = os.getenv("NOTIFY_DEFAULT_MIN_SEVERITY", "High")
+NOTIFY_DEFAULT_SLACK_CHANNEL = os.getenv("NOTIFY_DEFAULT_SLACK_CHANNEL")
+
+SEVERITY_LEVELS = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+ANY = "*"
+
+# channels: ((channel, recipient), ...); locations/modes: frozensets, empty meaning any
+Subscription = namedtuple("Subscription", "user_id channels min_level locations modes")
+
+def severity_level(severity):
+    return SEVERITY_LEVELS.get(str(severity or "").strip().lower(), SEVERITY_LEVELS["medium"])
+
+def _norm(value):
+    return str(value or "").strip().lower()
+
+# Keys saved by the dashboard's Settings page, mapped onto the rule fields
+UI_PREF_KEYS = {"emailAlerts": "email", "smsAlerts": "sms", "slackAlerts": "slack", "riskThreshold": "min_severity"}
+
+def notification_prefs(settings):
+    """
+    settings["notifications"] in the rule schema. Also accepts the Settings page's keys
+    (emailAlerts, smsAlerts, riskThreshold) and its {"settings": {...}} request envelope.
+    """
+    settings = settings or {}
+    if "notifications" not in settings and isinstance(settings.get("settings"), dict):
+        settings = settings["settings"]
+    prefs = dict(settings.get("notifications") or {})
+    for ui_key, key in UI_PREF_KEYS.items():
+        if ui_key in prefs and key not in prefs:
+            prefs[key] = prefs[ui_key]
+    return prefs
+
+def subscription_from_settings(user_id, settings, contact=None):
+    """
+    Subscription from a user_settings row. settings["notifications"] holds the channel
+    toggles (email/slack/sms) and optionally min_severity, locations and modes.
+
+    Recipients never come from the settings themselves, which their owner can write
+    freely: email and SMS go to the account's own address and phone (`contact`, from
+    the user table) and Slack to NOTIFY_DEFAULT_SLACK_CHANNEL. Returns None for rows
+    that belong to no account or have no deliverable channel.
+    """
+    if not contact:
+        return None
+    prefs = notification_prefs(settings)
+    recipients = {
+        "email": contact.get("email"),
+        "slack": NOTIFY_DEFAULT_SLACK_CHANNEL,
+        "sms": contact.get("phone"),
+    }
+    channels = tuple((channel, to) for channel, to in recipients.items() if prefs.get(channel) and to)
+    if not channels:
+        return None
+    return Subscription(
+        user_id=str(user_id),
+        channels=channels,
+        min_level=severity_level(prefs.get("min_severity") or NOTIFY_DEFAULT_MIN_SEVERITY),
+        locations=frozenset(_norm(l) for l in prefs.get("locations") or [] if _norm(l)),
+        modes=frozenset(_norm(m) for m in prefs.get("modes") or [] if _norm(m)),
+    )
+
+class AlertRules:
+    """
+    Subscriptions compiled for matching: bucketed by location (ANY for no location
+    filter) and sorted by minimum severity within a bucket, so an alert only looks at
+    its own location's bucket plus ANY, and only at the prefix its severity reaches.
+    """
+    def __init__(self, subscriptions):
+        buckets = {}
+        for sub in subscriptions:
+            for location in sub.locations or (ANY,):
+                buckets.setdefault(location, []).append(sub)
+        self._buckets = {}
+        for location, subs in buckets.items():
+            subs.sort(key=lambda s: s.min_level)
+            self._buckets[location] = ([s.min_level for s in subs], subs)
+        self.size = len(subscriptions)
+
+    def match(self, severity, location, mode=None):
+        level, mode = severity_level(severity), _norm(mode)
+        for key in {_norm(location), ANY}:
+            levels, subs = self._buckets.get(key, ((), ()))
+            for sub in subs[:bisect.bisect_right(levels, level)]:
+                if not sub.modes or mode in sub.modes:
+                    yield sub
+
+def format_alert(alert):
+    """(subject, body) for an alert row as stored by the scheduler."""
+    event = alert.get("event") or {}
+    severity = alert.get("severity") or event.get("severity") or "Unknown"
+    title = alert.get("title") or event.get("event_type") or "Disruption"
+    location = alert.get("location") or event.get("location") or "Unknown"
+    reports = [r for r in alert.get("risk_report") or [] if isinstance(r, dict)]
+    lines = [alert.get("description") or event.get("description") or f"{title} reported at {location}."]
+    if reports:
+        lines.append(f"{len(reports)} shipment(s) affected.")
+        for r in sorted(reports, key=lambda r: -(r.get("risk_score") or 0))[:3]:
+            lines.append(f"- {r.get('product_id')}: risk {r.get('risk_score')} ({r.get('impact_level')}) {r.get('summary') or ''}".rstrip())
+    return f"[{severity}] {title} at {location}", "\n".join(lines)
+
+class AlertRouter:
+    """
+    Routes alerts to subscribers' channels through the notification dispatcher.
+
+    Rules are rebuilt from user_settings at most every `refresh_seconds` (or on
+    invalidate()). Each (subscriber, channel) gets an alert once per `dedup_seconds`
+    and at most `subscriber_rate` alerts overall; the rest are counted and skipped.
+    """
+    def __init__(self, loader=list_user_settings, contact_lookup=get_user_contacts, dispatcher=None,
+                 refresh_seconds=NOTIFY_RULES_REFRESH_SECONDS, dedup_seconds=NOTIFY_DEDUP_SECONDS,
+                 subscriber_rate=NOTIFY_SUBSCRIBER_RATE):
+        self.loader = loader
+        self.contact_lookup = contact_lookup
+        self.dispatcher = dispatcher
+        self.refresh_seconds = refresh_seconds
+        self.dedup_seconds = dedup_seconds
+        self.subscriber_rate = parse_rate(subscriber_rate) if isinstance(subscriber_rate, str) else subscriber_rate
+        self._rules = None
+        self._built_at = 0.0
+        self._recent = OrderedDict()  # (user, channel, alert key) -> expiry; insertion order is expiry order
+        self._buckets = MemoryBucketStore()
+        self._lock = threading.Lock()
+        self._stats = {"alerts": 0, "notified": 0, "deduplicated": 0, "throttled": 0}
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+    def rules(self):
+        with self._lock:
+            if self._rules is not None and time.monotonic() - self._built_at < self.refresh_seconds:
+                return self._rules
+        rows = self.loader() or []
+        contacts = self.contact_lookup([r.get("user_id") for r in rows]) if self.contact_lookup else {}
+        subs = [subscription_from_settings(r.get("user_id"), r.get("settings"), contacts.get(str(r.get("user_id"))))
+                for r in rows]
+        rules = AlertRules([s for s in subs if s is not None])
+        with self._lock:
+            self._rules, self._built_at = rules, time.monotonic()
+        logging.info(f"Alert rules rebuilt: {rules.size} subscriptions")
+        return rules
+
+    def _dispatcher(self):
+        if self.dispatcher is None:
+            from utils.notifications import notification_dispatcher
+            self.dispatcher = notification_dispatcher
+        return self.dispatcher
+
+    def _admit(self, user_id, channel, alert_key, now):
+        with self._lock:
+            while self._recent and next(iter(self._recent.values())) <= now:
+                self._recent.popitem(last=False)
+            dedup_key = (user_id, channel, alert_key)
+            if dedup_key in self._recent:
+                self._stats["deduplicated"] += 1
+                return False
+            if self.subscriber_rate is not None:
+                granted, _ = self._buckets.take(f"{user_id}:{channel}", 1, self.subscriber_rate, time.time())
+                if not granted:
+                    self._stats["throttled"] += 1
+                    return False
+            self._recent[dedup_key] = now + self.dedup_seconds
+            return True
+
+    def fan_out(self, alert):
+        """Queue notifications for every subscriber whose rules match the alert; returns how many were queued."""
+        event = alert.get("event") or {}
+        severity = alert.get("severity") or event.get("severity")
+        location = alert.get("location") or event.get("location")
+        alert_key = disruption_key(event) if event else str(alert.get("id"))
+        subject, body = format_alert(alert)
+        now, queued = time.monotonic(), 0
+        for sub in self.rules().match(severity, location, event.get("mode")):
+            for channel, to in sub.channels:
+                if self._admit(sub.user_id, channel, alert_key, now) and self._dispatcher().notify(channel, to, subject, body):
+                    queued += 1
+        with self._lock:
+            self._stats["alerts"] += 1
+            self._stats["notified"] += queued
+        return queued
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, "subscriptions": self._rules.size if self._rules is not None else None}
+
+alert_router = AlertRouter()
+
+def fan_out_alert(alert):
+    """Notify subscribers about a stored alert without failing the caller."""
+    try:
+        return alert_router.fan_out(alert)
+    except Exception as e:
+        logging.error(f"Alert fan-out failed: {e}")
+        return 0
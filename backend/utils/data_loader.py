@@ -3,7 +3,7 @@ import os
 from dotenv import load_dotenv
 import logging
 import requests
-from supabase import create_client, Client
+from db import get_all_shipments, get_all_vendors, update_shipment
 
 load_dotenv()
 
@@ -41,7 +41,6 @@ def update_shipment_location_by_gps(product_id, lat, lon, use_supabase=True):
     """Update a shipment's current_location in Supabase based on GPS coordinates (reverse geocode to city/port)."""
     try:
         # Use OpenStreetMap Nominatim for reverse geocoding
-        import requests
         resp = requests.get(f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}")
         city = None
         if resp.status_code == 200:
@@ -49,21 +48,14 @@ def update_shipment_location_by_gps(product_id, lat, lon, use_supabase=True):
             city = data.get("address", {}).get("city") or data.get("address", {}).get("town") or data.get("address", {}).get("village") or data.get("display_name")
         if not city:
             city = f"({lat:.2f},{lon:.2f})"
-        from supabase import create_client
-        import os
-        from dotenv import load_dotenv
-        load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-        SUPABASE_URL = os.getenv("SUPABASE_URL")
-        SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-        resp = supabase.table("shipment").update({"current_location": city}).eq("product_id", product_id).execute()
-        if not resp.data:
-            import logging
+        if not update_shipment(product_id, {"current_location": city}):
             logging.error(f"Failed to update shipment location in Supabase for {product_id}")
             return None
+        # Keeps the shared shipment index and the risk state current (GPS simulator, tracking routes)
+        from agents.risk_state import on_shipment_changed
+        on_shipment_changed({"product_id": product_id, "current_location": city})
         return city
     except Exception as e:
-        import logging
         logging.error(f"Failed to update shipment location by GPS: {e}")
         return None
 
@@ -96,17 +88,12 @@ def get_latest_location_from_provider(product_id, provider, provider_id=None, **
         logging.warning(f"Provider {provider} not supported.")
         return None, None
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-
 def load_inventory():
-    return supabase.table("shipment").select("*").execute().data
+    return get_all_shipments()
 
 def load_vendors():
     import pandas as pd
-    data = supabase.table("vendor").select("*").execute().data
-    return pd.DataFrame(data)
+    return pd.DataFrame(get_all_vendors())
 
 def get_api_keys():
     return {
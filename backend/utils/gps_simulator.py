@@ -1,53 +1,38 @@
 import json
 import os
 import time
+import heapq
+import asyncio
 import logging
 import sys
 from pathlib import Path
-from supabase import create_client
 from dotenv import load_dotenv
 
 # Add the parent directory to sys.path to ensure imports work correctly
 sys.path.append(str(Path(__file__).parent.parent))
 from utils.data_loader import update_shipment_location_by_gps
+from utils.route_geometry import haversine_km, interpolate, resolve_coords, shipment_waypoints
+from db import get_shipment, get_all_shipments
 
 # Load Supabase credentials
 load_dotenv(dotenv_path=os.path.join("backend", ".env"))
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 SIM_DELAY = 2  # seconds between updates
-
-CITY_COORDS = {
-    "Bangalore": (12.97, 77.59),
-    "Hubli": (15.36, 75.12),
-    "Pune": (18.52, 73.86),
-    "Mumbai": (19.07, 72.88),
-    "Chennai": (13.08, 80.27),
-    "Hyderabad": (17.38, 78.48),
-    "Nagpur": (21.15, 79.09),
-    "Delhi": (28.61, 77.21),
-    "Raipur": (21.25, 81.63),
-    "Kolkata": (22.57, 88.36),
-    "Shanghai": (31.23, 121.47),
-    "Hong Kong": (22.32, 114.17),
-    "Singapore": (1.35, 103.82),
-    "Beijing": (39.90, 116.40),
-    "Kunming": (25.04, 102.72)
-}
+SIM_SPEED_KMH = float(os.getenv("SIM_SPEED_KMH", 60))  # virtual vehicle speed
+SIM_TICK_SECONDS = float(os.getenv("SIM_TICK_SECONDS", 600))  # virtual seconds between position reports
+SIM_MAX_CONCURRENCY = int(os.getenv("SIM_MAX_CONCURRENCY", 32))  # parallel ingestion calls
 
 def simulate_shipment_gps(product_id: str, device_id: str | None = None):
     """Simulate GPS updates for a single shipment along its real route using Supabase."""
     try:
-        shipment = supabase.table("shipment").select("*").eq("product_id", product_id).single().execute().data
+        shipment = get_shipment(product_id)
         if not shipment or "route" not in shipment:
             logging.warning(f"Shipment {product_id} not found or has no route.")
             return
         route = shipment["route"]
         logging.info(f"Simulating GPS updates for {product_id} along route: {' → '.join(route)}")
         for city in route:
-            coords = CITY_COORDS.get(city)
+            coords = resolve_coords(city)
             if not coords:
                 logging.warning(f"No coordinates for {city}, skipping.")
                 continue
@@ -63,14 +48,141 @@ def simulate_shipment_gps(product_id: str, device_id: str | None = None):
     except Exception as e:
         logging.error(f"Error simulating GPS for {product_id}: {e}")
 
-def simulate_all_shipments():
-    """Simulate GPS updates for all shipments in Supabase."""
+class VirtualClock:
+    """
+    Discrete-event clock for simulations.
+
+    Coroutines started through run() sleep in virtual time. Once every one of them
+    is parked in sleep() the clock jumps straight to the earliest wake-up, so hours
+    of simulated driving finish as fast as ingestion allows.
+    """
+    def __init__(self, start=0.0):
+        self._now = start
+        self._waiters = []
+        self._seq = 0
+        self._active = 0
+
+    def now(self):
+        return self._now
+
+    async def sleep(self, seconds):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (self._now + seconds, self._seq, fut))
+        self._seq += 1
+        self._maybe_advance()
+        await fut
+
+    def _maybe_advance(self):
+        if self._waiters and len(self._waiters) >= self._active:
+            asyncio.get_running_loop().call_soon(self._advance)
+
+    def _advance(self):
+        # Re-check: another callback may already have advanced the clock
+        if not self._waiters or len(self._waiters) < self._active:
+            return
+        wake_at = self._waiters[0][0]
+        self._now = max(self._now, wake_at)
+        while self._waiters and self._waiters[0][0] <= wake_at:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+
+    async def run(self, coros):
+        async def tracked(coro):
+            try:
+                return await coro
+            finally:
+                self._active -= 1
+                self._maybe_advance()
+        coros = list(coros)
+        self._active += len(coros)
+        return await asyncio.gather(*(tracked(c) for c in coros), return_exceptions=True)
+
+class ScaledClock:
+    """Wall-clock driven simulation running time_scale times faster than real time."""
+    def __init__(self, time_scale):
+        self.time_scale = time_scale
+        self._t0 = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self._t0) * self.time_scale
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(max(0.0, seconds) / self.time_scale)
+
+    async def run(self, coros):
+        self._t0 = time.monotonic()
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+def _default_ingest(product_id, lat, lon):
+    return update_shipment_location_by_gps(product_id, lat, lon, use_supabase=True)
+
+async def _push_position(ingest, semaphore, stats, product_id, lat, lon):
+    async with semaphore:
+        try:
+            if asyncio.iscoroutinefunction(ingest):
+                await ingest(product_id, lat, lon)
+            else:
+                await asyncio.to_thread(ingest, product_id, lat, lon)
+            stats["updates"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            logging.error(f"Failed to push position for {product_id}: {e}")
+
+async def _drive_shipment(shipment, clock, ingest, semaphore, stats, speed_kmh, tick_seconds):
+    product_id = shipment["product_id"]
+    waypoints = shipment_waypoints(shipment)
+    if not waypoints:
+        logging.warning(f"Shipment {product_id} has no known waypoints, skipping.")
+        return
+    await _push_position(ingest, semaphore, stats, product_id, *waypoints[0])
+    for a, b in zip(waypoints, waypoints[1:]):
+        leg_seconds = haversine_km(a, b) / speed_kmh * 3600
+        elapsed = 0.0
+        while elapsed < leg_seconds:
+            step = min(tick_seconds, leg_seconds - elapsed)
+            await clock.sleep(step)
+            elapsed += step
+            lat, lon = interpolate(a, b, elapsed / leg_seconds)
+            await _push_position(ingest, semaphore, stats, product_id, lat, lon)
+
+async def simulate_fleet(shipments=None, speed_kmh=SIM_SPEED_KMH, tick_seconds=SIM_TICK_SECONDS,
+                         time_scale=None, max_concurrency=SIM_MAX_CONCURRENCY, ingest=None):
+    """
+    Drive many shipments concurrently along their routes (names resolved as in route_geometry).
+
+    Positions are interpolated between waypoints at speed_kmh and reported every
+    tick_seconds of simulated time through ingest(product_id, lat, lon), which
+    defaults to the normal update_shipment_location_by_gps path. With time_scale=None
+    a VirtualClock is used and the run completes as fast as ingestion allows;
+    otherwise simulated time runs time_scale times faster than wall-clock time.
+    """
+    if speed_kmh <= 0:
+        raise ValueError(f"speed_kmh must be positive, got {speed_kmh}")
+    if tick_seconds <= 0:
+        raise ValueError(f"tick_seconds must be positive, got {tick_seconds}")
+    if shipments is None:
+        shipments = get_all_shipments("product_id,route")
+    clock = VirtualClock() if time_scale is None else ScaledClock(time_scale)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    stats = {"shipments": len(shipments), "updates": 0, "errors": 0}
+    started = time.monotonic()
+    await clock.run(
+        _drive_shipment(item, clock, ingest or _default_ingest, semaphore, stats, speed_kmh, tick_seconds)
+        for item in shipments
+    )
+    stats["virtual_seconds"] = round(clock.now(), 1)
+    stats["wall_seconds"] = round(time.monotonic() - started, 3)
+    logging.info(f"Fleet simulation finished: {stats}")
+    return stats
+
+def simulate_all_shipments(**kwargs):
+    """Simulate GPS updates for all shipments in Supabase concurrently."""
     try:
-        shipments = supabase.table("shipment").select("*").execute().data
-        for item in shipments:
-            product_id = item["product_id"]
-            print(f"\n--- Simulating {product_id} ---")
-            simulate_shipment_gps(product_id)
+        return asyncio.run(simulate_fleet(**kwargs))
     except Exception as e:
         logging.error(f"Error simulating all shipments: {e}")
 
@@ -80,11 +192,16 @@ if __name__ == "__main__":
     parser.add_argument("--product_id", help="Product ID of the shipment to simulate")
     parser.add_argument("--device_id", help="Traccar device ID (optional)")
     parser.add_argument("--all", action="store_true", help="Simulate all shipments in Supabase")
+    parser.add_argument("--speed", type=float, default=SIM_SPEED_KMH, help="Vehicle speed in km/h (fleet mode)")
+    parser.add_argument("--tick", type=float, default=SIM_TICK_SECONDS, help="Simulated seconds between position reports (fleet mode)")
+    parser.add_argument("--time-scale", type=float, default=None, help="Run N times faster than real time instead of on a virtual clock (fleet mode)")
+    parser.add_argument("--concurrency", type=int, default=SIM_MAX_CONCURRENCY, help="Max parallel ingestion calls (fleet mode)")
     args = parser.parse_args()
     # Configure logging
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     if args.all:
-        simulate_all_shipments()
+        simulate_all_shipments(speed_kmh=args.speed, tick_seconds=args.tick,
+                               time_scale=args.time_scale, max_concurrency=args.concurrency)
     elif args.product_id:
         simulate_shipment_gps(args.product_id, args.device_id)
     else:
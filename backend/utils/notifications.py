@@ -1,62 +1,315 @@
 import os
+import time
+import queue
+import atexit
+import logging
 import smtplib
+import threading
 from email.mime.text import MIMEText
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
-from twilio.rest import Client as TwilioClient
 from audit import log_audit
+from ratelimit import MemoryBucketStore, parse_limits
+
+SMTP_SERVER = os.getenv("SMTP_SERVER")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")  # false for local test servers
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", 60))  # close the SMTP session after this long unused
+FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER)
+SLACK_TOKEN = os.getenv("SLACK_TOKEN")
+SLACK_API_URL = os.getenv("SLACK_API_URL")  # point at a local stand-in in tests; slack_sdk default otherwise
+TWILIO_SID = os.getenv("TWILIO_SID")
+TWILIO_TOKEN = os.getenv("TWILIO_TOKEN")
+TWILIO_FROM = os.getenv("TWILIO_FROM")
+SMS_MAX_CHARS = 1600
+
+# Messages to the same recipient on the same channel within this window go out as one digest
+NOTIFY_DIGEST_SECONDS = float(os.getenv("NOTIFY_DIGEST_SECONDS", 30))
+NOTIFY_RATE_LIMITS = os.getenv("NOTIFY_RATE_LIMITS", "email=30/minute,slack=60/minute,sms=10/minute")
+NOTIFY_QUEUE_MAX = int(os.getenv("NOTIFY_QUEUE_MAX", 1000))
+
+logger = logging.getLogger(__name__)
+
+# Audit actions recorded when a delivery fails
+FAILURE_ACTIONS = {"email": "email_notification_failed", "slack": "slack_notification_failed", "sms": "twilio_notification_failed"}
+
+class EmailSender:
+    """Sends over one persistent SMTP session, reconnecting when the server drops it."""
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASS, from_email=FROM_EMAIL,
+                 starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT, idle_seconds=SMTP_IDLE_SECONDS, smtp_factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.from_email = from_email or user
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.smtp_factory = smtp_factory
+        self.sender_id = self.from_email
+        self._conn = None
+        self._last_used = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.host)
+
+    def _connect(self):
+        conn = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        return conn
+
+    def send(self, to, subject, body):
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        msg["From"] = self.from_email
+        msg["To"] = to
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.sendmail(self.from_email, [to], msg.as_string())
+                self._last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                # Session went stale between sends; reconnect once before giving up. Other SMTP
+                # errors (refused recipients, bad data) subclass OSError too but would only fail again
+                self.close()
+                if attempt:
+                    raise
+
+    def close_idle(self):
+        if self._conn is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.quit()
+            except Exception:
+                pass
+
+class SlackSender:
+    """Posts with a single WebClient built on first use."""
+    def __init__(self, token=SLACK_TOKEN, base_url=SLACK_API_URL, client=None):
+        self.token = token
+        self.base_url = base_url
+        self.sender_id = "system"
+        self._client = client
+
+    @property
+    def enabled(self):
+        return bool(self.token) or self._client is not None
+
+    def _get_client(self):
+        if self._client is None:
+            from slack_sdk import WebClient
+            self._client = WebClient(token=self.token, **({"base_url": self.base_url} if self.base_url else {}))
+        return self._client
+
+    def send(self, to, subject, body):
+        self._get_client().chat_postMessage(channel=to, text=f"{subject}\n{body}")
+
+    def close_idle(self):
+        pass
+
+    def close(self):
+        pass
+
+class SmsSender:
+    """Sends SMS through one Twilio client built on first use."""
+    def __init__(self, sid=TWILIO_SID, token=TWILIO_TOKEN, from_number=TWILIO_FROM, client=None):
+        self.sid = sid
+        self.token = token
+        self.from_number = from_number
+        self.sender_id = from_number
+        self._client = client
+
+    @property
+    def enabled(self):
+        return bool(self.from_number and (self._client is not None or (self.sid and self.token)))
+
+    def _get_client(self):
+        if self._client is None:
+            from twilio.rest import Client as TwilioClient
+            self._client = TwilioClient(self.sid, self.token)
+        return self._client
+
+    def send(self, to, subject, body):
+        self._get_client().messages.create(body=body[:SMS_MAX_CHARS], from_=self.from_number, to=to)
+
+    def close_idle(self):
+        pass
+
+    def close(self):
+        pass
+
+def digest(messages):
+    """Collapse queued (subject, body) pairs for one recipient into a single message."""
+    if len(messages) == 1:
+        return messages[0]
+    subjects = list(dict.fromkeys(subject for subject, _ in messages))
+    subject = f"{len(messages)} notifications: " + "; ".join(subjects)
+    if len(subject) > 150:
+        subject = subject[:147] + "..."
+    body = "\n\n---\n\n".join(f"{s}\n{b}" if s else b for s, b in messages)
+    return subject, body
+
+class NotificationDispatcher:
+    """
+    Background notification delivery.
+
+    notify() only enqueues. A daemon thread groups messages per (channel, recipient)
+    into digests over `digest_seconds`, spends one token from the channel's bucket per
+    delivery (a rate-limited digest simply waits and keeps collecting), and sends through
+    long-lived senders. Failed deliveries are written to the audit log, as before.
+    """
+    def __init__(self, senders=None, rate_limits=NOTIFY_RATE_LIMITS, digest_seconds=NOTIFY_DIGEST_SECONDS,
+                 max_queue=NOTIFY_QUEUE_MAX):
+        self.senders = senders if senders is not None else {"email": EmailSender(), "slack": SlackSender(), "sms": SmsSender()}
+        self.rates = parse_limits(rate_limits) if isinstance(rate_limits, str) else dict(rate_limits or {})
+        self.digest_seconds = digest_seconds
+        self._buckets = MemoryBucketStore()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}  # (channel, to) -> {"messages": [(subject, body)], "due": monotonic time}
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {"queued": 0, "dropped": 0, "sent": 0, "digests": 0, "failed": 0, "deferred": 0}
+        self._stats_lock = threading.Lock()  # notify() runs on request threads, deliveries on the dispatcher thread
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Deliver everything queued or waiting in a digest, then close senders."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self, channel, to, subject, body):
+        """Queue a message; returns False if the channel is not configured or the queue is full."""
+        sender = self.senders.get(channel)
+        if sender is None or not sender.enabled or not to:
+            logger.debug(f"Skipping {channel} notification: channel not configured or no recipient")
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((channel, to, subject, body))
+        except queue.Full:
+            self._count("dropped")
+            logger.warning(f"Notification queue full, dropping {channel} message to {to}")
+            return False
+        self._count("queued")
+        return True
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def pending(self):
+        return self._queue.qsize() + sum(len(p["messages"]) for p in list(self._pending.values()))
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {**stats, "pending": self.pending()}
+
+    def _run(self):
+        try:
+            while True:
+                stopping = self._stop.is_set()
+                self._collect(self._wait_time(stopping))
+                self._flush(force=stopping)
+                for sender in self.senders.values():
+                    sender.close_idle()
+                if stopping and self._queue.empty() and not self._pending:
+                    return
+        finally:
+            for sender in self.senders.values():
+                sender.close()
+
+    def _wait_time(self, stopping):
+        if stopping:
+            return 0
+        due = min((p["due"] for p in self._pending.values()), default=None)
+        return 1.0 if due is None else min(1.0, max(0.0, due - time.monotonic()))
+
+    def _collect(self, timeout):
+        try:
+            item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            return
+        while item is not None:
+            channel, to, subject, body = item
+            entry = self._pending.setdefault((channel, to), {"messages": [], "due": time.monotonic() + self.digest_seconds})
+            entry["messages"].append((subject, body))
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                item = None
+
+    def _flush(self, force=False):
+        now = time.monotonic()
+        for key, entry in list(self._pending.items()):
+            if not force and entry["due"] > now:
+                continue
+            channel, to = key
+            rate = self.rates.get(channel)
+            if rate is not None and not force:
+                granted, retry_after = self._buckets.take(channel, 1, rate, time.time())
+                if not granted:
+                    self._count("deferred")
+                    entry["due"] = now + retry_after
+                    continue
+            del self._pending[key]
+            self._deliver(channel, to, entry["messages"])
+
+    def _deliver(self, channel, to, messages):
+        sender = self.senders[channel]
+        subject, body = digest(messages)
+        try:
+            sender.send(to, subject, body)
+            self._count("sent")
+            if len(messages) > 1:
+                self._count("digests")
+        except Exception as e:
+            self._count("failed")
+            logger.error(f"{channel} notification to {to} failed: {e}")
+            log_audit(FAILURE_ACTIONS.get(channel, f"{channel}_notification_failed"), sender.sender_id or "system",
+                      target=to, details=str(e))
+
+notification_dispatcher = NotificationDispatcher()
+atexit.register(notification_dispatcher.stop)
 
 # --- Email Notification ---
 def send_email_notification(subject, body, to_email):
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = int(os.getenv("SMTP_PORT", 587))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-    from_email = os.getenv("FROM_EMAIL", smtp_user)
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = from_email
-    msg["To"] = to_email
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
-            server.sendmail(from_email, [to_email], msg.as_string())
-    except Exception as e:
-        log_audit("email_notification_failed", from_email, target=to_email, details=str(e))
+    return notification_dispatcher.notify("email", to_email, subject, body)
 
 # --- Slack Notification ---
 def send_slack_notification(subject, body, channel):
-    slack_token = os.getenv("SLACK_TOKEN")
-    if not slack_token or not channel:
-        return
-    client = WebClient(token=slack_token)
-    try:
-        client.chat_postMessage(channel=channel, text=f"{subject}\n{body}")
-    except SlackApiError as e:
-        log_audit("slack_notification_failed", "system", target=channel, details=str(e))
+    return notification_dispatcher.notify("slack", channel, subject, body)
 
 # --- SMS Notification (Twilio) ---
 def send_twilio_notification(body, to_number):
-    twilio_sid = os.getenv("TWILIO_SID")
-    twilio_token = os.getenv("TWILIO_TOKEN")
-    from_number = os.getenv("TWILIO_FROM")
-    if not twilio_sid or not twilio_token or not from_number:
-        print("Twilio credentials not set.")
-        return
-    client = TwilioClient(twilio_sid, twilio_token)
-    try:
-        client.messages.create(body=body, from_=from_number, to=to_number)
-        print(f"SMS sent to {to_number}")
-    except Exception as e:
-        log_audit("twilio_notification_failed", from_number, target=to_number, details=str(e))
-        print(f"SMS notification failed: {e}")
+    return notification_dispatcher.notify("sms", to_number, "", body)
 
 # --- Unified Notification Router ---
-def send_notification(subject, body, channels=["email", "slack"], to_email=None, slack_channel=None, to_number=None):
+def send_notification(subject, body, channels=("email", "slack"), to_email=None, slack_channel=None, to_number=None):
+    """Queue a message on each requested channel; delivery happens on the dispatcher thread."""
     if "email" in channels and to_email:
         send_email_notification(subject, body, to_email)
     if "slack" in channels:
         send_slack_notification(subject, body, slack_channel)
     if "sms" in channels and to_number:
-        send_twilio_notification(body, to_number) 
\ No newline at end of file
+        send_twilio_notification(body, to_number)
@@ -0,0 +1,230 @@
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+CITY_COORDS = {
+    "Bangalore": (12.97, 77.59),
+    "Hubli": (15.36, 75.12),
+    "Pune": (18.52, 73.86),
+    "Mumbai": (19.07, 72.88),
+    "Chennai": (13.08, 80.27),
+    "Hyderabad": (17.38, 78.48),
+    "Nagpur": (21.15, 79.09),
+    "Delhi": (28.61, 77.21),
+    "Raipur": (21.25, 81.63),
+    "Kolkata": (22.57, 88.36),
+    "Shanghai": (31.23, 121.47),
+    "Hong Kong": (22.32, 114.17),
+    "Singapore": (1.35, 103.82),
+    "Beijing": (39.90, 116.40),
+    "Kunming": (25.04, 102.72)
+}
+
+_CITY_COORDS_LOWER = {name.lower(): coords for name, coords in CITY_COORDS.items()}
+
+def haversine_km(a, b):
+    """Great-circle distance in km between two (lat, lon) pairs."""
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+def interpolate(a, b, fraction):
+    """Linear (lat, lon) interpolation between two waypoints; fraction in [0, 1]."""
+    return (a[0] + (b[0] - a[0]) * fraction, a[1] + (b[1] - a[1]) * fraction)
+
+def resolve_coords(name):
+    """Resolve a location name such as "Chennai" or "Port of Chennai" to (lat, lon), or None."""
+    if not name:
+        return None
+    key = str(name).strip().lower()
+    if key in _CITY_COORDS_LOWER:
+        return _CITY_COORDS_LOWER[key]
+    for city, coords in _CITY_COORDS_LOWER.items():
+        if city in key:
+            return coords
+    return None
+
+def disruption_coords(disruption):
+    """Coordinates of a disruption: explicit lat/lon fields win over the location name."""
+    lat = disruption.get("lat", disruption.get("latitude"))
+    lon = disruption.get("lon", disruption.get("longitude"))
+    if lat is not None and lon is not None:
+        return float(lat), float(lon)
+    return resolve_coords(disruption.get("location"))
+
+def shipment_waypoints(shipment):
+    """Ordered, de-duplicated waypoint coordinates of a shipment (route, else legs, else current location)."""
+    names = []
+    if isinstance(shipment.get("route"), list) and shipment["route"]:
+        names = list(shipment["route"])
+    elif isinstance(shipment.get("legs"), list):
+        for leg in shipment["legs"]:
+            if isinstance(leg, dict):
+                names.extend([leg.get("origin"), leg.get("destination")])
+    if not names and shipment.get("current_location"):
+        names = [shipment["current_location"]]
+    waypoints = []
+    for name in names:
+        coords = resolve_coords(name)
+        if coords and (not waypoints or waypoints[-1] != coords):
+            waypoints.append(coords)
+    return waypoints
+
+def build_route_geometry(shipment):
+    """List of ((lat, lon), (lat, lon)) leg segments; a single-stop route yields one degenerate segment."""
+    waypoints = shipment_waypoints(shipment)
+    if len(waypoints) == 1:
+        return [(waypoints[0], waypoints[0])]
+    return list(zip(waypoints, waypoints[1:]))
+
+def point_segment_distance_km(point, a, b):
+    """Approximate distance from point to segment a-b using a local equirectangular projection."""
+    kx = KM_PER_DEG_LAT * math.cos(math.radians(point[0]))
+    ax, ay = (a[1] - point[1]) * kx, (a[0] - point[0]) * KM_PER_DEG_LAT
+    bx, by = (b[1] - point[1]) * kx, (b[0] - point[0]) * KM_PER_DEG_LAT
+    dx, dy = bx - ax, by - ay
+    seg_len2 = dx * dx + dy * dy
+    t = 0.0 if seg_len2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / seg_len2))
+    return math.hypot(ax + t * dx, ay + t * dy)
+
+class RouteIndex:
+    """
+    Uniform-grid spatial index over shipment route segments.
+
+    Each segment is registered in every grid cell its bounding box touches, so a
+    radius query only inspects segments in the handful of cells around the point
+    instead of scanning the whole inventory.
+    """
+    def __init__(self, cell_deg=1.0):
+        self.cell_deg = cell_deg
+        self._cells = defaultdict(set)
+        self._segments = {}  # product_id -> list of segments
+        self._cells_by_product = {}
+
+    @classmethod
+    def from_shipments(cls, shipments, cell_deg=1.0):
+        index = cls(cell_deg)
+        for shipment in shipments:
+            index.add_shipment(shipment)
+        return index
+
+    def __len__(self):
+        return len(self._segments)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def _cells_for_box(self, min_lat, min_lon, max_lat, max_lon):
+        lo_i, lo_j = self._cell(min_lat, min_lon)
+        hi_i, hi_j = self._cell(max_lat, max_lon)
+        return [(i, j) for i in range(lo_i, hi_i + 1) for j in range(lo_j, hi_j + 1)]
+
+    def add_shipment(self, shipment):
+        product_id = shipment.get("product_id")
+        if product_id is None:
+            return
+        self.remove_shipment(product_id)
+        segments = build_route_geometry(shipment)
+        if not segments:
+            return
+        cells = set()
+        for seg_id, (a, b) in enumerate(segments):
+            for cell in self._cells_for_box(min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])):
+                self._cells[cell].add((product_id, seg_id))
+                cells.add(cell)
+        self._segments[product_id] = segments
+        self._cells_by_product[product_id] = cells
+
+    def remove_shipment(self, product_id):
+        for cell in self._cells_by_product.pop(product_id, ()):
+            bucket = self._cells[cell]
+            bucket.difference_update({entry for entry in bucket if entry[0] == product_id})
+            if not bucket:
+                del self._cells[cell]
+        self._segments.pop(product_id, None)
+
+    def query(self, lat, lon, radius_km):
+        """Return {product_id: distance_km} for shipments whose route passes within radius_km of (lat, lon)."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / max(1e-6, KM_PER_DEG_LAT * math.cos(math.radians(lat)))
+        candidates = set()
+        for cell in self._cells_for_box(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            candidates.update(self._cells.get(cell, ()))
+        hits = {}
+        for product_id, seg_id in candidates:
+            a, b = self._segments[product_id][seg_id]
+            dist = point_segment_distance_km((lat, lon), a, b)
+            if dist <= radius_km and dist < hits.get(product_id, float("inf")):
+                hits[product_id] = dist
+        return hits
+
+    def query_disruption(self, disruption, radius_km):
+        """Shipments near a disruption's coordinates; empty if the location cannot be resolved."""
+        coords = disruption_coords(disruption)
+        if coords is None:
+            return {}
+        return self.query(coords[0], coords[1], radius_km)
+
+def shipment_location_names(shipment):
+    """Lower-cased location names a shipment touches: route stops, current location and leg endpoints."""
+    names = set()
+    if isinstance(shipment.get("route"), list):
+        names.update(str(loc).lower() for loc in shipment["route"] if loc)
+    if shipment.get("current_location"):
+        names.add(str(shipment["current_location"]).lower())
+    if isinstance(shipment.get("legs"), list):
+        for leg in shipment["legs"]:
+            if isinstance(leg, dict):
+                names.update(str(leg[k]).lower() for k in ("origin", "destination", "current_location") if leg.get(k))
+    return names
+
+def location_matches(location, shipment):
+    """True if the location and one of the shipment's location names contain one another."""
+    event_loc = str(location or "").lower()
+    return any(event_loc in name or name in event_loc for name in shipment_location_names(shipment))
+
+class LocationNameIndex:
+    """
+    Inverted index from location names to shipments.
+
+    A lookup compares the event location against each distinct name once (substring in
+    either direction, like the original per-shipment check), so its cost grows with the
+    number of distinct places rather than the number of shipments.
+    """
+    def __init__(self):
+        self._by_name = defaultdict(set)
+        self._names_by_product = {}
+
+    @classmethod
+    def from_shipments(cls, shipments):
+        index = cls()
+        for shipment in shipments:
+            index.add_shipment(shipment)
+        return index
+
+    def add_shipment(self, shipment):
+        product_id = shipment.get("product_id")
+        if product_id is None:
+            return
+        self.remove_shipment(product_id)
+        names = shipment_location_names(shipment)
+        for name in names:
+            self._by_name[name].add(product_id)
+        self._names_by_product[product_id] = names
+
+    def remove_shipment(self, product_id):
+        for name in self._names_by_product.pop(product_id, ()):
+            self._by_name[name].discard(product_id)
+            if not self._by_name[name]:
+                del self._by_name[name]
+
+    def query(self, location):
+        event_loc = str(location or "").lower()
+        hits = set()
+        for name, products in self._by_name.items():
+            if event_loc in name or name in event_loc:
+                hits |= products
+        return hits
@@ -0,0 +1,127 @@
+import os
+import re
+from datetime import datetime, timezone
+import numpy as np
+
+# Buckets chosen by bucket="auto" keep a chart at or under this many points per series
+ANALYTICS_MAX_POINTS = int(os.getenv("ANALYTICS_MAX_POINTS", 500))
+
+BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+AGGREGATES = ("avg", "min", "max", "p95", "sum", "count")
+
+_COLUMN_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def parse_columns(spec):
+    """'a, b' -> ['a', 'b']; raises ValueError on anything that is not a plain column name."""
+    columns = [c.strip() for c in (spec or "").split(",") if c.strip()]
+    for column in columns:
+        if not _COLUMN_RE.match(column):
+            raise ValueError(f"Invalid column name: {column!r}")
+    return columns
+
+def to_epoch(value):
+    """ISO-8601 string (naive means UTC), datetime or number -> epoch seconds; None if unparseable."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def pick_bucket(bucket, start=None, end=None, epochs=None, max_points=ANALYTICS_MAX_POINTS):
+    """Resolve bucket="auto" to the finest bucket that keeps the range under max_points."""
+    if bucket != "auto":
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKET_SECONDS)} or auto")
+        return bucket
+    lo, hi = to_epoch(start), to_epoch(end)
+    if epochs is not None and len(epochs):
+        lo = float(np.nanmin(epochs)) if lo is None else lo
+        hi = float(np.nanmax(epochs)) if hi is None else hi
+    span = (hi - lo) if lo is not None and hi is not None else 0
+    for name, width in BUCKET_SECONDS.items():
+        if span / width <= max_points:
+            return name
+    return "week"
+
+def downsample(rows, fields, bucket="auto", agg="avg", group_by=None, ts_field="timestamp", start=None, end=None,
+               max_points=ANALYTICS_MAX_POINTS):
+    """
+    Aggregate rows into time buckets: one output row per (bucket, group_by value) with
+    agg applied to each field, plus the number of source rows. Bucketing, grouping and
+    avg/min/max/sum/count run as NumPy reductions over rows sorted by group; p95 runs a
+    percentile per group. Missing or non-numeric values are ignored. Newest bucket first.
+    Returns (bucket name, rows).
+    """
+    if agg not in AGGREGATES:
+        raise ValueError(f"agg must be one of {', '.join(AGGREGATES)}")
+    epochs = np.array([to_epoch(r.get(ts_field)) for r in rows], dtype=np.float64)
+    keep = ~np.isnan(epochs)
+    bucket = pick_bucket(bucket, start, end, epochs[keep], max_points)
+    if not keep.any():
+        return bucket, []
+    width = BUCKET_SECONDS[bucket]
+    rows = [r for r, k in zip(rows, keep) if k]
+    slots = (epochs[keep] // width).astype(np.int64)
+
+    if group_by:
+        index = {}
+        codes = np.fromiter((index.setdefault(r.get(group_by), len(index)) for r in rows), dtype=np.int64, count=len(rows))
+        labels = list(index)
+    else:
+        codes, labels = np.zeros(len(rows), dtype=np.int64), [None]
+    key = (slots - slots.min()) * len(labels) + codes
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    counts = np.diff(np.r_[starts, len(key)])
+
+    results = {}
+    for field in fields:
+        values = np.array([_number(r.get(field)) for r in rows], dtype=np.float64)[order]
+        valid = ~np.isnan(values)
+        n_valid = np.add.reduceat(valid.astype(np.int64), starts)
+        if agg == "count":
+            out = n_valid.astype(np.float64)
+        elif agg in ("avg", "sum"):
+            total = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            out = total if agg == "sum" else np.divide(total, n_valid, out=np.full(len(starts), np.nan), where=n_valid > 0)
+        elif agg == "min":
+            out = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+        elif agg == "max":
+            out = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+        else:  # p95
+            ends = np.r_[starts[1:], len(values)]
+            out = np.array([np.percentile(values[s:e][valid[s:e]], 95) if n else np.nan
+                            for s, e, n in zip(starts, ends, n_valid)])
+        out = np.where(n_valid > 0, out, np.nan)
+        results[field] = [None if np.isnan(v) else float(v) for v in out]
+
+    first_slot = slots.min()
+    group_codes = key[starts] % len(labels)
+    bucket_starts = (key[starts] // len(labels) + first_slot) * width
+    points = []
+    for i in range(len(starts)):
+        point = {ts_field: datetime.fromtimestamp(int(bucket_starts[i]), tz=timezone.utc).isoformat()}
+        if group_by:
+            point[group_by] = labels[group_codes[i]]
+        for field in fields:
+            point[field] = results[field][i]
+        point["count"] = int(counts[i])
+        points.append(point)
+    points.reverse()
+    return bucket, points
+
+def _number(value):
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,141 @@
+"""
+Agent worker tier.
+
+Run the API with PROCESS_MODE=api (it then only enqueues agent work and serves results)
+and one or more workers alongside it, on the same host, sharing JOB_QUEUE_PATH:
+
+    PROCESS_MODE=api uvicorn app:app --workers 4
+    python worker.py --processes 3
+
+Each worker process claims jobs from the SQLite queue and runs their handlers; the
+parent process supervises them, re-queues jobs of dead workers and runs the disruption
+scheduler (leader-elected, so several worker hosts never duplicate it).
+"""
+import os
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", max(1, (os.cpu_count() or 2) - 1)))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))  # seconds an idle worker waits between claims
+WORKER_RUN_SCHEDULER = os.getenv("WORKER_RUN_SCHEDULER", "true").lower() in ("1", "true", "yes")
+SUPERVISE_INTERVAL = 30.0
+
+def work(stop, poll_interval=JOB_POLL_INTERVAL):
+    """Claim and run jobs until `stop` is set."""
+    from logging_config import setup_logging
+    from db import init_db
+    from jobs import job_queue, run_job, JOB_HEARTBEAT_SECONDS
+    from audit import audit_sink
+    from utils.notifications import notification_dispatcher
+    import agents.pipeline  # noqa: F401  registers the job handlers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides when to stop
+    setup_logging()
+    init_db()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logging.info(f"Worker {worker_id} started")
+    try:
+        while not stop.is_set():
+            job = job_queue.claim(worker_id)
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            started = time.perf_counter()
+            done = threading.Event()
+            # Heartbeats let the supervisor tell a slow job from a dead worker
+            beat = threading.Thread(target=_heartbeat, args=(job_queue, job["id"], worker_id, done, JOB_HEARTBEAT_SECONDS),
+                                    daemon=True)
+            beat.start()
+            try:
+                ok, result = run_job(job)
+            finally:
+                done.set()
+                beat.join()
+            if ok:
+                job_queue.complete(job["id"], result)
+            else:
+                job_queue.fail(job["id"], result)
+            logging.info(f"Job {job['id']} ({job['kind']}) {'done' if ok else 'failed'} in {time.perf_counter() - started:.1f}s")
+    finally:
+        # multiprocessing children skip atexit; flush queued audit entries and notifications explicitly
+        audit_sink.stop()
+        notification_dispatcher.stop()
+
+def _heartbeat(queue, job_id, worker_id, done, interval):
+    while not done.wait(interval):
+        try:
+            if not queue.heartbeat(job_id, worker_id):
+                logging.warning(f"Job {job_id} is no longer assigned to {worker_id}")
+                return
+        except Exception as e:
+            logging.warning(f"Heartbeat for job {job_id} failed: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agent worker processes fed by the job queue.")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--no-scheduler", action="store_true", help="do not run the periodic disruption check here")
+    args = parser.parse_args()
+
+    from logging_config import setup_logging
+    from jobs import job_queue
+    setup_logging()
+    # "spawn", not fork: restarted workers must not inherit this process's scheduler thread,
+    # DB client connection pool or the scheduler's leader-lock file descriptor
+    mp = multiprocessing.get_context("spawn")
+    stop = mp.Event()
+
+    def spawn(i):
+        p = mp.Process(target=work, args=(stop,), name=f"agent-worker-{i}", daemon=False)
+        p.start()
+        return p
+
+    workers = [spawn(i) for i in range(max(1, args.processes))]
+    scheduler = None
+    if WORKER_RUN_SCHEDULER and not args.no_scheduler:
+        from scheduler import start_scheduler
+        scheduler = start_scheduler()
+
+    stopping = []
+    def shutdown(signum, frame):
+        # Only record the signal: stop.set() here could deadlock with a stop.wait() it interrupted
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print(f"[WORKER] {len(workers)} worker processes started (queue: {job_queue.path}).")
+
+    last_prune = 0.0
+    last_check = time.monotonic()
+    while not stopping:
+        time.sleep(1)
+        if time.monotonic() - last_check < SUPERVISE_INTERVAL:
+            continue
+        last_check = time.monotonic()
+        for i, p in enumerate(workers):
+            if not p.is_alive():
+                logging.warning(f"{p.name} exited with code {p.exitcode}; restarting")
+                workers[i] = spawn(i)
+        requeued = job_queue.requeue_stale()
+        if requeued:
+            logging.warning(f"Re-queued {requeued} jobs from unresponsive workers")
+        if time.monotonic() - last_prune > 3600:
+            last_prune = time.monotonic()
+            job_queue.prune()
+
+    stop.set()
+    print("[WORKER] Stopping...")
+    if scheduler is not None:
+        from scheduler import stop_scheduler
+        stop_scheduler(scheduler)
+    for p in workers:
+        p.join(timeout=60)
+    from audit import audit_sink
+    from utils.notifications import notification_dispatcher
+    notification_dispatcher.stop()
+    audit_sink.stop()
+
+if __name__ == "__main__":
+    main()